@@ -0,0 +1 @@
+"""Benchmarks for measuring the overhead of rotest-progress."""
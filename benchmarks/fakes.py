@@ -0,0 +1,151 @@
+"""Fake test trees and resource managers for the benchmarks."""
+from __future__ import absolute_import
+
+import math
+import time
+import random
+import logging
+import threading
+from itertools import count
+
+
+class FakeResourceManager(object):
+    """Local stand-in for rotest's resource manager client.
+
+    Attributes:
+        latency (number): seconds to block on every request.
+        average (number): duration to report for tests without statistics.
+        statistics (dict): durations to report for specific test names.
+        requests (number): amount of requests that were made.
+    """
+    def __init__(self, latency=0.01, average=1.5, statistics=None):
+        self.latency = latency
+        self.average = average
+        self.statistics = statistics or {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        """Simulate a blocking round trip to the server."""
+        with self._lock:
+            self.requests += 1
+
+        time.sleep(self.latency)
+
+    def get_statistics(self, test_name):
+        """Return the statistics of a single test."""
+        self._request()
+        return {'avg': self.statistics.get(test_name, self.average)}
+
+
+class FakeBulkResourceManager(FakeResourceManager):
+    """Fake resource manager whose server supports bulk requests."""
+    def get_bulk_statistics(self, test_names):
+        """Return the statistics of many tests in one request."""
+        self._request()
+        return {name: {'avg': self.statistics.get(name, self.average)}
+                for name in test_names}
+
+
+class FakeData(object):
+    """Minimal stand-in for rotest's test data model."""
+    def __init__(self, name):
+        self.name = name
+        self.success = None
+
+
+class FakeTest(object):
+    """Minimal stand-in for a rotest test case."""
+    IS_COMPLEX = False
+    INDEXER = count()
+
+    def __init__(self, name, resource_manager, parent=None):
+        self.data = FakeData(name)
+        self.resource_manager = resource_manager
+        self.parent = parent
+        self.identifier = next(self.INDEXER)
+        self.parents_count = 0 if parent is None else \
+            parent.parents_count + 1
+
+        self.logger = logging.getLogger(__name__)
+
+
+class FakeSuite(FakeTest):
+    """Minimal stand-in for a rotest test suite."""
+    IS_COMPLEX = True
+
+    def __init__(self, *args, **kwargs):
+        super(FakeSuite, self).__init__(*args, **kwargs)
+        self.components = []
+
+    def __iter__(self):
+        return iter(self.components)
+
+
+def build_tree(resource_manager, leaves, width, parent=None, prefix="Suite"):
+    """Build a balanced suite tree with the given amount of leaves.
+
+    Args:
+        resource_manager (FakeResourceManager): manager to give the tests.
+        leaves (number): amount of test cases in the tree.
+        width (number): maximal amount of components in each suite.
+
+    Returns:
+        FakeSuite: the root of the tree.
+    """
+    suite = FakeSuite(prefix, resource_manager, parent)
+    if leaves <= width:
+        suite.components = [FakeTest("{}.Case{}".format(prefix, index),
+                                     resource_manager, suite)
+                            for index in range(leaves)]
+
+    else:
+        chunk = -(-leaves // width)
+        for index, start in enumerate(range(0, leaves, chunk)):
+            suite.components.append(
+                build_tree(resource_manager, min(chunk, leaves - start),
+                           width, suite, "{}.Sub{}".format(prefix, index)))
+
+    return suite
+
+
+def get_width(leaves, depth):
+    """Return the suite width that spreads the leaves over the given depth."""
+    return max(int(math.ceil(leaves ** (1.0 / depth))), 2)
+
+
+def iterate_leaves(test):
+    """Iterate over the leaves of the tree in running order."""
+    tests = [test]
+    while tests:
+        test = tests.pop()
+        if test.IS_COMPLEX:
+            tests.extend(reversed(test.components))
+
+        else:
+            yield test
+
+
+DISTRIBUTIONS = {
+    "constant": lambda generator, mean: mean,
+    "uniform": lambda generator, mean: generator.uniform(0, 2 * mean),
+    "exponential": lambda generator, mean: generator.expovariate(1.0 / mean),
+}
+
+
+def generate_statistics(tree, distribution, mean, seed=0):
+    """Draw an average duration for every leaf of the tree.
+
+    Args:
+        tree (FakeSuite): tree to generate the statistics for.
+        distribution (str): name of the distribution in DISTRIBUTIONS.
+        mean (number): mean duration in seconds.
+        seed (number): seed of the random generator, for reproducible runs.
+
+    Returns:
+        dict: map of the leaves' names to their average duration.
+    """
+    generator = random.Random(seed)
+    draw = DISTRIBUTIONS[distribution]
+    return {leaf.data.name: draw(generator, mean)
+            for leaf in iterate_leaves(tree)}
@@ -0,0 +1,253 @@
+"""Benchmark the overhead of the progress handlers on synthetic test trees.
+
+Every handler is measured in a subprocess of its own, so their peak memory
+usage doesn't mix, and the results are printed as JSON to be compared
+between versions.
+
+Run with ``python -m benchmarks.handlers``.
+The Tk handler needs a display, use ``xvfb-run -a`` on headless machines.
+"""
+# pylint: disable=too-many-locals
+from __future__ import absolute_import, print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+
+from rotest_progress.cache import StatisticsCache
+from rotest_progress.history import DurationHistory
+from rotest_progress.utils import StatisticManager
+from rotest_progress.backends import ResourceManagerBackend
+from rotest_progress import (CurrentProgressHandler, FullProgressHandler,
+                             TkinterProgressHandler)
+
+from .fakes import (FakeBulkResourceManager, DISTRIBUTIONS, build_tree,
+                    generate_statistics, get_width)
+
+
+HANDLERS = {handler_class.NAME: handler_class
+            for handler_class in (CurrentProgressHandler,
+                                  FullProgressHandler,
+                                  TkinterProgressHandler)}
+
+NEEDS_DISPLAY = (TkinterProgressHandler.NAME,)
+
+clock = getattr(time, "perf_counter", time.time)
+thread_clock = getattr(time, "thread_time", lambda: None)
+
+
+class CountingStream(object):
+    """Terminal stand-in that only counts the bytes written to it.
+
+    Attributes:
+        written (number): amount of bytes written to the stream.
+    """
+    encoding = "utf-8"
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, string):
+        """Count the bytes of the string."""
+        self.written += len(string.encode(self.encoding))
+
+    def flush(self):
+        """Nothing to flush."""
+        pass
+
+    @staticmethod
+    def isatty():
+        """Draw as if the stream was a terminal."""
+        return True
+
+
+def summarize(latencies):
+    """Return the mean, median, 99th percentile and maximum in microseconds.
+    """
+    if not latencies:
+        return {}
+
+    latencies = sorted(latencies)
+    last = len(latencies) - 1
+    return {
+        "mean_us": sum(latencies) / len(latencies) * 1e6,
+        "p50_us": latencies[last // 2] * 1e6,
+        "p99_us": latencies[int(last * 0.99)] * 1e6,
+        "max_us": latencies[-1] * 1e6,
+    }
+
+
+def get_process_cpu():
+    """Return the CPU seconds the process has used so far."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_tree(handler, test, time_scale, latencies):
+    """Feed the handler with the events of running the tree.
+
+    Args:
+        handler (AbstractResultHandler): handler to benchmark.
+        test (FakeTest): the test to run.
+        time_scale (number): part of each test's expected duration to
+            actually sleep, 0 to only measure the handler.
+        latencies (dict): lists of the hooks' durations by their names.
+    """
+    if test.IS_COMPLEX:
+        handler.start_composite(test)
+        for sub_test in test:
+            run_tree(handler, sub_test, time_scale, latencies)
+
+        test.data.success = True
+        handler.stop_composite(test)
+        return
+
+    start = clock()
+    handler.start_test(test)
+    latencies["start_test"].append(clock() - start)
+
+    if time_scale:
+        time.sleep(time_scale * test.resource_manager.statistics.get(
+            test.data.name, test.resource_manager.average))
+
+    test.data.success = True
+    start = clock()
+    handler.stop_test(test)
+    latencies["stop_test"].append(clock() - start)
+
+
+def measure(args):
+    """Run the tree with a single handler.
+
+    Returns:
+        dict: the measurements of the handler.
+    """
+    directory = tempfile.mkdtemp()
+    StatisticManager.BACKENDS = [ResourceManagerBackend(StatisticsCache(
+        os.path.join(directory, StatisticsCache.FILE_NAME)))]
+    StatisticManager.HISTORY = DurationHistory(
+        os.path.join(directory, DurationHistory.FILE_NAME))
+    os.environ["ROTEST_PROGRESS_EVENT_LOG_DIR"] = directory
+
+    resource_manager = FakeBulkResourceManager(latency=args.latency)
+    width = args.width or get_width(args.leaves, args.depth)
+    tree = build_tree(resource_manager, args.leaves, width)
+    resource_manager.statistics = generate_statistics(
+        tree, args.distribution, args.mean)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    stream = CountingStream()
+    sys.stdout = sys.stderr = stream
+    latencies = {"start_test": [], "stop_test": []}
+    try:
+        handler = HANDLERS[args.single](main_test=tree, stream=stream)
+        cpu_start = get_process_cpu()
+        thread_cpu_start = thread_clock()
+
+        start = clock()
+        handler.start_test_run()
+        start_time = clock() - start
+
+        start = clock()
+        run_tree(handler, tree, args.time_scale, latencies)
+        run_time = clock() - start
+
+        # The statistics are resolved in the background during the run
+        handler.resolver.join(handler.resolver.deadline)
+        handler.stop_test_run()
+        process_cpu = get_process_cpu() - cpu_start
+        main_thread_cpu = thread_clock()
+
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        shutil.rmtree(directory)
+
+    return {
+        "handler": args.single,
+        "tests": args.leaves,
+        "width": width,
+        "start_test_run_s": start_time,
+        "statistics_phase_s": handler.resolver.duration,
+        "statistics_requests": resource_manager.requests,
+        "run_s": run_time,
+        "hooks": {name: summarize(values)
+                  for name, values in latencies.items()},
+        "process_cpu_s": process_cpu,
+        "background_cpu_s": None if main_thread_cpu is None else
+        max(process_cpu - main_thread_cpu + thread_cpu_start, 0),
+        "bytes_written": stream.written,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def measure_in_subprocess(name, argv):
+    """Run the benchmark of a single handler in a fresh interpreter.
+
+    Returns:
+        dict: the measurements of the handler, or the reason it was skipped.
+    """
+    if name in NEEDS_DISPLAY and os.name != "nt" and \
+            not os.environ.get("DISPLAY"):
+        return {"handler": name, "skipped": "no display, use xvfb-run -a"}
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.handlers", "--single", name] +
+        argv,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = process.communicate()
+    if process.returncode != 0:
+        return {"handler": name,
+                "error": error.decode("utf-8", "replace").strip()}
+
+    return json.loads(output.decode("utf-8"))
+
+
+def main():
+    """Measure every requested handler and print the results as JSON."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the overhead of the progress handlers.")
+    parser.add_argument("--leaves", type=int, default=1000,
+                        help="amount of test cases, up to 100k")
+    parser.add_argument("--width", type=int, default=None,
+                        help="maximal amount of components in each suite")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="depth of the tree, if no width was given")
+    parser.add_argument("--distribution", choices=sorted(DISTRIBUTIONS),
+                        default="exponential",
+                        help="distribution of the tests' expected durations")
+    parser.add_argument("--mean", type=float, default=2.0,
+                        help="mean expected duration of a test in seconds")
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="seconds per statistics request")
+    parser.add_argument("--time-scale", type=float, default=0.0,
+                        help="part of each test's expected duration to "
+                             "sleep, 0 to only measure the handlers")
+    parser.add_argument("--handlers", nargs="+", choices=sorted(HANDLERS),
+                        default=sorted(HANDLERS))
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--single", choices=sorted(HANDLERS),
+                        help=argparse.SUPPRESS)
+    args, argv = parser.parse_args(), sys.argv[1:]
+
+    if args.single:
+        print(json.dumps(measure(args)))
+        return
+
+    results = [measure_in_subprocess(name, argv) for name in args.handlers]
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark the startup cost rotest-progress adds to rotest.
+
+Rotest loads the classes of all the registered result handlers on every
+run. Each scenario is measured in fresh interpreters, and the median of the
+repeats is printed as JSON:
+
+* without - loading the handlers, skipping the ones of rotest-progress.
+* with - loading all the handlers, like any rotest run.
+* eager - also importing all the handlers' modules, like it used to.
+* progress - also loading the progress handler, like
+  ``rotest --outputs progress``.
+
+Run with ``python -m benchmarks.imports``.
+"""
+from __future__ import absolute_import, print_function
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+from importlib import import_module
+
+import pkg_resources
+
+
+ENTRY_POINTS_GROUP = "rotest.result_handlers"
+DISTRIBUTION = "rotest-progress"
+HEAVY_MODULES = ("tkinter", "tqdm", "colorama", "requests", "sqlite3")
+SCENARIOS = ("without", "with", "eager", "progress")
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def load_handlers(scenario):
+    """Load the result handlers' classes as rotest does in the scenario."""
+    handlers = {}
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINTS_GROUP):
+        if scenario == "without" and \
+                entry_point.dist.project_name == DISTRIBUTION:
+            continue
+
+        handlers[entry_point.name] = entry_point.load()
+
+    if scenario == "eager":
+        for handler_class in list(handlers.values()):
+            load = getattr(handler_class, "load", None)
+            if load is not None:
+                load()
+
+    elif scenario == "progress":
+        getattr(handlers["progress"], "load", lambda: None)()
+
+    return handlers
+
+
+def measure(scenario):
+    """Measure a single scenario in this interpreter."""
+    start = clock()
+    import_module("rotest.core.result.result")
+    rotest_import = clock() - start
+    modules_before = len(sys.modules)
+
+    start = clock()
+    load_handlers(scenario)
+    return {"rotest_import_s": rotest_import,
+            "handlers_s": clock() - start,
+            "modules": len(sys.modules) - modules_before,
+            "heavy_modules": sorted(module for module in HEAVY_MODULES
+                                    if module in sys.modules)}
+
+
+def measure_in_subprocess(scenario, repeat):
+    """Measure a scenario in fresh interpreters and return the medians."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-W", "ignore", "-m", "benchmarks.imports",
+             "--single", scenario])
+        runs.append(json.loads(output.decode("utf-8")))
+
+    result = {"scenario": scenario,
+              "heavy_modules": runs[-1]["heavy_modules"]}
+    for key in ("rotest_import_s", "handlers_s", "modules"):
+        result[key] = sorted(run[key] for run in runs)[len(runs) // 2]
+
+    return result
+
+
+def main():
+    """Measure every requested scenario and print the results as JSON."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the startup cost of rotest-progress.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="amount of interpreters to measure each "
+                             "scenario in")
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--single", choices=SCENARIOS,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(measure(args.single)))
+        return
+
+    results = [measure_in_subprocess(scenario, args.repeat)
+               for scenario in args.scenarios]
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark the statistics phase against a slow fake resource manager.
+
+Run with ``python -m benchmarks.statistics_prefetch``.
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+from rotest_progress.cache import StatisticsCache
+from rotest_progress.utils import StatisticManager
+from rotest_progress.snapshot import write_snapshot
+from rotest_progress.backends import ResourceManagerBackend, SnapshotBackend
+
+from .fakes import (FakeResourceManager, FakeBulkResourceManager,
+                    build_tree, iterate_leaves)
+
+
+def reset_statistics(cache_path, snapshot_path=None):
+    """Clear the global state of the statistics manager."""
+    StatisticManager.STATISTICS_CACHE = {}
+    StatisticManager.BACKENDS = [
+        ResourceManagerBackend(StatisticsCache(cache_path))]
+    if snapshot_path is not None:
+        StatisticManager.BACKENDS.insert(0, SnapshotBackend(snapshot_path))
+
+
+def write_tree_snapshot(args, path):
+    """Write a snapshot of all the tests of the benchmark's tree."""
+    tree = build_tree(None, args.tests, args.width)
+    write_snapshot(path, {leaf.data.name: 1.5
+                          for leaf in iterate_leaves(tree)}, "benchmark")
+
+
+def run_phase(manager_class, args, prefetch, cache_path, snapshot_path=None):
+    """Time the statistics phase of a fresh tree.
+
+    Returns:
+        tuple: the phase's wall time and the amount of requests made.
+    """
+    reset_statistics(cache_path, snapshot_path)
+    resource_manager = manager_class(latency=args.latency)
+    tree = build_tree(resource_manager, args.tests, args.width)
+
+    start = time.time()
+    if prefetch:
+        StatisticManager.prefetch_statistics(tree)
+
+    else:
+        for leaf in iterate_leaves(tree):
+            StatisticManager.get_statistics(leaf)
+
+    return time.time() - start, resource_manager.requests
+
+
+def main():
+    """Compare the sequential, pooled and bulk statistics phases."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tests", type=int, default=500)
+    parser.add_argument("--width", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="seconds per request")
+    parser.add_argument("--workers", type=int,
+                        default=ResourceManagerBackend.MAX_WORKERS)
+    args = parser.parse_args()
+    ResourceManagerBackend.MAX_WORKERS = args.workers
+
+    directory = tempfile.mkdtemp()
+    snapshot_path = os.path.join(directory, "statistics.rpss")
+    write_tree_snapshot(args, snapshot_path)
+    try:
+        for title, manager_class, prefetch, cache_name, snapshot in (
+                ("sequential", FakeResourceManager, False, "sequential",
+                 None),
+                ("thread pool", FakeResourceManager, True, "pool", None),
+                ("bulk", FakeBulkResourceManager, True, "bulk", None),
+                ("warm cache", FakeBulkResourceManager, True, "bulk", None),
+                ("snapshot", FakeBulkResourceManager, True, "snapshot",
+                 snapshot_path)):
+
+            duration, request_count = run_phase(
+                manager_class, args, prefetch,
+                os.path.join(directory, cache_name + ".sqlite"), snapshot)
+
+            print("{:<12} {:8.3f}s {:6d} requests".format(title, duration,
+                                                          request_count))
+
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
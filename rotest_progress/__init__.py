@@ -1,7 +1,35 @@
-"""Defining the progress result handler."""
+"""Defining the progress result handler.
+
+The handlers are imported on first access, so importing the package (as
+rotest does on every run) doesn't import their dependencies.
+"""
 # pylint: disable=unused-import
 from __future__ import absolute_import
 
-from .full_progress import FullProgressHandler  # noqa
-from .popup_progress import TkinterProgressHandler  # noqa
-from .current_progress import CurrentProgressHandler  # noqa
+import sys
+
+from .lazy import (LazyCurrentProgressHandler, LazyFullProgressHandler,
+                   LazyTkinterProgressHandler, LazyWebProgressHandler)
+
+
+HANDLERS = {handler_class.HANDLER.split(":")[1]: handler_class
+            for handler_class in (LazyCurrentProgressHandler,
+                                  LazyFullProgressHandler,
+                                  LazyTkinterProgressHandler,
+                                  LazyWebProgressHandler)}
+
+
+def __getattr__(name):
+    """Import the handler classes on first access (Python 3.7 and above)."""
+    if name in HANDLERS:
+        return HANDLERS[name].load()
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,
+                                                                    name))
+
+
+if sys.version_info < (3, 7):
+    from .full_progress import FullProgressHandler  # noqa
+    from .popup_progress import TkinterProgressHandler  # noqa
+    from .web_progress import WebProgressHandler  # noqa
+    from .current_progress import CurrentProgressHandler  # noqa
@@ -0,0 +1,452 @@
+"""Sources of the tests' average durations.
+
+Backends are registered under the 'rotest_progress.backends' entry points
+group, and chained in the order given by ``ROTEST_PROGRESS_BACKENDS``: each
+one is only asked for the tests the ones before it didn't find.
+"""
+# pylint: disable=bare-except,broad-except
+from __future__ import absolute_import
+
+import os
+import csv
+import glob
+import json
+import sqlite3
+from multiprocessing.pool import ThreadPool
+from xml.etree import ElementTree
+
+import requests
+
+from rotest.common import core_log
+
+from .config import get_setting
+from .metrics import METRICS
+from .cache import StatisticsCache
+from .snapshot import open_snapshot
+
+
+ENTRY_POINTS_GROUP = "rotest_progress.backends"
+DEFAULT_BACKENDS = "file,snapshot,sqlite,junit,server"
+
+
+class StatisticsBackend(object):
+    """Interface of a source of the tests' average durations."""
+    NAME = NotImplemented
+
+    def get_many(self, names):
+        """Look for the average durations of the given tests.
+
+        Args:
+            names (dict): map of test names to the resource manager of the
+                test, None if it has none.
+
+        Returns:
+            dict: map of the found names to their average duration in
+                seconds.
+        """
+        raise NotImplementedError()
+
+
+class ResourceManagerBackend(StatisticsBackend):
+    """The statistics of rotest's resource management server.
+
+    Fresh entries of the persistent cache are used first, the rest are
+    queried from the server and saved. If the server can't be reached,
+    stale entries are used instead.
+
+    Attributes:
+        BULK_METHOD (str): name of the resource manager's method for fetching
+            the statistics of many tests in one request, if it has one.
+        MAX_WORKERS (number): maximal amount of concurrent statistics requests
+            to use when the resource manager has no bulk method.
+        disk_cache (StatisticsCache): persistent cache shared between runs,
+            its fresh entries spare the queries to the server and its stale
+            entries are used when the server can't be reached.
+        no_connection (bool): whether the server couldn't be reached.
+    """
+    NAME = "server"
+    BULK_METHOD = 'get_bulk_statistics'
+    MAX_WORKERS = 8
+
+    def __init__(self, disk_cache=None):
+        self.disk_cache = StatisticsCache() if disk_cache is None \
+            else disk_cache
+        self.no_connection = False
+
+    def _load_cached_statistics(self, names, results, allow_stale):
+        """Copy entries of the persistent cache into the results.
+
+        Args:
+            names (list): names of the tests to load.
+            results (dict): map of test names to their average duration.
+            allow_stale (bool): whether to use entries older than the TTL.
+
+        Returns:
+            list: names of the tests that couldn't be loaded.
+        """
+        entries = self.disk_cache.get_many(names)
+        missing = []
+        for name in names:
+            entry = entries.get(name)
+            if entry is not None and \
+                    (allow_stale or self.disk_cache.is_fresh(entry)):
+
+                results[name] = entry.average
+
+            else:
+                missing.append(name)
+
+        METRICS.increment("statistics_cache_total", len(names) - len(missing),
+                          cache="disk", result="hit")
+        METRICS.increment("statistics_cache_total", len(missing),
+                          cache="disk", result="miss")
+        return missing
+
+    def get_many(self, names):
+        """Look for the statistics of the tests that have a resource manager.
+        """
+        names = {name: resource_manager
+                 for name, resource_manager in names.items()
+                 if resource_manager}
+
+        results = {}
+        missing = self._load_cached_statistics(list(names), results,
+                                               allow_stale=self.no_connection)
+        if not missing or self.no_connection:
+            return results
+
+        resource_manager = names[missing[0]]
+        if len(missing) == 1:
+            self._request_statistics(resource_manager, missing[0], results)
+
+        elif not self._request_bulk_statistics(resource_manager, missing,
+                                               results):
+            pool = ThreadPool(min(self.MAX_WORKERS, len(missing)))
+            try:
+                pool.map(lambda name: self._request_statistics(names[name],
+                                                               name,
+                                                               results),
+                         missing)
+
+            finally:
+                pool.close()
+                pool.join()
+
+        self.disk_cache.store({name: results[name] for name in missing
+                               if results.get(name) is not None})
+
+        if self.no_connection:
+            self._load_cached_statistics([name for name in missing
+                                          if name not in results],
+                                         results, allow_stale=True)
+
+        return {name: average for name, average in results.items()
+                if average is not None}
+
+    def _request_statistics(self, resource_manager, name, results):
+        """Query the resource manager for the statistics of a single test.
+
+        Args:
+            resource_manager (ClientResourceManager): client to query with.
+            name (str): name of the test to query.
+            results (dict): map of test names to their average duration.
+        """
+        if self.no_connection:
+            return
+
+        try:
+            with METRICS.timer("statistics_request_seconds",
+                               method="single"):
+                stats = resource_manager.get_statistics(name)
+
+            results[name] = stats['avg']
+
+        except requests.exceptions.ConnectionError:
+            self.no_connection = True
+
+        except:  # noqa
+            results[name] = None
+
+    def _request_bulk_statistics(self, resource_manager, names, results):
+        """Query the resource manager for the statistics of many tests at once.
+
+        Args:
+            resource_manager (ClientResourceManager): client to query with.
+            names (list): names of the tests to query.
+            results (dict): map of test names to their average duration.
+
+        Returns:
+            bool: whether the bulk request was handled by the server.
+        """
+        get_bulk_statistics = getattr(resource_manager, self.BULK_METHOD,
+                                      None)
+        if get_bulk_statistics is None:
+            return False
+
+        try:
+            with METRICS.timer("statistics_request_seconds", method="bulk"):
+                all_stats = get_bulk_statistics(names)
+
+        except requests.exceptions.ConnectionError:
+            self.no_connection = True
+            return True
+
+        except:  # noqa
+            return False
+
+        for name in names:
+            try:
+                results[name] = all_stats[name]['avg']
+
+            except:  # noqa
+                results[name] = None
+
+        return True
+
+
+class FileBackend(StatisticsBackend):
+    """Durations listed in a local JSON or CSV file.
+
+    The path is taken from ``ROTEST_PROGRESS_DURATIONS_FILE``. A JSON file
+    maps the test names to their duration (or to a dict with an 'avg' key,
+    like the server's statistics), and a CSV file has a name and a duration
+    in each row.
+
+    Attributes:
+        path (str): path of the file, None if there's none.
+    """
+    NAME = "file"
+
+    def __init__(self, path=None):
+        self.path = get_setting("DURATIONS_FILE", None) if path is None \
+            else path
+        self._durations = None
+
+    @staticmethod
+    def _to_seconds(value):
+        """Return the duration of an entry, None if it isn't valid."""
+        if isinstance(value, dict):
+            value = value.get('avg')
+
+        try:
+            return float(value)
+
+        except (TypeError, ValueError):
+            return None
+
+    def _load(self):
+        """Read the file on first use, an unreadable file has no entries."""
+        if self._durations is None:
+            self._durations = {}
+            if self.path is None:
+                return self._durations
+
+            try:
+                with open(self.path) as durations_file:
+                    if self.path.lower().endswith(".csv"):
+                        rows = (row for row in csv.reader(durations_file)
+                                if len(row) >= 2)
+
+                    else:
+                        rows = json.load(durations_file).items()
+
+                    for name, value in rows:
+                        duration = self._to_seconds(value)
+                        if duration is not None:
+                            self._durations[name] = duration
+
+            except (IOError, OSError, ValueError, AttributeError):
+                pass
+
+        return self._durations
+
+    def get_many(self, names):
+        """Look for the tests in the file."""
+        durations = self._load()
+        return {name: durations[name] for name in names if name in durations}
+
+
+class SnapshotBackend(StatisticsBackend):
+    """Averages of a statistics snapshot, shared between machines.
+
+    The path is taken from ``ROTEST_PROGRESS_SNAPSHOT_FILE``, see the
+    snapshot module for creating one. The snapshot is mapped on first use
+    and each test is looked up in O(1), and a snapshot that's stale or from
+    an unexpected source is rejected with a warning.
+
+    Attributes:
+        path (str): path of the snapshot, None if there's none.
+    """
+    NAME = "snapshot"
+
+    def __init__(self, path=None):
+        self.path = get_setting("SNAPSHOT_FILE", None) if path is None \
+            else path
+        self._snapshot = None
+        self._loaded = False
+
+    def _load(self):
+        """Open the snapshot on first use, None if it can't be used."""
+        if not self._loaded:
+            self._loaded = True
+            if self.path is not None:
+                try:
+                    self._snapshot = open_snapshot(self.path)
+
+                except (IOError, OSError, ValueError) as error:
+                    core_log.warning("Not using the statistics snapshot: %s",
+                                     error)
+
+        return self._snapshot
+
+    def get_many(self, names):
+        """Look for the tests in the snapshot."""
+        snapshot = self._load()
+        if snapshot is None:
+            return {}
+
+        return snapshot.get_many(names)
+
+
+class SqliteBackend(StatisticsBackend):
+    """Averages kept in a sqlite file, regardless of their age.
+
+    The path is taken from ``ROTEST_PROGRESS_SQLITE_FILE``, and the file
+    has the same table as the statistics cache.
+
+    Attributes:
+        database (StatisticsCache): the file's database, None if there's
+            none.
+    """
+    NAME = "sqlite"
+
+    def __init__(self, path=None):
+        path = get_setting("SQLITE_FILE", None) if path is None else path
+        self.database = None if path is None else StatisticsCache(path)
+
+    def get_many(self, names):
+        """Look for the tests in the file."""
+        if self.database is None or \
+                not os.path.isfile(self.database.path or ""):
+            return {}
+
+        try:
+            return {name: entry.average for name, entry
+                    in self.database.get_many(list(names)).items()
+                    if entry.average is not None}
+
+        except sqlite3.Error:
+            return {}
+
+
+class JUnitBackend(StatisticsBackend):
+    """Durations of passed tests in JUnit XML reports of previous runs.
+
+    The reports are found using the glob patterns in
+    ``ROTEST_PROGRESS_JUNIT_REPORTS``, separated like the PATH. A test is
+    found either by its name or by its class name and name, joined by a dot,
+    and its duration is averaged over all the reports.
+
+    Attributes:
+        patterns (list): glob patterns of the reports.
+    """
+    NAME = "junit"
+    FAILURE_TAGS = ("failure", "error", "skipped")
+
+    def __init__(self, patterns=None):
+        if patterns is None:
+            patterns = get_setting("JUNIT_REPORTS", "").split(os.pathsep)
+
+        self.patterns = [pattern for pattern in patterns if pattern]
+        self._durations = None
+
+    def _parse(self, path, totals):
+        """Add the durations of the passed tests of a report to the totals.
+        """
+        for _, element in ElementTree.iterparse(path):
+            if element.tag != "testcase":
+                continue
+
+            if not any(child.tag in self.FAILURE_TAGS for child in element):
+                try:
+                    duration = float(element.get("time"))
+
+                except (TypeError, ValueError):
+                    duration = None
+
+                if duration is not None:
+                    name = element.get("name", "")
+                    keys = set([name, "{}.{}".format(
+                        element.get("classname", ""), name)])
+                    for key in keys:
+                        total, count = totals.get(key, (0.0, 0))
+                        totals[key] = (total + duration, count + 1)
+
+            element.clear()
+
+    def _load(self):
+        """Read the reports on first use, skipping unreadable ones."""
+        if self._durations is None:
+            totals = {}
+            for pattern in self.patterns:
+                for path in glob.glob(pattern):
+                    try:
+                        self._parse(path, totals)
+
+                    except (IOError, OSError, ElementTree.ParseError):
+                        pass
+
+            self._durations = {name: total / count
+                               for name, (total, count) in totals.items()}
+
+        return self._durations
+
+    def get_many(self, names):
+        """Look for the tests in the reports."""
+        durations = self._load()
+        return {name: durations[name] for name in names if name in durations}
+
+
+BUILTIN_BACKENDS = {backend_class.NAME: backend_class
+                    for backend_class in (ResourceManagerBackend,
+                                          FileBackend,
+                                          SnapshotBackend,
+                                          SqliteBackend,
+                                          JUnitBackend)}
+
+
+def get_backend_classes():
+    """Return the registered backends' classes by their names."""
+    backend_classes = dict(BUILTIN_BACKENDS)
+    try:
+        import pkg_resources
+
+    except ImportError:
+        return backend_classes
+
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINTS_GROUP):
+        try:
+            backend_classes[entry_point.name] = entry_point.load()
+
+        except Exception:
+            pass
+
+    return backend_classes
+
+
+def load_backends(names=None):
+    """Create the chain of backends.
+
+    Args:
+        names (str): comma separated names of the backends, in the order to
+            ask them, None to use ``ROTEST_PROGRESS_BACKENDS``.
+
+    Returns:
+        list: the backends' instances, unknown names are skipped.
+    """
+    if names is None:
+        names = get_setting("BACKENDS", DEFAULT_BACKENDS)
+
+    backend_classes = get_backend_classes()
+    return [backend_classes[name.strip()]() for name in names.split(",")
+            if name.strip() in backend_classes]
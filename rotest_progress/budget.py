@@ -0,0 +1,118 @@
+"""Global budget for redrawing the bars of all the handlers."""
+# pylint: disable=too-many-instance-attributes
+from __future__ import absolute_import
+
+import time
+import threading
+
+from .config import get_setting
+from .metrics import METRICS
+from .streams import StreamProxy
+
+
+clock = getattr(time, "monotonic", time.time)
+
+
+class RefreshBudget(object):
+    """Limits how often and how much all the handlers draw, together.
+
+    Frames are at least 1 / MAX_FPS seconds apart, and the bytes written
+    since the previous frame have to fit in MAX_BYTES_PER_SECOND. The
+    interval backs off on its own when:
+
+    * writing is slow (e.g. SSH or serial consoles), so writing takes at
+      most WRITE_SHARE of the time. The write latency is measured through
+      the streams returned by 'wrap'.
+    * many bars are running, by a factor of every BARS_PER_FRAME bars.
+
+    The interval is never longer than MAX_INTERVAL, so the bars keep moving.
+
+    Attributes:
+        max_fps (number): most frames per second.
+        bytes_per_second (number): most bytes to write per second, 0 for no
+            limit.
+        latency (number): average seconds spent writing each frame.
+        written (number): bytes written through the wrapped streams.
+    """
+    MAX_FPS = get_setting("MAX_FPS", 10.0, float)
+    MAX_BYTES_PER_SECOND = get_setting("MAX_BYTES_PER_SECOND", 65536.0,
+                                       float)
+    WRITE_SHARE = 0.1
+    BARS_PER_FRAME = 20
+    MAX_INTERVAL = 1.0  # Seconds
+    LATENCY_WEIGHT = 0.3
+
+    def __init__(self, max_fps=None, bytes_per_second=None):
+        self.max_fps = self.MAX_FPS if max_fps is None else max_fps
+        self.bytes_per_second = self.MAX_BYTES_PER_SECOND \
+            if bytes_per_second is None else bytes_per_second
+
+        self.latency = 0.0
+        self.written = 0
+        self._write_time = 0.0
+        self._frame_written = 0
+        self._next_frame = 0.0
+        self._lock = threading.Lock()
+
+    def wrap(self, stream):
+        """Return the stream, measuring what's written through it."""
+        return BudgetedStream(stream, self)
+
+    def add_write(self, size, seconds):
+        """Account for a single write to a wrapped stream."""
+        with self._lock:
+            self.written += size
+            self._write_time += seconds
+
+    def get_interval(self, bars=1):
+        """Return the seconds between frames with the given running bars."""
+        interval = 1.0 / max(self.max_fps, 1e-3)
+        interval *= max(1.0, float(bars) / self.BARS_PER_FRAME)
+        interval = max(interval, self.latency / self.WRITE_SHARE)
+        return min(interval, self.MAX_INTERVAL)
+
+    def get_delay(self):
+        """Return the seconds to wait before the next frame may be drawn."""
+        return max(self._next_frame - clock(), 0)
+
+    def spend(self, bars=1):
+        """Account for a drawn frame and schedule the next one.
+
+        Args:
+            bars (number): amount of bars running during the frame.
+        """
+        with self._lock:
+            frame_written = self.written - self._frame_written
+            self._frame_written = self.written
+            write_time, self._write_time = self._write_time, 0.0
+            if frame_written:
+                self.latency += self.LATENCY_WEIGHT * \
+                    (write_time - self.latency)
+
+            interval = self.get_interval(bars)
+            if self.bytes_per_second > 0:
+                interval = max(interval,
+                               min(frame_written / self.bytes_per_second,
+                                   self.MAX_INTERVAL))
+
+            self._next_frame = clock() + interval
+
+        METRICS.set_gauge("refresh_interval_seconds", interval)
+
+
+class BudgetedStream(StreamProxy):
+    """Stream wrapper that reports its writes to the refresh budget.
+
+    Attributes:
+        budget (RefreshBudget): budget to report to.
+    """
+    def __init__(self, stream, budget):
+        super(BudgetedStream, self).__init__(stream, self.report)
+        self.budget = budget
+
+    def report(self, string, seconds):
+        """Account for the bytes of a write and the time it took."""
+        self.budget.add_write(len(string), seconds)
+
+
+BUDGET = RefreshBudget()
@@ -0,0 +1,164 @@
+"""Persistent cache of the tests' statistics."""
+# pylint: disable=broad-except
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+from .config import get_setting
+
+
+CacheEntry = namedtuple("CacheEntry", ["average", "timestamp"])
+
+
+def get_cache_directory():
+    """Return the directory to keep rotest-progress' persistent files in."""
+    directory = get_setting("CACHE_DIR", None)
+    if directory:
+        return directory
+
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(base, "rotest_progress")
+
+
+class StatisticsCache(object):
+    """Tests' average durations, kept in a sqlite file between runs.
+
+    Entries are keyed by the test name and remember when they were fetched,
+    so fresh entries can replace the query to the server, while stale ones
+    are still good enough when the server can't be reached.
+
+    Attributes:
+        path (str): path of the database file, None to disable the cache.
+        ttl (number): seconds an entry stays fresh after being fetched.
+        max_size (number): maximal amount of entries to keep, the oldest
+            entries are evicted first.
+    """
+    FILE_NAME = "statistics.sqlite"
+    DEFAULT_TTL = 24 * 60 * 60  # Seconds
+    DEFAULT_MAX_SIZE = 100000
+    QUERY_CHUNK = 500
+
+    def __init__(self, path=None, ttl=None, max_size=None):
+        if path is None:
+            path = os.path.join(get_cache_directory(), self.FILE_NAME)
+
+        self.path = path
+        self.ttl = get_setting("CACHE_TTL", self.DEFAULT_TTL, float) \
+            if ttl is None else ttl
+
+        self.max_size = get_setting("CACHE_SIZE", self.DEFAULT_MAX_SIZE, int) \
+            if max_size is None else max_size
+
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the database on first use, disable the cache on failure."""
+        if self._connection is None and self.path is not None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+
+                self._connection = sqlite3.connect(self.path,
+                                                   check_same_thread=False)
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS statistics ("
+                    "name TEXT PRIMARY KEY, average REAL, "
+                    "timestamp REAL NOT NULL)")
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS statistics_timestamp "
+                    "ON statistics (timestamp)")
+                self._connection.commit()
+
+            except Exception:
+                self._connection = None
+                self.path = None
+
+        return self._connection
+
+    def is_fresh(self, entry):
+        """Return whether the entry is younger than the TTL."""
+        return time.time() - entry.timestamp < self.ttl
+
+    def get_many(self, names):
+        """Get the cached entries of the given tests, fresh or stale.
+
+        Args:
+            names (list): names of the tests to look for.
+
+        Returns:
+            dict: map of the found names to their CacheEntry.
+        """
+        entries = {}
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return entries
+
+            try:
+                for index in range(0, len(names), self.QUERY_CHUNK):
+                    chunk = names[index:index + self.QUERY_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = connection.execute(
+                        "SELECT name, average, timestamp FROM statistics "
+                        "WHERE name IN ({})".format(placeholders), chunk)
+
+                    for name, average, timestamp in rows:
+                        entries[name] = CacheEntry(average, timestamp)
+
+            except sqlite3.Error:
+                pass
+
+        return entries
+
+    def store(self, averages, timestamp=None):
+        """Save the given averages, then evict the oldest entries if needed.
+
+        Args:
+            averages (dict): map of test names to their average duration.
+            timestamp (number): when the averages were fetched, in seconds
+                since the epoch, now by default.
+        """
+        if not averages:
+            return
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO statistics "
+                    "(name, average, timestamp) VALUES (?, ?, ?)",
+                    [(name, average, timestamp)
+                     for name, average in averages.items()])
+
+                size, = connection.execute(
+                    "SELECT COUNT(*) FROM statistics").fetchone()
+                if size > self.max_size:
+                    connection.execute(
+                        "DELETE FROM statistics WHERE name IN ("
+                        "SELECT name FROM statistics "
+                        "ORDER BY timestamp LIMIT ?)",
+                        (size - self.max_size,))
+
+                connection.commit()
+
+            except sqlite3.Error:
+                connection.rollback()
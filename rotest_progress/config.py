@@ -0,0 +1,48 @@
+"""Settings of rotest-progress, read from environment variables."""
+from __future__ import absolute_import
+
+import os
+
+
+ENVIRONMENT_PREFIX = "ROTEST_PROGRESS_"
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def get_setting(name, default, cast=str):
+    """Get the value of a setting from the environment.
+
+    Args:
+        name (str): name of the setting, without the environment prefix.
+        default (object): value to return if the setting is missing or
+            invalid.
+        cast (type): callable to convert the raw string with.
+
+    Returns:
+        object: the value of the setting.
+    """
+    value = os.environ.get(ENVIRONMENT_PREFIX + name)
+    if not value:
+        return default
+
+    try:
+        return cast(value)
+
+    except ValueError:
+        return default
+
+
+def get_flag(name, default=False):
+    """Get the value of a boolean setting from the environment.
+
+    Args:
+        name (str): name of the setting, without the environment prefix.
+        default (bool): value to return if the setting is missing.
+
+    Returns:
+        bool: whether the setting is turned on.
+    """
+    value = os.environ.get(ENVIRONMENT_PREFIX + name)
+    if not value:
+        return default
+
+    return value.lower() in TRUE_VALUES
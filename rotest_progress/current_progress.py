@@ -4,13 +4,128 @@ from __future__ import absolute_import, print_function
 
 import os
 import sys
-import threading
 
-from rotest.core import skip_if_flow
 from rotest.core.result.handlers.abstract_handler import AbstractResultHandler
 
-from .utils import (wrap_settrace, go_over_tests, create_current_bar,
-                    DummyFile, StatisticManager)
+from .state import ProgressState
+from .budget import BUDGET
+from .engine import ProgressEngine
+from .lines import LineRenderer, use_line_mode
+from .ordering import plan_run
+from .metrics import METRICS, metered
+from .resolver import StatisticsResolver
+from .utils import (create_current_bar, format_eta,
+                    format_flow_eta, get_current_description,
+                    get_current_format, get_flow, DummyFile)
+
+
+class CurrentRenderer(object):
+    """Draws a single line bar for each running leaf test.
+
+    When tests run in parallel (e.g. in several worker processes) each one
+    gets its own lane, which is reused once the test finishes. The bars of
+    blocks also show the time left for their flow.
+    Started and moved bars are only drawn on the engine's next redraw, all
+    at once.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        stream (file): stream to draw the bars on, None for stderr.
+        bars (dict): the tqdm bars of the running tests by their index.
+        lanes (list): index of the test drawn in each lane, None if free.
+        pending (set): indices of the running tests whose bars were created
+            before their statistics were resolved.
+        overruns (set): indices of the running tests flagged as overrunning.
+        dirty (set): indices of the bars that started or moved since the
+            last redraw.
+    """
+    def __init__(self, state, stream=None):
+        self.state = state
+        self.stream = stream
+        self.bars = {}
+        self.lanes = []
+        self.pending = set()
+        self.overruns = set()
+        self.dirty = set()
+
+    def start_bar(self, index):
+        """Take the first free lane for a starting test.
+
+        The bar itself is created on the next redraw, so tests that end
+        before it aren't drawn at all.
+        """
+        if self.state.is_complex(index):
+            return
+
+        if None in self.lanes:
+            self.lanes[self.lanes.index(None)] = index
+
+        else:
+            self.lanes.append(index)
+
+        self.dirty.add(index)
+
+    def update_bar(self, index):
+        """Mark the bar of a running test to be redrawn."""
+        if index in self.bars:
+            self.dirty.add(index)
+
+    def _sync_bar(self, index, progress_bar):
+        """Update a bar to the test's state, without drawing it."""
+        if index in self.pending and not self.state.is_pending(index):
+            self.pending.discard(index)
+            progress_bar.total = self.state.totals[index]
+            progress_bar.bar_format = get_current_format(self.state, index)
+            progress_bar.set_description(
+                get_current_description(self.state, index), refresh=False)
+
+        elif self.state.overruns[index] and index not in self.overruns:
+            self.overruns.add(index)
+            progress_bar.set_description(
+                get_current_description(self.state, index), refresh=False)
+
+        progress_bar.n = self.state.values[index]
+        flow = get_flow(self.state, index)
+        postfix = format_eta(self.state) if flow is None else \
+            "{}, {}".format(format_flow_eta(self.state, flow),
+                            format_eta(self.state))
+
+        progress_bar.set_postfix_str(postfix, refresh=False)
+
+    def finish_bar(self, index):
+        """Free the lane of a finished test, and fill and remove its bar."""
+        if index not in self.lanes:
+            return
+
+        self.lanes[self.lanes.index(index)] = None
+        self.dirty.discard(index)
+        progress_bar = self.bars.pop(index, None)
+        if progress_bar is not None:
+            self.pending.discard(index)
+            self.overruns.discard(index)
+            progress_bar.n = progress_bar.total
+            progress_bar.close()
+
+    def redraw(self):
+        """Create the bars of the started tests and draw the moved ones."""
+        for index in self.dirty:
+            progress_bar = self.bars.get(index)
+            if progress_bar is None:
+                progress_bar = create_current_bar(
+                    self.state, index, self.lanes.index(index) + 1,
+                    self.stream)
+                self.bars[index] = progress_bar
+                if self.state.is_pending(index):
+                    self.pending.add(index)
+
+            self._sync_bar(index, progress_bar)
+            progress_bar.refresh()
+
+        self.dirty.clear()
+
+    def finish_run(self):
+        """The bars are removed as their tests finish."""
+        pass
 
 
 class CurrentProgressHandler(AbstractResultHandler):
@@ -18,42 +133,62 @@ class CurrentProgressHandler(AbstractResultHandler):
 
     Attributes:
         stream (file): stdout file to write to.
+        output (DummyFile): buffer of the tests' output.
+        state (ProgressState): progress state of the run.
+        resolver (StatisticsResolver): resolver of the tests' statistics.
     """
     NAME = 'progress'
-    watcher_thread = None
+    engine = None
+    state = None
+    resolver = None
 
     def __init__(self, *args, **kwargs):
         super(CurrentProgressHandler, self).__init__(*args, **kwargs)
         self.stream = kwargs['stream']
         if hasattr(self.stream, 'stream'):
             # In case it's a container of an inner stream
-            self.stream.stream = DummyFile(self.stream.stream)
+            self.output = DummyFile(self.stream.stream)
+            self.stream.stream = self.output
 
         else:
-            sys.stdout = DummyFile(self.stream)
+            self.output = DummyFile(self.stream)
+            sys.stdout = self.output
 
     def start_test_run(self):
         """Called once before any tests are executed."""
-        wrap_settrace()
-        StatisticManager.calculate_expected_time(self.main_Test)
+        plan = plan_run(self.main_test)
+        self.state = ProgressState(self.main_test)
+        if plan is not None:
+            self.state.workers = plan.workers
+
+        stream = BUDGET.wrap(metered(sys.stderr, self.NAME))
+        if use_line_mode(sys.stderr):
+            renderer = LineRenderer(self.state, stream)
+
+        else:
+            renderer = CurrentRenderer(self.state, stream)
+
+        self.engine = ProgressEngine(self.state, renderer, self.NAME)
+        self.engine.start()
+        self.resolver = StatisticsResolver(self.engine)
+        self.resolver.start()
 
     def stop_test_run(self):
         """Called once after all tests are executed."""
-        if self.watcher_thread:
-            self.watcher_thread.join()
+        if self.resolver:
+            self.resolver.stop()
+
+        if self.engine:
+            self.engine.stop()
 
         print(os.linesep)
+        self.output.flush_buffer()
+        METRICS.export()
 
-    @skip_if_flow
     def start_test(self, test):
         """Called when the given test is about to be run."""
-        test.progress_bar = create_current_bar(test)
-        test.progress_bar.start = True
-        self.watcher_thread = threading.Thread(target=go_over_tests,
-                                               kwargs={"test": test,
-                                                       "use_color": False})
-        self.watcher_thread.setDaemon(True)
-        self.watcher_thread.start()
+        self.output.flush_buffer()
+        self.engine.start_test(test)
 
     def stop_test(self, test):
         """Called when the given test has been run.
@@ -61,8 +196,5 @@ class CurrentProgressHandler(AbstractResultHandler):
         Args:
             test (rotest.core.abstract_test.AbstractTest): test item instance.
         """
-        if hasattr(test, 'progress_bar'):
-            test.progress_bar.finish = True
-            if self.watcher_thread:
-                self.watcher_thread.join()
-                self.watcher_thread = None
+        self.output.flush_buffer()
+        self.engine.stop_test(test)
@@ -0,0 +1,245 @@
+"""Event driven engine that moves the progress bars of the running tests."""
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+from __future__ import absolute_import
+
+import time
+import threading
+
+from rotest.core.flow import TestFlow
+from rotest.core.flow_component import MODE_FINALLY
+from rotest.core.models.case_data import TestOutcome
+
+from .utils import StatisticManager, get_test_outcome
+from .budget import BUDGET
+from .pauses import PAUSES
+from .eventlog import START, STOP, ESTIMATE, open_event_log
+from .watchdog import Watchdog
+from .metrics import METRICS, RATIO_BUCKETS
+
+
+clock = getattr(time, "monotonic", time.time)
+
+
+class ProgressEngine(threading.Thread):
+    """Single thread that drives the bars of all the running tests.
+
+    The thread sleeps until a test starts, then wakes once every frame to
+    update the elapsed time of the running tests in the progress state,
+    measured on the pause detector's clock, so the time the tests spend in
+    a debugger or stopped isn't counted in their bars or recorded
+    durations. Stopped tests are finished right away by
+    the calling thread, under the same lock, and wake the thread to redraw.
+    Every frame also checks the running tests with the watchdog.
+    When a component of a flow fails, the components after it that are
+    going to be skipped stop weighing right away, so the flow's and the
+    run's time left drop without waiting for them.
+    Redraws are paced by the global refresh budget, shared by all the
+    handlers, so a burst of short tests (e.g. from several worker processes)
+    is drawn in a single batch, and slow consoles or many running tests
+    make the frames further apart.
+    The engine of the run's first handler also writes its events to the
+    run's event log.
+
+    The renderer is notified of every change and draws it, and should have
+    the following methods, each getting the index of a test in the state:
+    'start_bar' when a test starts, 'update_bar' when the bar of a test
+    moves and 'finish_bar' when a test ends. Its 'redraw' method is called
+    after every batch of changes, and its 'finish_run' method once the
+    engine stops.
+    The renderer is only called by the engine's thread: the hooks queue
+    their notifications under the lock, and the thread passes them on
+    every frame, then redraws outside the lock, so the tests never wait
+    for a slow console.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        renderer (object): drawer of the bars.
+        name (str): name of the handler using the engine, for the metrics.
+        watchdog (Watchdog): flags the tests that run far too long.
+        budget (RefreshBudget): pace of the redraws.
+        pauses (PauseDetector): clock of the tests' elapsed time.
+        event_log (EventLog): log to write the events to, None if another
+            handler's engine writes them or logging is off.
+    """
+    def __init__(self, state, renderer, name=None, budget=BUDGET,
+                 pauses=PAUSES):
+        super(ProgressEngine, self).__init__()
+        self.setDaemon(True)
+        self.state = state
+        self.renderer = renderer
+        self.name = name or type(renderer).__name__
+        self.watchdog = Watchdog(state)
+        self.budget = budget
+        self.pauses = pauses
+        self.pauses.install()
+        self.event_log = open_event_log(state, self.name)
+        self._condition = threading.Condition()
+        self._running = {}
+        self._notifications = []
+        self._stopped = False
+
+    def start_test(self, test):
+        """Start moving the bar of the given test."""
+        index = self.state.index_of(test)
+        if index is None:
+            return
+
+        with METRICS.timer("hook_seconds", handler=self.name,
+                           hook="start_test"), self._condition:
+            self.state.start(index)
+            self._notifications.append((self.renderer.start_bar, index))
+            if self.event_log is not None:
+                self.event_log.write(START, index)
+
+            if not test.IS_COMPLEX:
+                self.pauses.watch()
+                self.pauses.check(bool(self._running), inspect=False)
+                self._running[index] = self.pauses.clock()
+                self.state.workers = max(self.state.workers,
+                                         len(self._running))
+                self._condition.notify()
+
+    def stop_test(self, test):
+        """Stop moving the bar of the given test and fill it."""
+        index = self.state.index_of(test)
+        if index is None:
+            return
+
+        with METRICS.timer("hook_seconds", handler=self.name,
+                           hook="stop_test"), self._condition:
+            self.pauses.check(bool(self._running), inspect=False)
+            last_tick = self._running.pop(index, None)
+            if last_tick is not None:
+                self.state.elapsed[index] = max(
+                    self.state.elapsed[index] + self.pauses.clock() -
+                    last_tick, 0)
+
+            if self.state.has_estimate(index) and \
+                    self.state.elapsed[index] > 0:
+
+                METRICS.observe("duration_ratio", self.state.elapsed[index] /
+                                self.state.expected[index],
+                                buckets=RATIO_BUCKETS, handler=self.name)
+
+            outcome = get_test_outcome(test)
+            elapsed = self.state.elapsed[index]
+            if self.event_log is not None:
+                self.event_log.write(STOP, index, outcome,
+                                     self.state.elapsed[index])
+
+            moved = set(self.state.finish(index, outcome))
+            self._notifications.append((self.renderer.finish_bar, index))
+            if getattr(test, "is_failing", None) is not None and \
+                    test.is_failing():
+
+                moved.update(self._skip_following(index))
+
+            self._notifications.extend((self.renderer.update_bar, changed)
+                                       for changed in moved)
+            self._condition.notify()
+
+        if outcome == TestOutcome.SUCCESS and elapsed > 0:
+            StatisticManager.HISTORY.record(test.data.name, elapsed, index)
+
+    def _skip_following(self, index):
+        """Skip the leaves of the flow's components after a failing one.
+
+        Returns:
+            set: indices of the nodes whose bars changed.
+        """
+        parent = self.state.parents[index]
+        if parent == self.state.NO_PARENT or \
+                not isinstance(self.state.tests[parent], TestFlow):
+            return set()
+
+        changed = set()
+        for sibling in self.state.children(parent,
+                                           start=self.state.positions[index]):
+            if self.state.tests[sibling].mode != MODE_FINALLY:
+                for leaf in range(sibling, self.state.ends[sibling]):
+                    changed.update(self.state.skip(leaf))
+
+        return changed
+
+    def set_estimates(self, estimates):
+        """Resize the bars of pending tests whose statistics were resolved.
+
+        Args:
+            estimates (dict): expected duration in seconds of each test by
+                its index, None for tests without statistics.
+        """
+        with self._condition:
+            changed = set()
+            for index, expected in estimates.items():
+                changed.update(self.state.set_estimate(index, expected))
+                if self.event_log is not None:
+                    self.event_log.write(ESTIMATE, index, value=expected)
+
+            self._notifications.extend((self.renderer.update_bar, index)
+                                       for index in changed)
+            self._condition.notify()
+
+    def stop(self):
+        """Stop the engine's thread and wait for it to end."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self.is_alive():
+            self.join()
+
+        with self._condition:
+            self._notify_renderer()
+
+        self.renderer.finish_run()
+        StatisticManager.HISTORY.flush()
+        if self.event_log is not None:
+            self.event_log.close()
+
+        METRICS.set_gauge("expected_seconds", self.state.estimated_times[0],
+                          handler=self.name)
+        METRICS.set_gauge("actual_seconds", self.state.actual_times[0],
+                          handler=self.name)
+
+    def run(self):
+        """Advance the running tests' bars every frame, sleep when idle."""
+        stopped = False
+        while not stopped:
+            with self._condition:
+                if not self._stopped:
+                    self._condition.wait(
+                        self.budget.get_interval(len(self._running))
+                        if self._running else None)
+
+                delay = self.budget.get_delay()
+                while delay > 0 and not self._stopped:
+                    self._condition.wait(delay)
+                    delay = self.budget.get_delay()
+
+                self._notify_renderer()
+                self._advance_bars()
+                running = len(self._running)
+                stopped = self._stopped
+
+            self.renderer.redraw()
+            self.budget.spend(running)
+            METRICS.increment("redraws_total", handler=self.name)
+
+    def _notify_renderer(self):
+        """Pass the queued changes of the tests' bars to the renderer."""
+        notifications, self._notifications = self._notifications, []
+        for notify, index in notifications:
+            notify(index)
+
+    def _advance_bars(self):
+        """Update the elapsed time of the running tests and their bars."""
+        self.pauses.check(bool(self._running))
+        now = self.pauses.clock()
+        for index, last_tick in self._running.items():
+            self._running[index] = now
+            elapsed = max(self.state.elapsed[index] + now - last_tick, 0)
+            for moved in self.state.advance(index, elapsed):
+                self.renderer.update_bar(moved)
+
+            if self.watchdog.check(index, elapsed):
+                self.renderer.update_bar(index)
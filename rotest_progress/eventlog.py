@@ -0,0 +1,181 @@
+"""Append-only binary log of the progress events of a run.
+
+A log starts with a header describing the run's tree, followed by fixed
+size records, one for every event:
+
+* MAGIC, the format's VERSION and the header's length (HEADER).
+* The header, a JSON object with the run's id, its start time and the
+  flattened tree, as [parent index, name, is complex] lists in the progress
+  state's order.
+* The records (RECORD): time since the epoch, event type, outcome, index of
+  the test and a value - the elapsed seconds of a stopped test or the
+  expected seconds of an estimated one.
+
+A log that was cut short (e.g. by a crash) is read up to its last whole
+record.
+"""
+# pylint: disable=broad-except
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import struct
+import threading
+
+from .config import get_setting, get_flag
+from .cache import get_cache_directory
+from .history import RUN_ID
+
+
+MAGIC = b"RPEL"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")
+RECORD = struct.Struct("<dBbid")
+FILE_SUFFIX = ".rpel"
+
+RUN_START, RUN_STOP, START, STOP, ESTIMATE = range(5)
+NO_OUTCOME = -1
+NO_VALUE = -1.0
+
+
+class EventLog(object):
+    """Writer of a run's event log.
+
+    Records are packed into a buffered file, so logging an event costs about
+    as much as formatting a few numbers. The buffer is written as it fills
+    and when the log is closed.
+
+    Attributes:
+        path (str): path of the log file.
+    """
+    def __init__(self, path, state):
+        self.path = path
+        self._lock = threading.Lock()
+        header = json.dumps({
+            "run": RUN_ID,
+            "start": time.time(),
+            "tree": [[state.parents[index], state.tests[index].data.name,
+                      bool(state.is_complex(index))]
+                     for index in range(len(state))]}).encode("utf-8")
+
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(header)))
+        self._file.write(header)
+        self.write(RUN_START, 0)
+
+    def write(self, event, index, outcome=None, value=NO_VALUE):
+        """Append a record of an event.
+
+        Args:
+            event (number): RUN_START, RUN_STOP, START, STOP or ESTIMATE.
+            index (number): index of the test in the progress state.
+            outcome (number): TestOutcome of a stopped test, None if unknown.
+            value (number): elapsed seconds of a stopped test, or expected
+                seconds of an estimated one.
+        """
+        record = RECORD.pack(time.time(), event,
+                             NO_OUTCOME if outcome is None else outcome,
+                             index, NO_VALUE if value is None else value)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(record)
+
+    def close(self):
+        """Record the run's end and close the file."""
+        self.write(RUN_STOP, 0)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_LOGGED_RUNS = set()
+_LOGGED_RUNS_LOCK = threading.Lock()
+
+
+def get_log_directory():
+    """Return the directory of the event logs."""
+    return get_setting("EVENT_LOG_DIR",
+                       os.path.join(get_cache_directory(), "events"))
+
+
+def prune_logs(directory, keep):
+    """Delete all but the newest logs in the directory."""
+    paths = sorted((os.path.join(directory, name)
+                    for name in os.listdir(directory)
+                    if name.endswith(FILE_SUFFIX)), key=os.path.getmtime)
+    for path in paths[:max(len(paths) - keep, 0)]:
+        try:
+            os.remove(path)
+
+        except OSError:
+            pass
+
+
+def open_event_log(state, name=None):
+    """Open the event log of a run, once for all of its handlers.
+
+    Logging is on by default, ``ROTEST_PROGRESS_EVENT_LOG`` turns it off, and
+    only the last ``ROTEST_PROGRESS_EVENT_LOG_KEEP`` logs are kept (default
+    is 50).
+
+    Args:
+        state (ProgressState): progress state of the run.
+        name (str): name of the handler opening the log.
+
+    Returns:
+        EventLog: the run's log, None if it's off, couldn't be opened or was
+            already opened by another handler.
+    """
+    if not get_flag("EVENT_LOG", True):
+        return None
+
+    with _LOGGED_RUNS_LOCK:
+        identifier = state.tests[0].identifier
+        if identifier in _LOGGED_RUNS:
+            return None
+
+        _LOGGED_RUNS.add(identifier)
+
+    directory = get_log_directory()
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        prune_logs(directory, get_setting("EVENT_LOG_KEEP", 50, int) - 1)
+        return EventLog(os.path.join(
+            directory, "{}-{}{}".format(RUN_ID, name or "run", FILE_SUFFIX)),
+            state)
+
+    except Exception:
+        return None
+
+
+def read_event_log(path):
+    """Read an event log.
+
+    Returns:
+        tuple: the header's dict and the list of records, as tuples of time,
+            event, outcome, index and value.
+
+    Raises:
+        ValueError: if the file isn't an event log.
+    """
+    with open(path, "rb") as log_file:
+        data = log_file.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError("{} isn't an event log".format(path))
+
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} isn't an event log of version {}".format(
+            path, VERSION))
+
+    start = HEADER.size + length
+    header = json.loads(data[HEADER.size:start].decode("utf-8"))
+    end = start + (len(data) - start) // RECORD.size * RECORD.size
+    records = [RECORD.unpack_from(data, offset)
+               for offset in range(start, end, RECORD.size)]
+    return header, records
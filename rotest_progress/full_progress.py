@@ -2,49 +2,58 @@
 # pylint: disable=too-many-arguments
 from __future__ import absolute_import, print_function
 
-import os
-import threading
+import sys
 
 from rotest.core.result.handlers.abstract_handler import AbstractResultHandler
 
-from .utils import (wrap_settrace, go_over_tests, create_tree_bar,
-                    StatisticManager)
+from .state import ProgressState
+from .budget import BUDGET
+from .engine import ProgressEngine
+from .viewport import TreeViewport
+from .lines import LineRenderer, use_line_mode
+from .ordering import plan_run
+from .metrics import METRICS, metered
+from .resolver import StatisticsResolver
 
 
 class FullProgressHandler(AbstractResultHandler):
-    """FullProgressHandler interface."""
+    """FullProgressHandler interface.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        renderer (object): TreeViewport drawing the visible part of the
+            tree, or LineRenderer printing summaries if stderr isn't a
+            terminal.
+        resolver (StatisticsResolver): resolver of the tests' statistics.
+    """
     NAME = 'full_progress'
-    watcher_thread = None
-
-    def __init__(self, *args, **kwargs):
-        super(FullProgressHandler, self).__init__(*args, **kwargs)
-        self.max_identifier = 1
-
-    def _create_bars(self, test):
-        """Return progress bar."""
-        test.progress_bar = create_tree_bar(test)
-        max_index = test.identifier
-        if test.IS_COMPLEX:
-            for sub_test in test:
-                max_index = max(max_index, self._create_bars(sub_test))
-
-        return max_index
+    engine = None
+    state = None
+    renderer = None
+    resolver = None
 
     def start_test_run(self):
         """Called once before any tests are executed."""
-        wrap_settrace()
-        StatisticManager.calculate_expected_time(self.main_test)
-        self.max_identifier = self._create_bars(self.main_test)
+        plan = plan_run(self.main_test)
+        self.state = ProgressState(self.main_test)
+        if plan is not None:
+            self.state.workers = plan.workers
 
-        self.watcher_thread = threading.Thread(target=go_over_tests,
-                                               kwargs={"test": self.main_test,
-                                                       "use_color": True})
-        self.watcher_thread.setDaemon(True)
-        self.watcher_thread.start()
+        stream = BUDGET.wrap(metered(sys.stderr, self.NAME))
+        if use_line_mode(sys.stderr):
+            self.renderer = LineRenderer(self.state, stream)
+
+        else:
+            self.renderer = TreeViewport(self.state, stream)
+
+        self.engine = ProgressEngine(self.state, self.renderer, self.NAME)
+        self.engine.start()
+        self.resolver = StatisticsResolver(self.engine)
+        self.resolver.start()
 
     def start_test(self, test):
         """Called when the given test is about to be run."""
-        test.progress_bar.start = True
+        self.engine.start_test(test)
 
     def stop_test(self, test):
         """Called when the given test has been run.
@@ -52,8 +61,7 @@ class FullProgressHandler(AbstractResultHandler):
         Args:
             test (rotest.core.abstract_test.AbstractTest): test item instance.
         """
-        if test.progress_bar:
-            test.progress_bar.finish = True
+        self.engine.stop_test(test)
 
     def stop_composite(self, test):
         """Called when the given TestSuite has been run.
@@ -65,7 +73,10 @@ class FullProgressHandler(AbstractResultHandler):
 
     def stop_test_run(self):
         """Called once after all tests are executed."""
-        if self.watcher_thread:
-            self.watcher_thread.join()
+        if self.resolver:
+            self.resolver.stop()
+
+        if self.engine:
+            self.engine.stop()
 
-        print(os.linesep * self.max_identifier)
+        METRICS.export()
@@ -0,0 +1,214 @@
+"""Local history of the tests' observed durations."""
+# pylint: disable=broad-except
+from __future__ import absolute_import
+
+import os
+import time
+import sqlite3
+import threading
+
+from .config import get_setting
+from .cache import get_cache_directory
+
+
+RUN_ID = "{}-{}".format(os.getpid(), int(time.time() * 1000))
+
+
+def mean(samples):
+    """Return the average of the samples."""
+    return sum(samples) / len(samples)
+
+
+def percentile(samples, ratio):
+    """Return the sample below which the given ratio of the samples fall."""
+    samples = sorted(samples)
+    return samples[int(round(ratio * (len(samples) - 1)))]
+
+
+def median(samples):
+    """Return the middle of the samples."""
+    samples = sorted(samples)
+    middle = len(samples) // 2
+    if len(samples) % 2:
+        return samples[middle]
+
+    return (samples[middle - 1] + samples[middle]) / 2.0
+
+
+def ewma(samples, alpha=0.3):
+    """Return the exponentially weighted average, favoring recent samples.
+
+    Args:
+        samples (list): the samples, oldest first.
+        alpha (number): weight of each sample over the ones before it.
+    """
+    average = samples[0]
+    for sample in samples[1:]:
+        average += alpha * (sample - average)
+
+    return average
+
+
+ESTIMATORS = {"mean": mean,
+              "median": median,
+              "p90": lambda samples: percentile(samples, 0.9),
+              "ewma": ewma}
+
+
+class DurationHistory(object):
+    """The last observed durations of each test, kept in a sqlite file.
+
+    Durations are recorded as tests pass, kept in memory and written in a
+    single batch once the run ends, so the tests never wait for the disk.
+    Each sample is timed when it's recorded, and samples recorded at the
+    same time are ordered by their recording.
+    Samples are keyed by RUN_ID and the test's index in the run, so several
+    handlers recording the same test in one run don't count it twice, while
+    tests of the same name that run more than once count each time.
+    The expected duration of a test is estimated from its samples, and
+    blended with the server's average if there is one, which counts as
+    SERVER_WEIGHT samples.
+
+    Attributes:
+        path (str): path of the database file, None to disable the history.
+        estimator (function): reduces a list of samples, oldest first, to
+            an expected duration.
+        max_samples (number): amount of samples to keep for each test.
+    """
+    FILE_NAME = "history.sqlite"
+    DEFAULT_ESTIMATOR = "median"
+    DEFAULT_MAX_SAMPLES = 20
+    SERVER_WEIGHT = get_setting("SERVER_WEIGHT", 5.0, float)
+    QUERY_CHUNK = 500
+
+    def __init__(self, path=None, estimator=None, max_samples=None):
+        if path is None:
+            path = os.path.join(get_cache_directory(), self.FILE_NAME)
+
+        self.path = path
+        if estimator is None:
+            estimator = get_setting("ESTIMATOR", self.DEFAULT_ESTIMATOR)
+
+        self.estimator = ESTIMATORS.get(estimator,
+                                        ESTIMATORS[self.DEFAULT_ESTIMATOR])
+        self.max_samples = get_setting("HISTORY_SIZE",
+                                       self.DEFAULT_MAX_SAMPLES, int) \
+            if max_samples is None else max_samples
+
+        self._pending = []
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the database on first use, disable the history on failure."""
+        if self._connection is None and self.path is not None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+
+                self._connection = sqlite3.connect(self.path,
+                                                   check_same_thread=False)
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS durations ("
+                    "name TEXT NOT NULL, run TEXT NOT NULL, "
+                    "duration REAL NOT NULL, timestamp REAL NOT NULL, "
+                    "PRIMARY KEY (name, run))")
+                self._connection.commit()
+
+            except Exception:
+                self._connection = None
+                self.path = None
+
+        return self._connection
+
+    def record(self, name, duration, index=0):
+        """Add an observed duration of a test, to be written on 'flush'.
+
+        Args:
+            name (str): name of the test.
+            duration (number): seconds the test took.
+            index (number): index of the test in the run.
+        """
+        with self._lock:
+            self._pending.append((name, "{}-{}".format(RUN_ID, index),
+                                  duration, time.time()))
+
+    def flush(self):
+        """Write the recorded durations, keeping the last samples of each."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            connection = self._connect() if pending else None
+            if connection is None:
+                return
+
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO durations "
+                    "(name, run, duration, timestamp) VALUES (?, ?, ?, ?)",
+                    pending)
+
+                connection.executemany(
+                    "DELETE FROM durations WHERE name = ? AND run NOT IN ("
+                    "SELECT run FROM durations WHERE name = ? "
+                    "ORDER BY timestamp DESC, rowid DESC LIMIT ?)",
+                    [(name, name, self.max_samples)
+                     for name in set(sample[0] for sample in pending)])
+
+                connection.commit()
+
+            except sqlite3.Error:
+                connection.rollback()
+
+    def get_many(self, names):
+        """Get the recorded durations of the given tests.
+
+        Args:
+            names (list): names of the tests to look for.
+
+        Returns:
+            dict: map of the found names to their samples, oldest first.
+        """
+        samples = {}
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return samples
+
+            try:
+                for index in range(0, len(names), self.QUERY_CHUNK):
+                    chunk = names[index:index + self.QUERY_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = connection.execute(
+                        "SELECT name, duration FROM durations "
+                        "WHERE name IN ({}) "
+                        "ORDER BY timestamp, rowid".format(placeholders),
+                        chunk)
+
+                    for name, duration in rows:
+                        samples.setdefault(name, []).append(duration)
+
+            except sqlite3.Error:
+                pass
+
+        return samples
+
+    def estimate(self, samples, server_average=None):
+        """Return the expected duration of a test.
+
+        Args:
+            samples (list): observed durations of the test, oldest first.
+            server_average (number): the server's average, None if unknown.
+
+        Returns:
+            number: expected duration in seconds, None if unknown.
+        """
+        if not samples:
+            return server_average
+
+        local = self.estimator(samples)
+        if not server_average:
+            return local
+
+        return (server_average * self.SERVER_WEIGHT +
+                local * len(samples)) / (self.SERVER_WEIGHT + len(samples))
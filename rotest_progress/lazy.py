@@ -0,0 +1,58 @@
+"""Stand-ins for the result handlers, importing them only when used.
+
+Rotest loads the classes of all the registered result handlers on every run,
+so the entry points refer to these classes instead of the handlers
+themselves. The handlers' modules, along with their heavy dependencies
+(e.g. tkinter and tqdm), are imported only when a handler is actually
+chosen, and a missing dependency of an unused handler never breaks the run.
+"""
+from __future__ import absolute_import
+
+from importlib import import_module
+
+
+class LazyHandler(object):
+    """Result handler class that's imported when it's instantiated.
+
+    Instantiating a subclass returns an instance of the real handler.
+
+    Attributes:
+        NAME (str): name of the handler.
+        HANDLER (str): the handler's module, relative to the package, and
+            class name, separated by a colon.
+    """
+    NAME = NotImplemented
+    HANDLER = NotImplemented
+
+    def __new__(cls, *args, **kwargs):
+        return cls.load()(*args, **kwargs)
+
+    @classmethod
+    def load(cls):
+        """Import the real handler class."""
+        module_name, class_name = cls.HANDLER.split(":")
+        return getattr(import_module(module_name, __package__), class_name)
+
+
+class LazyCurrentProgressHandler(LazyHandler):
+    """Stand-in for the CurrentProgressHandler."""
+    NAME = 'progress'
+    HANDLER = '.current_progress:CurrentProgressHandler'
+
+
+class LazyFullProgressHandler(LazyHandler):
+    """Stand-in for the FullProgressHandler."""
+    NAME = 'full_progress'
+    HANDLER = '.full_progress:FullProgressHandler'
+
+
+class LazyTkinterProgressHandler(LazyHandler):
+    """Stand-in for the TkinterProgressHandler."""
+    NAME = 'tk_progress'
+    HANDLER = '.popup_progress:TkinterProgressHandler'
+
+
+class LazyWebProgressHandler(LazyHandler):
+    """Stand-in for the WebProgressHandler."""
+    NAME = 'web_progress'
+    HANDLER = '.web_progress:WebProgressHandler'
@@ -0,0 +1,153 @@
+"""Line oriented progress summaries, for logs of runs without a terminal."""
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+from __future__ import absolute_import
+
+from rotest.core.models.case_data import TestOutcome
+
+from .engine import clock
+from .config import get_setting
+from .utils import format_finish_time
+
+MODE_AUTO, MODE_TERMINAL, MODE_LINES = "auto", "terminal", "lines"
+
+
+def use_line_mode(stream):
+    """Return whether to print summary lines instead of drawing bars.
+
+    The mode is set by ``ROTEST_PROGRESS_MODE``, by default lines are used
+    when the stream isn't a terminal, e.g. when it's piped to a CI log.
+    """
+    mode = get_setting("MODE", MODE_AUTO).lower()
+    if mode != MODE_AUTO:
+        return mode == MODE_LINES
+
+    try:
+        return not stream.isatty()
+
+    except (AttributeError, ValueError):
+        return True
+
+
+def format_value(value):
+    """Return a value as it should appear in a logfmt record."""
+    if isinstance(value, float):
+        return "{:.1f}".format(value)
+
+    value = str(value)
+    if not value or any(char in value for char in ' ="'):
+        return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+    return value
+
+
+def format_record(event, **fields):
+    """Return a single line logfmt record of a progress event."""
+    return " ".join(["rotest_progress", "event=" + event] +
+                    ["{}={}".format(key, format_value(value))
+                     for key, value in sorted(fields.items())]) + "\n"
+
+
+class LineRenderer(object):
+    """Prints progress summaries as structured single line records.
+
+    Instead of redrawing bars, a summary of the run is printed when it
+    starts, when it ends, every INTERVAL seconds and every PERCENT_STEP of
+    the run's expected time. Each summary also has a line for every top
+    level suite that advanced since the previous one.
+    The records are in logfmt, e.g.
+    ``rotest_progress event=progress done=45.2 eta=78.0 tests=120/300 ...``
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        stream (file): stream to print to.
+        interval (number): seconds between summaries.
+        percent_step (number): percents of the run between summaries.
+        timer (function): returns the current time in seconds, e.g. the
+            time of the replayed event when replaying a run.
+    """
+    def __init__(self, state, stream, interval=None, percent_step=None,
+                 timer=clock):
+        self.state = state
+        self.stream = stream
+        self.interval = get_setting("LOG_INTERVAL", 30.0, float) \
+            if interval is None else interval
+        self.percent_step = get_setting("LOG_PERCENT", 10.0, float) \
+            if percent_step is None else percent_step
+
+        self.timer = timer
+        self.failed = 0
+        self.suites = [index for index in state.children(0)
+                       if state.is_complex(index)]
+        self._reported = {}
+        self._start_time = timer()
+        self._last_time = None
+        self._next_percent = 0.0
+
+    def get_percent(self, index):
+        """Return how much of the node's expected time has passed."""
+        if self.state.states[index] == self.state.FINISHED:
+            return 100.0
+
+        return 100.0 * self.state.progress[index] / \
+            max(self.state.weights[index], 1e-9)
+
+    def start_bar(self, index):
+        """Nothing to print when a test starts."""
+        pass
+
+    def update_bar(self, index):
+        """Nothing to print when a bar moves."""
+        pass
+
+    def finish_bar(self, index):
+        """Count the failed tests."""
+        if not self.state.is_complex(index) and \
+                self.state.get_outcome(index) not in \
+                TestOutcome.POSITIVE_RESULTS:
+
+            self.failed += 1
+
+    def _summarize(self, event):
+        """Print the summary of the run and its suites that advanced."""
+        state = self.state
+        now = self.timer()
+        percent = self.get_percent(0)
+        lines = [format_record(
+            event, done=percent,
+            tests="{}/{}".format(state.finished_leaves[0],
+                                 state.leaf_counts[0]),
+            failed=self.failed, elapsed=now - self._start_time,
+            eta=state.get_remaining_time(),
+            finish=format_finish_time(state))]
+
+        for index in self.suites:
+            suite_percent = self.get_percent(index)
+            if self._reported.get(index) != suite_percent:
+                self._reported[index] = suite_percent
+                lines.append(format_record(
+                    "suite", name=state.tests[index].data.name,
+                    done=suite_percent,
+                    tests="{}/{}".format(state.finished_leaves[index],
+                                         state.leaf_counts[index])))
+
+        self.stream.write("".join(lines))
+        self.stream.flush()
+        self._last_time = now
+        if self.percent_step > 0:
+            self._next_percent = (percent // self.percent_step + 1) * \
+                self.percent_step
+
+    def redraw(self):
+        """Print a summary if it's time for one."""
+        if self._last_time is None:
+            self._summarize("start")
+
+        elif self.timer() - self._last_time >= self.interval or \
+                (self.percent_step > 0 and
+                 self.get_percent(0) >= self._next_percent):
+
+            self._summarize("progress")
+
+    def finish_run(self):
+        """Print the final summary."""
+        self._summarize("stop")
@@ -0,0 +1,280 @@
+"""Opt-in instrumentation of the progress handlers' hot paths.
+
+The metrics are only collected if ``ROTEST_PROGRESS_METRICS_DIR`` is set,
+and are written there at the end of the run both as JSON and as a textfile
+for Prometheus' node exporter.
+"""
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import threading
+
+from .config import get_setting
+from .streams import StreamProxy
+
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+                   5.0)
+RATIO_BUCKETS = (0.25, 0.5, 0.8, 0.9, 1.1, 1.25, 2.0, 4.0)
+
+clock = getattr(time, "perf_counter", time.time)
+replace_file = getattr(os, "replace", os.rename)
+
+
+class Histogram(object):
+    """Distribution of observed values over fixed buckets.
+
+    Attributes:
+        buckets (tuple): upper bounds of the buckets, ascending.
+        counts (list): amount of values that fell in each bucket, the last
+            one counts the values above all the bounds.
+        count (number): amount of observed values.
+        sum (number): sum of the observed values.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add a value to the distribution."""
+        for bucket, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+
+        else:
+            bucket = len(self.buckets)
+
+        self.counts[bucket] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """Return the bounds and the amount of values up to each of them."""
+        total = 0
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            yield bound, total
+
+
+class Timer(object):
+    """Context that observes its duration into a histogram of the metrics."""
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, clock() - self.start, **self.labels)
+
+
+class NullTimer(object):
+    """Timer to use when the metrics are off, so the hot paths stay cheap."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics(object):
+    """Thread safe store of counters, gauges and histograms.
+
+    Every metric is identified by its name and its labels, given as keyword
+    arguments. When the metrics are disabled all the methods do nothing.
+
+    Attributes:
+        directory (str): where to export the metrics, None to disable them.
+        counters (dict): values of the counters, by name and labels.
+        gauges (dict): values of the gauges, by name and labels.
+        histograms (dict): the histograms, by name and labels.
+    """
+    PREFIX = "rotest_progress_"
+    JSON_FILE = "rotest_progress_metrics.json"
+    TEXTFILE = "rotest_progress.prom"
+
+    def __init__(self, directory=None):
+        self.directory = directory or None
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Whether the metrics are collected."""
+        return self.directory is not None
+
+    def increment(self, name, amount=1, **labels):
+        """Add to the value of a counter."""
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """Set the value of a gauge."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Add a value to a histogram."""
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Return a context that observes its duration in seconds."""
+        if not self.enabled:
+            return NULL_TIMER
+
+        return Timer(self, name, labels)
+
+    def reset(self):
+        """Remove all the collected values."""
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        """Return the collected values in a JSON serializable form."""
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels),
+                              "value": value}
+                             for (name, labels), value
+                             in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels),
+                            "value": value}
+                           for (name, labels), value
+                           in sorted(self.gauges.items())],
+                "histograms": [{"name": name, "labels": dict(labels),
+                                "count": histogram.count,
+                                "sum": histogram.sum,
+                                "buckets": dict(
+                                    histogram.cumulative_counts())}
+                               for (name, labels), histogram
+                               in sorted(self.histograms.items())],
+            }
+
+    @staticmethod
+    def _format_labels(labels, **extra):
+        """Return the labels of a sample in Prometheus' text format."""
+        labels = sorted(labels + tuple(extra.items()))
+        if not labels:
+            return ""
+
+        return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace(
+            '\\', '\\\\').replace('"', '\\"')) for key, value in labels)
+
+    def to_prometheus(self):
+        """Return the collected values in Prometheus' text format."""
+        lines = []
+        typed = set()
+        with self._lock:
+            for kind, values in (("counter", self.counters),
+                                 ("gauge", self.gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    name = self.PREFIX + name
+                    if name not in typed:
+                        typed.add(name)
+                        lines.append("# TYPE %s %s" % (name, kind))
+
+                    lines.append("%s%s %r" % (
+                        name, self._format_labels(labels), value))
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                name = self.PREFIX + name
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE %s histogram" % name)
+
+                for bound, count in histogram.cumulative_counts():
+                    lines.append("%s_bucket%s %d" % (
+                        name, self._format_labels(labels, le=bound), count))
+
+                lines.append("%s_sum%s %r" % (
+                    name, self._format_labels(labels), histogram.sum))
+                lines.append("%s_count%s %d" % (
+                    name, self._format_labels(labels), histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+    def _write(self, file_name, content):
+        """Write the file at once, so collectors never read half of it."""
+        path = os.path.join(self.directory, file_name)
+        temporary_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary_path, "w") as metrics_file:
+            metrics_file.write(content)
+
+        replace_file(temporary_path, path)
+
+    def export(self):
+        """Write the metrics to the directory as JSON and for Prometheus."""
+        if not self.enabled:
+            return
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            self._write(self.JSON_FILE,
+                        json.dumps(self.to_dict(), indent=2, sort_keys=True))
+            self._write(self.TEXTFILE, self.to_prometheus())
+
+        except (IOError, OSError):
+            pass
+
+
+class MeteredStream(StreamProxy):
+    """Stream wrapper that counts the bytes written through it.
+
+    Attributes:
+        handler (str): name of the handler writing to the stream.
+    """
+    def __init__(self, stream, handler):
+        super(MeteredStream, self).__init__(stream, self.count)
+        self.handler = handler
+
+    def count(self, string, _):
+        """Count the bytes of a write."""
+        if string:
+            METRICS.increment("written_bytes_total",
+                              len(string.encode("utf-8", "replace")),
+                              handler=self.handler)
+
+
+def metered(stream, handler):
+    """Return the stream, counting its written bytes if metrics are on."""
+    if not METRICS.enabled:
+        return stream
+
+    return MeteredStream(stream, handler)
+
+
+METRICS = Metrics(get_setting("METRICS_DIR", None))
@@ -0,0 +1,346 @@
+"""Ordering of the run's tests by their expected durations.
+
+Enabled by setting ``ROTEST_PROGRESS_ORDER`` to one of:
+
+* longest - longest tests first, so on parallel runs a long test doesn't
+  start last and hold the whole run (the LPT heuristic).
+* shortest - shortest tests first, for fast feedback.
+
+Only the components of suites are reordered, the blocks of flows keep their
+order. A suite can keep its components' order by setting KEEP_ORDER, and a
+component can set DEPENDS_ON to the classes (or names) of sibling
+components it must run after.
+"""
+# pylint: disable=protected-access
+from __future__ import absolute_import
+
+import time
+import heapq
+import threading
+
+from rotest.common import core_log
+from rotest.core.suite import TestSuite
+
+from .config import get_setting
+from .state import ProgressState
+from .utils import StatisticManager
+from .resolver import StatisticsResolver
+
+
+ORDER_NONE, ORDER_LONGEST, ORDER_SHORTEST = "none", "longest", "shortest"
+
+
+class TestPlan(object):
+    """The planned order of a run and its predicted duration.
+
+    The duration is predicted by assigning the tests, in their running
+    order, to the first free worker, as rotest's multiprocess runner does.
+
+    Attributes:
+        strategy (str): ORDER_LONGEST or ORDER_SHORTEST.
+        workers (number): amount of workers the tests run on.
+        jobs (list): the cases and flows in running order, as tuples of
+            their name and expected seconds.
+        duration (number): predicted seconds for the whole run.
+        finish_time (number): predicted end of the run, in seconds since the
+            epoch.
+    """
+    def __init__(self, strategy, workers, jobs):
+        self.strategy = strategy
+        self.workers = workers
+        self.jobs = jobs
+
+        free_times = [0.0] * workers
+        for _, expected in jobs:
+            heapq.heappush(free_times,
+                           heapq.heappop(free_times) + expected)
+
+        self.duration = max(free_times)
+        self.finish_time = time.time() + self.duration
+
+    def log(self, logger):
+        """Write the plan to a logger, the order itself in debug level."""
+        logger.info("Running %d tests %s first on %d worker(s), predicted to "
+                    "finish at %s", len(self.jobs), self.strategy,
+                    self.workers, time.strftime("%H:%M:%S",
+                                                time.localtime(
+                                                    self.finish_time)))
+
+        for position, (name, expected) in enumerate(self.jobs, 1):
+            logger.debug("Planned #%d: %s (%.1f seconds)", position, name,
+                         expected)
+
+
+def get_leaf_names(test):
+    """Return the unique names of the leaves of the tree."""
+    names = set()
+    tests = [test]
+    while tests:
+        test = tests.pop()
+        if test.IS_COMPLEX:
+            tests.extend(test)
+
+        else:
+            names.add(test.data.name)
+
+    return list(names)
+
+
+def get_dependencies(test, siblings):
+    """Return the siblings a component has to run after.
+
+    Args:
+        test (AbstractTest): the component.
+        siblings (list): the components of its suite.
+    """
+    depends_on = getattr(test, "DEPENDS_ON", ())
+    if not depends_on:
+        return []
+
+    return [sibling for sibling in siblings if sibling is not test and
+            (sibling.__class__ in depends_on or
+             sibling.__class__.__name__ in depends_on or
+             sibling.data.name in depends_on)]
+
+
+def order_components(components, keys):
+    """Sort the components of a suite by their keys, keeping dependencies.
+
+    Among the components whose dependencies already ran, the one with the
+    lowest key runs next. A dependency is as urgent as the most urgent
+    component waiting for it, so a long test isn't delayed by a short test
+    it depends on. Components in a dependency cycle keep their original
+    order, after the rest.
+
+    Args:
+        components (list): the components in their original order.
+        keys (dict): map of each component's id to its sort key.
+
+    Returns:
+        list: the components in their new order.
+    """
+    dependencies = {id(test): set(id(dependency) for dependency in
+                                  get_dependencies(test, components))
+                    for test in components}
+
+    urgencies = dict(keys)
+    for _ in components:
+        changed = False
+        for test in components:
+            for dependency in dependencies[id(test)]:
+                if urgencies[id(test)] < urgencies[dependency]:
+                    urgencies[dependency] = urgencies[id(test)]
+                    changed = True
+
+        if not changed:
+            break
+
+    remaining = sorted(components, key=lambda test: (urgencies[id(test)],
+                                                     keys[id(test)]))
+    ordered = []
+    placed = set()
+    while remaining:
+        position = next((position for position, test in enumerate(remaining)
+                         if dependencies[id(test)] <= placed), None)
+        if position is None:
+            ordered.extend(test for test in components
+                           if id(test) not in placed)
+            break
+
+        test = remaining.pop(position)
+        ordered.append(test)
+        placed.add(id(test))
+
+    return ordered
+
+
+class TestOrderer(object):
+    """Reorders the components of the suites of a run.
+
+    Components with leaves whose statistics weren't resolved in time keep
+    their original order, after the rest.
+
+    Attributes:
+        strategy (str): ORDER_LONGEST or ORDER_SHORTEST.
+        estimates (dict): map of the leaves' names to their expected seconds,
+            None for leaves without statistics.
+        unresolved (set): names of the leaves whose statistics weren't
+            resolved.
+    """
+    def __init__(self, strategy, estimates, unresolved=()):
+        self.strategy = strategy
+        self.estimates = estimates
+        self.unresolved = set(unresolved)
+
+    def get_expected(self, name):
+        """Return the expected seconds of a leaf, the default if unknown."""
+        expected = self.estimates.get(name)
+        return expected if expected else ProgressState.DEFAULT_EXPECTED_TIME
+
+    def measure(self, test, sizes):
+        """Sum up the expected seconds of a test and its longest leaf.
+
+        Args:
+            test (AbstractTest): test to measure, after its sub tests.
+            sizes (dict): map of each measured test's id to its total and
+                longest leaf's seconds, and whether any of its leaves is
+                unresolved.
+        """
+        if not test.IS_COMPLEX:
+            expected = self.get_expected(test.data.name)
+            sizes[id(test)] = (expected, expected,
+                               test.data.name in self.unresolved)
+            return
+
+        total, longest, unresolved = 0.0, 0.0, False
+        for sub_test in test:
+            sub_total, sub_longest, sub_unresolved = sizes[id(sub_test)]
+            total += sub_total
+            longest = max(longest, sub_longest)
+            unresolved = unresolved or sub_unresolved
+
+        sizes[id(test)] = (total, longest, unresolved)
+
+    def get_key(self, size, position):
+        """Return the sort key of a component by its size.
+
+        Longest first puts the components with the longest single tests
+        first, since those decide when a parallel run ends. Unresolved
+        components go last, by their original position.
+        """
+        total, longest, unresolved = size
+        if unresolved:
+            return (1, position)
+
+        if self.strategy == ORDER_LONGEST:
+            return (0, -longest, -total)
+
+        return (0, total)
+
+    def reorder(self, main_test):
+        """Reorder the suites of the tree, bottom up.
+
+        Returns:
+            list: the cases and flows in their new running order, as tuples
+                of their name and expected seconds.
+        """
+        pre_order = []
+        tests = [main_test]
+        while tests:
+            test = tests.pop()
+            pre_order.append(test)
+            if test.IS_COMPLEX:
+                tests.extend(test)
+
+        sizes = {}
+        for test in reversed(pre_order):
+            self.measure(test, sizes)
+            if isinstance(test, TestSuite) and \
+                    not getattr(test, "KEEP_ORDER", False):
+
+                test._tests[:] = order_components(
+                    list(test),
+                    {id(sub_test): self.get_key(sizes[id(sub_test)],
+                                                position)
+                     for position, sub_test in enumerate(test)})
+
+        jobs = []
+        tests = [main_test]
+        while tests:
+            test = tests.pop()
+            if isinstance(test, TestSuite):
+                tests.extend(reversed(list(test)))
+
+            else:
+                jobs.append((test.data.name, sizes[id(test)][0]))
+
+        return jobs
+
+
+_PLANS = {}
+_PLANS_LOCK = threading.Lock()
+
+
+def prefetch_with_deadline(main_test, deadline):
+    """Resolve the statistics of the run's leaves, up to a deadline.
+
+    The resolution goes on in the background after the deadline, under the
+    resolvers' lock, so their resolvers wait for it and find the names
+    cached.
+
+    Args:
+        main_test (AbstractTest): the run's main test.
+        deadline (number): seconds to wait for the statistics.
+
+    Returns:
+        set: names of the leaves that weren't resolved in time.
+    """
+    names = StatisticManager.collect_leaf_names(main_test)
+
+    def resolve():
+        """Resolve the names, unless the resolvers already did."""
+        with StatisticsResolver.LOCK:
+            missing = {name: resource_manager
+                       for name, resource_manager in names.items()
+                       if name not in StatisticManager.STATISTICS_CACHE}
+            if missing:
+                StatisticManager.resolve_statistics(missing)
+
+    thread = threading.Thread(target=resolve)
+    thread.setDaemon(True)
+    thread.start()
+    thread.join(deadline)
+    return set(name for name in names
+               if name not in StatisticManager.STATISTICS_CACHE)
+
+
+def plan_run(main_test, strategy=None, workers=None, deadline=None):
+    """Reorder the run's tests once, before any handler draws them.
+
+    Every handler calls it when the run starts, the first call reorders the
+    tests and the rest get the same plan. The statistics are waited for up
+    to the resolvers' deadline, so a slow or hung server delays the run's
+    start by at most that.
+
+    Args:
+        main_test (AbstractTest): the run's main test.
+        strategy (str): ORDER_NONE, ORDER_LONGEST or ORDER_SHORTEST, None to
+            use ``ROTEST_PROGRESS_ORDER``.
+        workers (number): amount of workers the tests run on, None to use
+            ``ROTEST_PROGRESS_WORKERS``.
+        deadline (number): seconds to wait for the statistics, None to use
+            the resolvers' deadline.
+
+    Returns:
+        TestPlan: the plan of the run, None if ordering is disabled.
+    """
+    if strategy is None:
+        strategy = get_setting("ORDER", ORDER_NONE).lower()
+
+    if strategy not in (ORDER_LONGEST, ORDER_SHORTEST):
+        return None
+
+    with _PLANS_LOCK:
+        if main_test.identifier not in _PLANS:
+            if workers is None:
+                workers = get_setting("WORKERS", 1, int)
+
+            if deadline is None:
+                deadline = StatisticsResolver.DEADLINE
+
+            unresolved = prefetch_with_deadline(main_test, deadline)
+            if unresolved:
+                core_log.warning("The statistics of %d tests weren't "
+                                 "resolved in %s seconds, they keep their "
+                                 "order", len(unresolved), deadline)
+
+            orderer = TestOrderer(strategy,
+                                  StatisticManager.get_estimates(
+                                      get_leaf_names(main_test)),
+                                  unresolved)
+            plan = TestPlan(strategy, max(workers, 1),
+                            orderer.reorder(main_test))
+            plan.log(core_log)
+            _PLANS[main_test.identifier] = plan
+
+        return _PLANS[main_test.identifier]
@@ -0,0 +1,192 @@
+"""Accounting for the wall time the tests spend paused."""
+# pylint: disable=too-many-instance-attributes
+from __future__ import absolute_import
+
+import sys
+import time
+import signal
+import threading
+from collections import deque
+
+
+clock = getattr(time, "monotonic", time.time)
+
+# Packages of the debuggers and their prompts, and the functions in which
+# they wait for the user
+DEBUGGER_PACKAGES = ("bdb", "pdb", "cmd", "ipdb", "IPython", "pydevd",
+                     "_pydevd_bundle", "debugpy", "pudb")
+INTERACTION_FUNCTIONS = ("interaction", "cmdloop", "_cmdloop",
+                         "do_wait_suspend", "_do_wait_suspend")
+
+
+class PauseDetector(object):
+    """Detects pauses of the tests, and a clock that stands still in them.
+
+    Two kinds of pauses are detected, on every 'check':
+
+    * A debugger waiting for the user: the stacks of the threads running
+      tests are looked up for a debugger's interaction loop (pdb, ipdb,
+      pudb and pydevd based ones), regardless of how the debugger is hooked
+      (sys.settrace, threading.settrace, sys.setprofile or sys.monitoring).
+      Nothing is hooked into the interpreter, so tests that aren't debugged
+      run at full speed. A debugger waiting for the user stands still, so
+      the stacks are only looked at once a frame, and only those of the
+      threads that didn't move since the previous look, once until they
+      move again.
+    * The process being stopped (SIGSTOP or Ctrl+Z): a SIGCONT handler
+      marks the resume, and the longest gap between the last checks, made
+      at least every frame of the engine while tests run, counts as paused.
+
+    A pause is assumed to start and end halfway between the checks that
+    noticed it, so it's accurate to about half a frame.
+
+    Attributes:
+        paused_time (number): seconds spent in pauses that ended.
+        paused_since (number): when the current debugger pause started,
+            None if there's none.
+        threads (set): identifiers of the threads that run tests.
+    """
+    MAX_DEPTH = 64
+    GAPS = 4
+
+    def __init__(self):
+        self.paused_time = 0.0
+        self.paused_since = None
+        self.threads = set()
+        self._last_check = clock()
+        self._gaps = deque(maxlen=self.GAPS)
+        self._continued = None
+        self._positions = {}
+        self._installed = False
+        self._lock = threading.Lock()
+
+    def install(self):
+        """Handle SIGCONT, once and if possible, keeping the old handler.
+
+        Signal handlers can only be set from the main thread, and only
+        where there's SIGCONT, the process' resumes aren't noticed
+        otherwise.
+        """
+        if self._installed or not hasattr(signal, "SIGCONT"):
+            return
+
+        self._installed = True
+        try:
+            previous = signal.getsignal(signal.SIGCONT)
+
+            def on_continue(signum, frame):
+                """Mark the resume of the process."""
+                self._continued = clock()
+                if callable(previous):
+                    previous(signum, frame)
+
+            signal.signal(signal.SIGCONT, on_continue)
+
+        except ValueError:  # Not the main thread
+            pass
+
+    def watch(self):
+        """Look for debuggers in the calling thread's stack too."""
+        self.threads.add(threading.current_thread().ident)
+
+    def _in_interaction(self, frame):
+        """Return whether a debugger's interaction loop is in the stack."""
+        depth = 0
+        while frame is not None and depth < self.MAX_DEPTH:
+            if frame.f_code.co_name in INTERACTION_FUNCTIONS and \
+                    frame.f_globals.get("__name__", "").split(".")[0] \
+                    in DEBUGGER_PACKAGES:
+
+                return True
+
+            frame = frame.f_back
+            depth += 1
+
+        return False
+
+    def find_debugger(self, middle):
+        """Return since when a debugger is waiting in a watched thread.
+
+        Args:
+            middle (number): time between the previous look and this one.
+
+        Returns:
+            number: when the debugger started waiting, None if none is.
+        """
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        positions = {}
+        since = None
+        for thread_id in self.threads:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+
+            position = (id(frame.f_code), id(frame), frame.f_lasti)
+            previous = self._positions.get(thread_id)
+            if previous is None or previous[0] != position:
+                waiting, still_since = None, middle
+
+            else:
+                _, waiting, still_since = previous
+                if waiting is None:
+                    waiting = self._in_interaction(frame)
+
+            positions[thread_id] = (position, waiting, still_since)
+            if waiting and (since is None or still_since < since):
+                since = still_since
+
+        self._positions = positions
+        return since
+
+    def check(self, running=True, inspect=True):
+        """Update the paused time.
+
+        Args:
+            running (bool): whether tests have been running since the
+                previous check, only then its gap may be a pause.
+            inspect (bool): whether to look for a debugger that started
+                waiting, otherwise only the end of a pause is looked for.
+
+        Returns:
+            bool: whether the tests are paused by a debugger.
+        """
+        with self._lock:
+            now = clock()
+            if running:
+                self._gaps.append((self._last_check, now))
+
+            continued, self._continued = self._continued, None
+            if continued is not None and self.paused_since is None and \
+                    self._gaps:
+
+                start, end = max(self._gaps,
+                                 key=lambda gap: gap[1] - gap[0])
+                self.paused_time += min(end, continued) - start
+                self._gaps.clear()
+
+            middle = (self._last_check + now) / 2
+            since = self.find_debugger(middle) \
+                if inspect or self.paused_since is not None else None
+            debugging = since is not None
+            if debugging and self.paused_since is None:
+                self.paused_since = since
+
+            elif not debugging and self.paused_since is not None:
+                self.paused_time += middle - self.paused_since
+                self.paused_since = None
+
+            self._last_check = now
+            return debugging
+
+    def clock(self):
+        """Return the time in seconds, on a clock that stops in pauses.
+
+        It moves back when a stop of the process, or a debugger, is noticed
+        after the fact.
+        """
+        now = self.paused_since if self.paused_since is not None \
+            else clock()
+        return now - self.paused_time
+
+
+PAUSES = PauseDetector()
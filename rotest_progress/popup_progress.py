@@ -1,159 +1,240 @@
 """Module for the TkinterHandler and its logic."""
-# pylint: disable=protected-access, ungrouped-imports
+# pylint: disable=ungrouped-imports,too-many-instance-attributes
 from __future__ import absolute_import
 
-import time
 import tkinter
 import threading
-from itertools import count
 from tkinter.ttk import Progressbar, Style
 
-from tkscrolledframe import ScrolledFrame
-from rotest.core.models.case_data import TestOutcome
 from rotest.core.result.handlers.abstract_handler import AbstractResultHandler
 
-from .utils import (get_test_outcome, wrap_settrace, go_over_tests,
-                    StatisticManager)
+from .state import ProgressState
+from .budget import BUDGET
+from .engine import ProgressEngine
+from .ordering import plan_run
+from .metrics import METRICS
+from .resolver import StatisticsResolver
+from .utils import (format_eta, get_description, OUTCOME_TO_STYLE,
+                    RUNNING_COLOR)
 
 
-# Map test result to HTML color code
-OUTCOME_TO_STYLE = {None: 'white',
-                    TestOutcome.SUCCESS: 'green',
-                    TestOutcome.ERROR: 'maroon',
-                    TestOutcome.EXPECTED_FAILURE: 'FUCHSIA',
-                    TestOutcome.FAILED: 'red',
-                    TestOutcome.SKIPPED: 'yellow',
-                    TestOutcome.UNEXPECTED_SUCCESS: 'AQUA'}
+RUNNING_STYLE = "Running.Horizontal.TProgressbar"
+STYLE_FORMAT = "Outcome{}.Horizontal.TProgressbar"
 
 
 class TkinterThread(threading.Thread):
-    """Thread responsible for creating and running the Tkinter window."""
+    """Thread responsible for creating and running the Tkinter window.
+
+    Also serves as the renderer of the progress engine. Widgets may only be
+    touched by the Tk thread, so the engine only marks the tests whose bars
+    changed, and the window applies them in a batch every frame, paced by
+    the refresh budget like the terminal handlers.
+    The tree is drawn on a canvas, and the row of each test is created only
+    once it's scrolled into view.
+    The bars share a fixed set of styles, one for each outcome.
+    Bars of tests whose statistics are still pending are indeterminate, and
+    become determinate once they're resolved.
+    """
     CREATE_WINDOW_TIMEOUT = 5  # Seconds
+    FRAME_INTERVAL = 50  # Milliseconds
     WINDOW_HEIGHT = 500  # Pixels
+    WINDOW_WIDTH = 600  # Pixels
+    ROW_HEIGHT = 24  # Pixels
+    INDENT = 16  # Pixels
     BAR_WIDTH = 100  # Pixels
 
-    def __init__(self, test):
+    def __init__(self, state):
         super(TkinterThread, self).__init__()
-        self.test = test
+        self.state = state
         self.setDaemon(True)
         self.finish_preperation_event = threading.Event()
-        self.frame = None
-        self.inner_frame = None
-
-    def iterate_over_tests(self, test, window, depth=0, row=count()):
-        """Recursively populate the given frame with the tests' widgets."""
-        self.create_tree_bar(test, window, depth, next(row))
-        if test.IS_COMPLEX:
-            for sub_test in test:
-                self.iterate_over_tests(sub_test, window, depth + 1, row)
-
-    def create_tree_bar(self, test, window, depth, row):
-        """Create progress bar for a test in an hierarchical form."""
-        name = test.data.name
-        if test.IS_COMPLEX:
-            total = test._expected_time
-
-        else:
-            avg_time = test._expected_time
-            if avg_time:
-                total = int(avg_time) * 10
-
-            else:
-                total = 10
-                name += " (No statistics)"
-
-        label = tkinter.Label(window, text=name, height=1)
+        self.window = None
+        self.canvas = None
+        self.scrollbar = None
+        self.bars = {}
+        self.labels = {}
+        self.indeterminate = set()
+        self.overruns = set()
+        self._changed = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def create_styles():
+        """Configure the styles of the bars, one for each outcome."""
         style = Style()
         style.theme_use('clam')
-        style_name = "{}.Horizontal.TProgressbar".format(test.identifier)
-        style.configure(style_name, foreground='red', background='red')
-        progress = Progressbar(window, orient=tkinter.HORIZONTAL,
-                               maximum=total, length=self.BAR_WIDTH,
-                               mode='determinate', style=style_name)
+        style.configure(RUNNING_STYLE, foreground=RUNNING_COLOR,
+                        background=RUNNING_COLOR)
+        for outcome, color in OUTCOME_TO_STYLE.items():
+            style.configure(STYLE_FORMAT.format(outcome),
+                            foreground=color, background=color)
 
-        test.progress_bar = ProgressContainer(test, progress, style_name)
+    def get_style(self, index):
+        """Return the name of the style of the test's bar."""
+        if self.state.states[index] != self.state.FINISHED:
+            return RUNNING_STYLE
 
-        label.grid(column=depth, row=row)
-        progress.grid(column=depth + 1, row=row)
+        return STYLE_FORMAT.format(self.state.get_outcome(index))
 
-    def run(self):
-        """Create a Tkinter window, populate it with widgets, and run it."""
-        window = tkinter.Tk()
-        window.resizable(False, False)
-        self.frame = ScrolledFrame(window, scrollbars="vertical",
-                                   height=self.WINDOW_HEIGHT)
-        self.frame.pack()
-        self.inner_frame = self.frame.display_widget(tkinter.Frame)
-        self.iterate_over_tests(self.test, self.inner_frame)
-        self.finish_preperation_event.set()
-        window.mainloop()
+    def create_tree_bar(self, index):
+        """Create progress bar for a test in an hierarchical form."""
+        row = tkinter.Frame(self.canvas)
+        label = tkinter.Label(row, text=get_description(self.state, index),
+                              height=1)
+        progress = Progressbar(row, orient=tkinter.HORIZONTAL,
+                               length=self.BAR_WIDTH)
+
+        label.pack(side=tkinter.LEFT)
+        progress.pack(side=tkinter.LEFT)
+        self.canvas.create_window(self.state.depths[index] * self.INDENT,
+                                  index * self.ROW_HEIGHT, window=row,
+                                  anchor=tkinter.NW)
+        self.labels[index] = label
+        self.bars[index] = progress
+        self.refresh_bar(index)
+
+    def refresh_bar(self, index):
+        """Show the current state of the test's bar."""
+        progress = self.bars[index]
+        state = self.state
+        if state.overruns[index] and index not in self.overruns:
+            self.overruns.add(index)
+            self.labels[index].configure(text=get_description(state, index))
+
+        if state.is_pending(index) and state.states[index] != state.FINISHED:
+            if index not in self.indeterminate:
+                self.indeterminate.add(index)
+                progress.configure(mode='indeterminate',
+                                   style=self.get_style(index))
+
+            if state.states[index] == state.RUNNING:
+                progress.start(self.FRAME_INTERVAL)
+
+            return
+
+        if index in self.indeterminate:
+            self.indeterminate.discard(index)
+            progress.stop()
+            self.labels[index].configure(text=get_description(state, index))
+
+        progress.configure(mode='determinate', maximum=state.totals[index],
+                           value=state.values[index],
+                           style=self.get_style(index))
+
+    def show_visible_rows(self):
+        """Create the rows that are scrolled into view."""
+        top = int(self.canvas.canvasy(0))
+        bottom = top + max(self.canvas.winfo_height(), self.WINDOW_HEIGHT)
+        for index in range(max(top // self.ROW_HEIGHT, 0),
+                           min(bottom // self.ROW_HEIGHT + 1,
+                               len(self.state))):
+            if index not in self.bars:
+                self.create_tree_bar(index)
+
+    def on_scroll(self, first, last):
+        """Move the scrollbar and fill the newly shown rows."""
+        self.scrollbar.set(first, last)
+        self.show_visible_rows()
+
+    def on_wheel(self, event):
+        """Scroll the canvas by a row using the mouse wheel."""
+        step = -1 if event.num == 4 or event.delta > 0 else 1
+        self.canvas.yview_scroll(step, "units")
+
+    def apply_changes(self):
+        """Redraw the changed bars in a batch, on the Tk thread."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+
+        for index in changed:
+            if index in self.bars:
+                self.refresh_bar(index)
+
+        if 0 in changed:
+            self.window.title(format_eta(self.state))
+
+        self.window.after(int(1000 * BUDGET.get_interval(len(changed))),
+                          self.apply_changes)
+
+    def start_bar(self, index):
+        """Mark the test's bar to be redrawn, to animate it if pending."""
+        self.update_bar(index)
+
+    def update_bar(self, index):
+        """Mark the test's bar to be redrawn in the next batch."""
+        with self._lock:
+            self._changed.add(index)
+
+    def finish_bar(self, index):
+        """Mark the finished test's bar to be filled and colored."""
+        self.update_bar(index)
+
+    def redraw(self):
+        """The changed bars are redrawn by the window's mainloop."""
+        pass
+
+    def finish_run(self):
+        """The window stays open until the process ends."""
+        pass
 
     def start(self):
         """Create and run the window, sync until it's up ready."""
         super(TkinterThread, self).start()
         self.finish_preperation_event.wait(timeout=self.CREATE_WINDOW_TIMEOUT)
-        # Adjust the window's width
-        while self.inner_frame.winfo_width() <= 1:
-            time.sleep(0.01)
-
-        self.frame['width'] = self.inner_frame.winfo_width()
-
 
-class ProgressContainer(object):
-    """Manager for a test's progress bar."""
-    def __init__(self, test, progress_bar, style_name):
-        self.test = test
-        self.progress_bar = progress_bar
-        self.finish = False
-        self.start = False
-        self.total = self.progress_bar['maximum']
-        self.style_name = style_name
-
-    def update_color(self):
-        """Update the progress bar's color according to the test result."""
-        color = OUTCOME_TO_STYLE[get_test_outcome(self.test)]
-        Style().configure(self.style_name, background=color)
-
-    def __iter__(self):
-        value = self.progress_bar['value']
-        while value < self.total:
-
-            if self.finish:
-                self.progress_bar['value'] = self.total
-                self.update_color()
-                return
-
-            self.update_color()
-            yield value
-
-            value += 1
-            self.progress_bar['value'] = value
-
-        self.update_color()
+    def run(self):
+        """Create a Tkinter window with the visible rows, and run it."""
+        self.window = tkinter.Tk()
+        self.window.resizable(False, False)
+        self.create_styles()
+        self.scrollbar = tkinter.Scrollbar(self.window,
+                                           orient=tkinter.VERTICAL)
+        self.canvas = tkinter.Canvas(
+            self.window, width=self.WINDOW_WIDTH, height=self.WINDOW_HEIGHT,
+            highlightthickness=0, yscrollincrement=self.ROW_HEIGHT,
+            scrollregion=(0, 0, self.WINDOW_WIDTH,
+                          len(self.state) * self.ROW_HEIGHT),
+            yscrollcommand=self.on_scroll)
+
+        self.scrollbar.configure(command=self.canvas.yview)
+        self.scrollbar.pack(side=tkinter.RIGHT, fill=tkinter.Y)
+        self.canvas.pack(side=tkinter.LEFT)
+        for event in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.window.bind_all(event, self.on_wheel)
+
+        self.show_visible_rows()
+        self.window.after(self.FRAME_INTERVAL, self.apply_changes)
+        self.finish_preperation_event.set()
+        self.window.mainloop()
 
 
 class TkinterProgressHandler(AbstractResultHandler):
     """TkinterProgressHandler interface."""
     NAME = 'tk_progress'
-    watcher_thread = None
+    engine = None
+    state = None
+    resolver = None
     tkinter_thread = None
 
     def start_test_run(self):
         """Called once before any tests are executed."""
-        wrap_settrace()
-        StatisticManager.calculate_expected_time(self.main_test)
-        self.tkinter_thread = TkinterThread(self.main_test)
+        plan = plan_run(self.main_test)
+        self.state = ProgressState(self.main_test)
+        if plan is not None:
+            self.state.workers = plan.workers
+
+        self.tkinter_thread = TkinterThread(self.state)
         self.tkinter_thread.start()
 
-        self.watcher_thread = threading.Thread(target=go_over_tests,
-                                               kwargs={"test": self.main_test,
-                                                       "use_color": False})
-        self.watcher_thread.setDaemon(True)
-        self.watcher_thread.start()
+        self.engine = ProgressEngine(self.state, self.tkinter_thread,
+                                     self.NAME)
+        self.engine.start()
+        self.resolver = StatisticsResolver(self.engine)
+        self.resolver.start()
 
     def start_test(self, test):
         """Called when the given test is about to be run."""
-        test.progress_bar.start = True
+        self.engine.start_test(test)
 
     def stop_test(self, test):
         """Called when the given test has been run.
@@ -161,8 +242,7 @@ class TkinterProgressHandler(AbstractResultHandler):
         Args:
             test (rotest.core.abstract_test.AbstractTest): test item instance.
         """
-        if test.progress_bar:
-            test.progress_bar.finish = True
+        self.engine.stop_test(test)
 
     def stop_composite(self, test):
         """Called when the given TestSuite has been run.
@@ -174,5 +254,10 @@ class TkinterProgressHandler(AbstractResultHandler):
 
     def stop_test_run(self):
         """Called once after all tests are executed."""
-        if self.watcher_thread:
-            self.watcher_thread.join()
+        if self.resolver:
+            self.resolver.stop()
+
+        if self.engine:
+            self.engine.stop()
+
+        METRICS.export()
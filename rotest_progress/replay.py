@@ -0,0 +1,292 @@
+"""Replay and analysis of the event logs of previous runs.
+
+Run with ``python -m rotest_progress.replay [LOG]``, by default the newest
+log is used. The view of a handler is re-rendered from the log, followed by
+the tests whose duration diverged most from their expected time and the
+timelines of the suites.
+"""
+# pylint: disable=too-many-locals
+from __future__ import absolute_import, print_function
+
+import os
+import sys
+import time
+import argparse
+
+from rotest.core.models.case_data import TestOutcome
+
+from .state import ProgressState
+from .lines import LineRenderer
+from .viewport import TreeViewport
+from .current_progress import CurrentRenderer
+from .eventlog import (RUN_START, START, STOP, ESTIMATE, NO_OUTCOME,
+                       FILE_SUFFIX, get_log_directory, read_event_log)
+
+
+VIEWS = {"full_progress": TreeViewport,
+         "progress": CurrentRenderer,
+         "lines": LineRenderer}
+TIMELINE_WIDTH = 40
+
+
+class ReplayData(object):
+    """Data of a replayed test, like the data of rotest's tests."""
+    def __init__(self, name):
+        self.name = name
+
+
+class ReplayTest(object):
+    """Stand-in for a test of the logged run, enough to build its state.
+
+    Attributes:
+        identifier (number): index of the test in the log.
+        data (ReplayData): holds the name of the test.
+        IS_COMPLEX (bool): whether the test has sub tests.
+        sub_tests (list): the test's sub tests.
+    """
+    def __init__(self, identifier, name, is_complex):
+        self.identifier = identifier
+        self.data = ReplayData(name)
+        self.IS_COMPLEX = is_complex  # pylint: disable=invalid-name
+        self.sub_tests = []
+
+    def __iter__(self):
+        return iter(self.sub_tests)
+
+
+def build_tree(header):
+    """Return the root of the logged tree."""
+    tests = [ReplayTest(index, name, is_complex)
+             for index, (_, name, is_complex) in enumerate(header["tree"])]
+    for index, (parent, _, _) in enumerate(header["tree"]):
+        if parent != ProgressState.NO_PARENT:
+            tests[parent].sub_tests.append(tests[index])
+
+    return tests[0]
+
+
+class Replayer(object):
+    """Applies the logged events to a progress state and a renderer.
+
+    Attributes:
+        state (ProgressState): progress state of the replayed run.
+        renderer (object): renderer of the view, as used by the engine.
+        now (number): time of the last applied event.
+    """
+    def __init__(self, header, renderer_class, stream):
+        self.state = ProgressState(build_tree(header))
+        self.now = header["start"]
+        if renderer_class is LineRenderer:
+            self.renderer = LineRenderer(self.state, stream,
+                                         timer=lambda: self.now)
+
+        else:
+            self.renderer = renderer_class(self.state, stream)
+
+        self._running = {}
+
+    def advance(self, now):
+        """Move the bars of the running tests up to the given time."""
+        for index, started in self._running.items():
+            for moved in self.state.advance(index, now - started):
+                self.renderer.update_bar(moved)
+
+        self.now = now
+
+    def apply(self, record):
+        """Apply a single logged event."""
+        timestamp, event, outcome, index, value = record
+        self.advance(timestamp)
+        if event == START:
+            self.state.start(index)
+            self.renderer.start_bar(index)
+            if not self.state.is_complex(index):
+                self._running[index] = timestamp
+
+        elif event == STOP:
+            self._running.pop(index, None)
+            if value >= 0:
+                self.state.elapsed[index] = value
+
+            moved = self.state.finish(
+                index, None if outcome == NO_OUTCOME else outcome)
+            self.renderer.finish_bar(index)
+            for changed in moved:
+                self.renderer.update_bar(changed)
+
+        elif event == ESTIMATE:
+            for changed in self.state.set_estimate(
+                    index, value if value > 0 else None):
+                self.renderer.update_bar(changed)
+
+    def replay(self, records, speed=0, frame=0.1):
+        """Apply the events, drawing a frame every 'frame' seconds of the run.
+
+        Args:
+            records (list): the logged records.
+            speed (number): how many times faster than the run to replay,
+                0 to draw only the end of the run.
+            frame (number): seconds of the run between frames.
+        """
+        last_frame = self.now
+        for record in records:
+            if speed > 0:
+                while record[0] - last_frame >= frame:
+                    last_frame += frame
+                    self.advance(last_frame)
+                    self.renderer.redraw()
+                    time.sleep(frame / speed)
+
+            self.apply(record)
+
+        self.renderer.redraw()
+        self.renderer.finish_run()
+
+
+def get_divergences(header, records, top=10):
+    """Return the tests whose duration diverged most from their expectation.
+
+    Skipped tests aren't counted.
+
+    Returns:
+        list: tuples of the name, expected and actual seconds of the tests,
+            by the absolute divergence.
+    """
+    expected, actual = {}, {}
+    for _, event, outcome, index, value in records:
+        if event == ESTIMATE and value > 0:
+            expected[index] = value
+
+        elif event == STOP and value >= 0 and \
+                outcome != TestOutcome.SKIPPED and \
+                not header["tree"][index][2]:
+
+            actual[index] = value
+
+    divergences = sorted(((header["tree"][index][1], expected[index],
+                           actual[index])
+                          for index in actual if index in expected),
+                         key=lambda item: -abs(item[2] - item[1]))
+    return divergences[:top]
+
+
+def get_timelines(header, records, depth=1):
+    """Return the timelines of the suites down to the given depth.
+
+    Returns:
+        list: tuples of the name, depth, start and end seconds since the
+            run's start, expected seconds and amount of failed tests of each
+            suite, in the tree's order.
+    """
+    tree = header["tree"]
+    depths = [0] * len(tree)
+    for index, (parent, _, _) in enumerate(tree):
+        if parent != ProgressState.NO_PARENT:
+            depths[index] = depths[parent] + 1
+
+    run_start = header["start"]
+    starts, ends, expected, failed = {}, {}, {}, {}
+    for timestamp, event, outcome, index, value in records:
+        if event == RUN_START:
+            run_start = timestamp
+            continue
+
+        node = index
+        while node != ProgressState.NO_PARENT:
+            if tree[node][2] and depths[node] <= depth:
+                if event == START:
+                    starts.setdefault(node, timestamp)
+
+                elif event == STOP:
+                    ends[node] = timestamp
+                    if node != index and not tree[index][2] and \
+                            outcome not in TestOutcome.POSITIVE_RESULTS:
+
+                        failed[node] = failed.get(node, 0) + 1
+
+                elif event == ESTIMATE and value > 0:
+                    expected[node] = expected.get(node, 0) + value
+
+            node = tree[node][0]
+
+    return [(tree[index][1], depths[index], starts[index] - run_start,
+             ends.get(index, starts[index]) - run_start,
+             expected.get(index, 0.0), failed.get(index, 0))
+            for index in sorted(starts)]
+
+
+def format_timeline(timelines, width=TIMELINE_WIDTH):
+    """Return the suites' timelines as text, with a bar of when each ran."""
+    if not timelines:
+        return "No suites ran\n"
+
+    run_end = max(max(end for _, _, _, end, _, _ in timelines), 1e-9)
+    lines = []
+    for name, depth, start, end, expected, failed in timelines:
+        first = int(start / run_end * width)
+        last = max(int(end / run_end * width), first + 1)
+        lines.append("{:>8.1f}s {:>8.1f}s {:>8.1f}s {:>4} |{}{}{}| {}".format(
+            start, end - start, expected, failed, " " * first,
+            "#" * (last - first), " " * (width - last),
+            "  " * depth + name))
+
+    return "{:>9} {:>9} {:>9} {:>4} |{}|\n".format(
+        "start", "took", "expected", "fail", " " * width) + \
+        "\n".join(lines) + "\n"
+
+
+def get_latest_log(directory):
+    """Return the path of the newest log in the directory, None if none."""
+    try:
+        paths = [os.path.join(directory, name)
+                 for name in os.listdir(directory)
+                 if name.endswith(FILE_SUFFIX)]
+
+    except OSError:
+        return None
+
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def main():
+    """Replay a run's log and print its analysis."""
+    parser = argparse.ArgumentParser(
+        description="Replay and analyze the event log of a run.")
+    parser.add_argument("log", nargs="?",
+                        help="path of the log, the newest one by default")
+    parser.add_argument("--view", choices=sorted(VIEWS) + ["none"],
+                        default="full_progress",
+                        help="handler view to re-render")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="times faster than the run to replay, 0 to only "
+                             "draw its end")
+    parser.add_argument("--top", type=int, default=10,
+                        help="amount of most diverging tests to list")
+    parser.add_argument("--depth", type=int, default=1,
+                        help="depth of the suites to show timelines for")
+    args = parser.parse_args()
+
+    path = args.log or get_latest_log(get_log_directory())
+    if path is None:
+        parser.error("no event logs in {}".format(get_log_directory()))
+
+    header, records = read_event_log(path)
+    if args.view != "none":
+        Replayer(header, VIEWS[args.view], sys.stderr).replay(records,
+                                                              args.speed)
+
+    print("Run {} ({})".format(header["run"], path))
+    print("\nMost diverging tests:")
+    print("{:>9} {:>9} {:>9}  {}".format("expected", "actual", "diff",
+                                         "test"))
+    for name, expected, actual in get_divergences(header, records,
+                                                  args.top):
+        print("{:>8.1f}s {:>8.1f}s {:>+8.1f}s  {}".format(
+            expected, actual, actual - expected, name))
+
+    print("\nSuites' timeline:")
+    print(format_timeline(get_timelines(header, records, args.depth)))
+
+
+if __name__ == '__main__':
+    main()
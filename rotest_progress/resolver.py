@@ -0,0 +1,120 @@
+"""Background resolution of the tests' statistics during the run."""
+from __future__ import absolute_import
+
+import threading
+
+from .engine import clock
+from .config import get_setting
+from .utils import StatisticManager
+
+
+class StatisticsResolver(threading.Thread):
+    """Thread that resolves the statistics of the run's tests.
+
+    The tests start running right away, and the pending leaves are resolved
+    in their running order, in chunks that grow from FIRST_CHUNK_SIZE up to
+    MAX_CHUNK_SIZE, so the first tests get their estimates quickly. Each
+    chunk is handed to the engine to resize the bars.
+    Once the deadline passes all the leaves that are still pending are
+    marked as having no statistics, and late results are ignored, so a slow
+    or hung server never holds the run or its bars.
+
+    Attributes:
+        engine (ProgressEngine): engine of the run's bars.
+        deadline (number): seconds to wait for the statistics.
+        duration (number): seconds it took to resolve all the statistics,
+            None if they weren't resolved (yet).
+    """
+    DEADLINE = get_setting("STATISTICS_DEADLINE", 10.0, float)
+    FIRST_CHUNK_SIZE = 20
+    MAX_CHUNK_SIZE = 1000
+    JOIN_TIMEOUT = 1.0  # Seconds
+    LOCK = threading.Lock()
+
+    def __init__(self, engine, deadline=None):
+        super(StatisticsResolver, self).__init__()
+        self.setDaemon(True)
+        self.engine = engine
+        self.deadline = self.DEADLINE if deadline is None else deadline
+        self.duration = None
+        self._timer = threading.Timer(self.deadline, self.expire)
+        self._timer.setDaemon(True)
+        self._expired = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start resolving, and the countdown to the deadline."""
+        self._timer.start()
+        super(StatisticsResolver, self).start()
+
+    def expire(self):
+        """Give up on the statistics that weren't resolved yet."""
+        with self._lock:
+            if self._expired.is_set():
+                return
+
+            self._expired.set()
+            state = self.engine.state
+            self.engine.set_estimates({index: None
+                                       for index in range(len(state))
+                                       if state.is_pending(index)})
+
+    def stop(self):
+        """Stop resolving, before the engine stops.
+
+        The engine gets no estimates once this returns, and the thread is
+        waited for up to JOIN_TIMEOUT seconds, since a hung server may
+        hold it.
+        """
+        with self._lock:
+            self._expired.set()
+
+        self._timer.cancel()
+        if self.is_alive():
+            self.join(self.JOIN_TIMEOUT)
+
+    def _resolve_chunk(self, indices):
+        """Resolve the statistics of the given leaves and resize their bars.
+        """
+        tests = self.engine.state.tests
+        # Resolvers of other handlers wait, then find the names cached
+        with self.LOCK:
+            names = StatisticManager.get_uncached(tests[index]
+                                                  for index in indices)
+            if names:
+                StatisticManager.resolve_statistics(names)
+
+        if self._expired.is_set():
+            return
+
+        expected_times = StatisticManager.get_estimates(
+            list(set(tests[index].data.name for index in indices)))
+
+        estimates = {}
+        for index in indices:
+            test = tests[index]
+            estimates[index] = expected_times[test.data.name]
+            test.logger.debug("%s avg time: %s", test.data.name,
+                              estimates[index])
+
+        with self._lock:
+            if not self._expired.is_set():
+                self.engine.set_estimates(estimates)
+
+    def run(self):
+        """Resolve the pending leaves chunk by chunk, in running order."""
+        started = clock()
+        state = self.engine.state
+        pending = [index for index in range(len(state))
+                   if state.is_pending(index)]
+
+        start = 0
+        chunk_size = self.FIRST_CHUNK_SIZE
+        while start < len(pending) and not self._expired.is_set():
+            self._resolve_chunk(pending[start:start + chunk_size])
+            start += chunk_size
+            chunk_size = min(chunk_size * 2, self.MAX_CHUNK_SIZE)
+
+        if not self._expired.is_set():
+            self._timer.cancel()
+            self.duration = clock() - started
@@ -0,0 +1,374 @@
+"""Shareable snapshots of the tests' statistics.
+
+A snapshot is resolved once (e.g. by a nightly CI job) and distributed to
+the machines running the tests, which look the tests up in it instead of
+querying the resource management server, see the 'snapshot' backend.
+
+Run with ``python -m rotest_progress.snapshot`` (or
+``rotest-progress-snapshot``) to:
+
+* export - resolve the statistics of the tests under the given paths and
+  write them to a snapshot.
+* import - copy a snapshot's averages into the local statistics cache.
+* show - print a snapshot's details, and the averages of the given tests.
+
+A snapshot file is a hash table that's looked up through mmap, so loading
+it costs nothing and each lookup reads a single slot or a few:
+
+* MAGIC, the format's VERSION, the metadata's length and the amount of
+  slots (HEADER).
+* The metadata, a JSON object with the time the snapshot was created, its
+  source and the amount of tests in it.
+* The slots (SLOT), a power of two of them, at least twice the tests: the
+  CRC32 of the test's name, the offset and length of the name and its
+  average duration. Empty slots have a zero length name, and collisions
+  are resolved by linear probing.
+* The names of the tests, encoded in UTF-8.
+"""
+# pylint: disable=broad-except,too-many-locals,too-many-instance-attributes
+from __future__ import absolute_import, print_function
+
+import sys
+import json
+import mmap
+import time
+import zlib
+import shutil
+import struct
+import argparse
+import tempfile
+
+from .config import get_setting
+from .metrics import replace_file
+from .cache import StatisticsCache
+
+
+MAGIC = b"RPSS"
+VERSION = 1
+HEADER = struct.Struct("<4sBII")
+SLOT = struct.Struct("<IIId")
+MAX_AGE = 7 * 24 * 60 * 60  # Seconds
+
+
+def hash_name(name):
+    """Return the hash of an encoded test name, stable between processes."""
+    return zlib.crc32(name) & 0xffffffff
+
+
+def write_snapshot(path, averages, source, created=None):
+    """Write the tests' averages to a snapshot file, atomically.
+
+    Args:
+        path (str): path of the snapshot.
+        averages (dict): map of test names to their average duration.
+        source (str): where the averages came from, e.g. the server's host.
+        created (number): time the averages were resolved, in seconds since
+            the epoch, now by default.
+    """
+    entries = [(name.encode("utf-8"), float(average))
+               for name, average in sorted(averages.items())
+               if name and average is not None]
+
+    size = 1
+    while size < 2 * len(entries):
+        size *= 2
+
+    slots = [None] * size
+    names = []
+    offset = 0
+    for name, average in entries:
+        name_hash = hash_name(name)
+        position = name_hash & (size - 1)
+        while slots[position] is not None:
+            position = (position + 1) & (size - 1)
+
+        slots[position] = SLOT.pack(name_hash, offset, len(name), average)
+        names.append(name)
+        offset += len(name)
+
+    metadata = json.dumps({
+        "created": time.time() if created is None else created,
+        "source": source,
+        "count": len(entries)}).encode("utf-8")
+
+    empty_slot = SLOT.pack(0, 0, 0, 0.0)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, VERSION, len(metadata), size))
+        snapshot_file.write(metadata)
+        snapshot_file.write(b"".join(slot or empty_slot for slot in slots))
+        snapshot_file.write(b"".join(names))
+
+    replace_file(temporary_path, path)
+
+
+class StatisticsSnapshot(object):
+    """Read only view of a snapshot file, looked up through mmap.
+
+    Attributes:
+        path (str): path of the snapshot.
+        created (number): time the snapshot was created, in seconds since
+            the epoch.
+        source (str): where the snapshot's averages came from.
+        count (number): amount of tests in the snapshot.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        try:
+            if len(self._map) < HEADER.size:
+                raise ValueError("{} isn't a snapshot".format(path))
+
+            magic, version, length, self._size = HEADER.unpack_from(self._map)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} isn't a snapshot of version {}".format(
+                    path, VERSION))
+
+            metadata = json.loads(
+                self._map[HEADER.size:HEADER.size + length].decode("utf-8"))
+            self._slots = HEADER.size + length
+            self._names = self._slots + self._size * SLOT.size
+            if len(self._map) < self._names:
+                raise ValueError("{} was cut short".format(path))
+
+        except Exception:
+            self._map.close()
+            raise
+
+        self.created = metadata["created"]
+        self.source = metadata.get("source")
+        self.count = metadata.get("count", 0)
+
+    def __len__(self):
+        return self.count
+
+    def get_age(self):
+        """Return the seconds since the snapshot was created."""
+        return time.time() - self.created
+
+    def get(self, name):
+        """Return the average duration of a test, None if it's missing."""
+        name = name.encode("utf-8")
+        name_hash = hash_name(name)
+        position = name_hash & (self._size - 1)
+        for _ in range(self._size):
+            slot_hash, offset, length, average = SLOT.unpack_from(
+                self._map, self._slots + position * SLOT.size)
+            if length == 0:
+                return None
+
+            start = self._names + offset
+            if slot_hash == name_hash and \
+                    self._map[start:start + length] == name:
+                return average
+
+            position = (position + 1) & (self._size - 1)
+
+        return None
+
+    def get_many(self, names):
+        """Return the averages of the given tests that are in the snapshot.
+        """
+        averages = {}
+        for name in names:
+            average = self.get(name)
+            if average is not None:
+                averages[name] = average
+
+        return averages
+
+    def items(self):
+        """Iterate over the names and averages of all the tests."""
+        for position in range(self._size):
+            _, offset, length, average = SLOT.unpack_from(
+                self._map, self._slots + position * SLOT.size)
+            if length:
+                start = self._names + offset
+                yield (self._map[start:start + length].decode("utf-8"),
+                       average)
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
+
+
+def open_snapshot(path, max_age=None, source=None):
+    """Open a snapshot, rejecting it if it's stale or from another source.
+
+    Args:
+        path (str): path of the snapshot.
+        max_age (number): most seconds since the snapshot was created, None
+            to use ``ROTEST_PROGRESS_SNAPSHOT_MAX_AGE`` (default is a week),
+            0 for no limit.
+        source (str): source the snapshot must come from, None to use
+            ``ROTEST_PROGRESS_SNAPSHOT_SOURCE`` (by default any source).
+
+    Returns:
+        StatisticsSnapshot: the snapshot.
+
+    Raises:
+        ValueError: if the file isn't a valid snapshot, or is rejected.
+        IOError: if the file can't be read.
+    """
+    if max_age is None:
+        max_age = get_setting("SNAPSHOT_MAX_AGE", MAX_AGE, float)
+
+    if source is None:
+        source = get_setting("SNAPSHOT_SOURCE", None)
+
+    snapshot = StatisticsSnapshot(path)
+    if 0 < max_age < snapshot.get_age():
+        snapshot.close()
+        raise ValueError("{} is stale, created {:.0f} seconds ago".format(
+            path, snapshot.get_age()))
+
+    if source is not None and snapshot.source != source:
+        snapshot.close()
+        raise ValueError("{} is from {!r} rather than {!r}".format(
+            path, snapshot.source, source))
+
+    return snapshot
+
+
+def export_snapshot(paths, output, source=None, backends=None):
+    """Resolve the statistics of the tests under the paths into a snapshot.
+
+    Args:
+        paths (list): paths to discover the tests under, as rotest does.
+        output (str): path of the snapshot to write.
+        source (str): source to record, the resource management server's
+            host by default.
+        backends (str): comma separated names of the backends to resolve
+            with, the configured ones by default, without 'snapshot'.
+
+    Returns:
+        dict: the exported averages by the tests' names.
+    """
+    # Importing rotest's modules sets up its database models
+    from rotest.core.suite import TestSuite
+    from rotest.common.config import RESOURCE_MANAGER_HOST
+    from rotest.cli.discover import discover_tests_under_paths
+    from rotest.management.client.manager import ClientResourceManager
+
+    from .utils import StatisticManager
+    from .backends import DEFAULT_BACKENDS, load_backends
+
+    if backends is None:
+        backends = ",".join(
+            name for name in get_setting("BACKENDS",
+                                         DEFAULT_BACKENDS).split(",")
+            if name.strip() != "snapshot")
+
+    class AlmightySuite(TestSuite):
+        components = list(discover_tests_under_paths(paths))
+
+    work_dir = tempfile.mkdtemp()
+    resource_manager = ClientResourceManager()
+    try:
+        main_test = AlmightySuite(base_work_dir=work_dir,
+                                  resource_manager=resource_manager)
+        StatisticManager.BACKENDS = load_backends(backends)
+        names = StatisticManager.collect_leaf_names(main_test)
+        StatisticManager.resolve_statistics(names)
+
+    finally:
+        if resource_manager.is_connected():
+            resource_manager.disconnect()
+
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    averages = {name: StatisticManager.STATISTICS_CACHE[name]
+                for name in names
+                if StatisticManager.STATISTICS_CACHE.get(name) is not None}
+    write_snapshot(output, averages,
+                   RESOURCE_MANAGER_HOST if source is None else source)
+    return averages
+
+
+def import_snapshot(path, cache=None):
+    """Copy a snapshot's averages into the local statistics cache.
+
+    The entries keep the snapshot's creation time, so they go stale
+    according to it.
+
+    Returns:
+        number: amount of imported averages.
+    """
+    snapshot = open_snapshot(path)
+    try:
+        averages = dict(snapshot.items())
+        (StatisticsCache() if cache is None else cache).store(
+            averages, timestamp=snapshot.created)
+
+    finally:
+        snapshot.close()
+
+    return len(averages)
+
+
+def main():
+    """Export, import or show a statistics snapshot."""
+    parser = argparse.ArgumentParser(
+        description="Share the tests' statistics between machines.")
+    commands = parser.add_subparsers(dest="command")
+
+    export_parser = commands.add_parser(
+        "export", help="resolve the statistics of tests into a snapshot")
+    export_parser.add_argument("paths", nargs="+",
+                               help="paths to discover the tests under")
+    export_parser.add_argument("-o", "--output", required=True,
+                               help="path of the snapshot to write")
+    export_parser.add_argument("--source",
+                               help="source to record, the server's host by "
+                                    "default")
+    export_parser.add_argument("--backends",
+                               help="comma separated backends to resolve "
+                                    "with, the configured ones by default")
+
+    import_parser = commands.add_parser(
+        "import", help="copy a snapshot into the local statistics cache")
+    import_parser.add_argument("snapshot", help="path of the snapshot")
+
+    show_parser = commands.add_parser("show", help="print a snapshot")
+    show_parser.add_argument("snapshot", help="path of the snapshot")
+    show_parser.add_argument("names", nargs="*",
+                             help="tests to print the averages of")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            averages = export_snapshot(args.paths, args.output, args.source,
+                                       args.backends)
+            print("Exported {} averages to {}".format(len(averages),
+                                                      args.output))
+
+        elif args.command == "import":
+            print("Imported {} averages into the cache".format(
+                import_snapshot(args.snapshot)))
+
+        elif args.command == "show":
+            snapshot = StatisticsSnapshot(args.snapshot)
+            print("{} averages from {}, created at {} ({:.0f} seconds "
+                  "ago)".format(len(snapshot), snapshot.source,
+                                time.strftime("%Y-%m-%d %H:%M:%S",
+                                              time.localtime(
+                                                  snapshot.created)),
+                                snapshot.get_age()))
+            for name in args.names:
+                print("{}: {}".format(name, snapshot.get(name)))
+
+            snapshot.close()
+
+        else:
+            parser.error("a command is required")
+
+    except (IOError, OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
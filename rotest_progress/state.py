@@ -0,0 +1,363 @@
+"""Compact progress state of all the tests in a run."""
+# pylint: disable=too-many-instance-attributes
+from __future__ import absolute_import
+
+from array import array
+
+from rotest.core.models.case_data import TestOutcome
+
+from .config import get_setting
+
+
+class ProgressState(object):
+    """Progress of all the tests of a run, flattened into parallel arrays.
+
+    The tree is flattened in pre-order, so the subtree of the node at index
+    i occupies the indices from i up to (not including) ends[i]. Aggregates
+    over subtrees are updated as tests finish, so reading them is O(1).
+
+    Bars are measured in tenths of seconds (see UNITS_PER_SECOND). The
+    weight of a leaf is its expected duration, or DEFAULT_EXPECTED_TIME if
+    it has no statistics, and the weight of a complex test is the sum of its
+    sub tests' weights, so a suite's bar shows how much of its expected time
+    has passed rather than how many of its tests have finished.
+
+    The statistics arrive while the tests run (see 'set_estimate'), until
+    then the leaves are pending and weigh DEFAULT_EXPECTED_TIME. Leaves that
+    are known to be skipped (see 'skip') weigh nothing.
+
+    Attributes:
+        tests (list): the test instances, by index.
+        parents (array): index of each node's parent, NO_PARENT for the root.
+        depths (array): depth of each node, relative to the root.
+        ends (array): end index of each node's subtree.
+        positions (array): 1-based position of each node among its siblings.
+        child_counts (array): amount of direct sub tests of each node.
+        child_starts (array): where the sub tests of each node begin in
+            child_indices.
+        child_indices (array): indices of the direct sub tests of all the
+            nodes, grouped by their parent.
+        expected (array): expected duration of each leaf in seconds,
+            NO_ESTIMATE if it has no statistics.
+        resolved (array): whether the statistics of each leaf were looked
+            for already.
+        weights (array): seconds each node is expected to take.
+        progress (array): seconds of each node's weight that were done.
+        elapsed (array): seconds each test has been running.
+        totals (array): length of each node's bar.
+        values (array): current position of each node's bar.
+        states (array): PENDING, RUNNING or FINISHED.
+        outcomes (array): TestOutcome of each finished node, or NO_OUTCOME.
+        overruns (array): whether each leaf ran far longer than expected,
+            see Watchdog.
+        finished_children (array): amount of finished direct sub tests.
+        leaf_counts (array): amount of leaves in each subtree.
+        finished_leaves (array): amount of finished leaves in each subtree.
+        actual_times (array): total duration of the finished leaves that
+            had statistics and weren't skipped, in each subtree.
+        estimated_times (array): total expected duration of those leaves.
+        workers (number): most leaves seen running at the same time, e.g.
+            when rotest runs the tests in several processes.
+    """
+    PENDING, RUNNING, FINISHED = range(3)
+    NO_PARENT = -1
+    NO_ESTIMATE = -1.0
+    NO_OUTCOME = -1
+    UNITS_PER_SECOND = 10
+    DEFAULT_EXPECTED_TIME = get_setting("DEFAULT_TIME", 1.0, float)
+
+    def __init__(self, main_test):
+        self.tests = []
+        self.parents = array('l')
+        self.depths = array('H')
+        self.ends = array('l')
+        self.positions = array('l')
+        self.child_counts = array('l')
+        self.expected = array('d')
+        self.resolved = array('b')
+        self._indices = {}
+        self._flatten(main_test)
+
+        size = len(self.tests)
+        self.child_starts = array('l', [0]) * size
+        self.child_indices = array('l', [0]) * max(size - 1, 0)
+        self._index_children()
+
+        self.elapsed = array('d', [0.0]) * size
+        self.values = array('l', [0]) * size
+        self.states = array('b', [self.PENDING]) * size
+        self.outcomes = array('b', [self.NO_OUTCOME]) * size
+        self.overruns = array('b', [False]) * size
+        self.finished_children = array('l', [0]) * size
+        self.finished_leaves = array('l', [0]) * size
+        self.leaf_counts = array('l', [0]) * size
+        self.weights = array('d', [0.0]) * size
+        self.progress = array('d', [0.0]) * size
+        self.totals = array('l', [0]) * size
+        self._calculate_totals()
+
+        self.actual_times = array('d', [0.0]) * size
+        self.estimated_times = array('d', [0.0]) * size
+        self.workers = 1
+
+    def __len__(self):
+        return len(self.tests)
+
+    def _flatten(self, main_test):
+        """Fill the structure arrays by going over the tree in pre-order."""
+        stack = [(main_test, self.NO_PARENT, 1)]
+        while stack:
+            test, parent, position = stack.pop()
+            index = len(self.tests)
+            self._indices[test.identifier] = index
+            self.tests.append(test)
+            self.parents.append(parent)
+            self.depths.append(0 if parent == self.NO_PARENT else
+                               self.depths[parent] + 1)
+            self.ends.append(0)
+            self.positions.append(position)
+            if test.IS_COMPLEX:
+                sub_tests = list(test)
+                self.child_counts.append(len(sub_tests))
+                self.expected.append(self.NO_ESTIMATE)
+                self.resolved.append(True)
+                stack.append((None, index, 0))
+                stack.extend((sub_test, index, sub_position)
+                             for sub_position, sub_test
+                             in reversed(list(enumerate(sub_tests, 1))))
+
+            else:
+                self.child_counts.append(0)
+                self.expected.append(self.NO_ESTIMATE)
+                self.resolved.append(False)
+                self.ends[index] = index + 1
+
+            while stack and stack[-1][0] is None:
+                _, closed, _ = stack.pop()
+                self.ends[closed] = len(self.tests)
+
+    def _index_children(self):
+        """Group the indices of all the nodes by their parent."""
+        start = 0
+        for index, count in enumerate(self.child_counts):
+            self.child_starts[index] = start
+            start += count
+
+        cursors = array('l', self.child_starts)
+        for index in range(1, len(self.tests)):
+            parent = self.parents[index]
+            self.child_indices[cursors[parent]] = index
+            cursors[parent] += 1
+
+    def _calculate_totals(self):
+        """Set the weights and bars' lengths, and count the leaves."""
+        for index in reversed(range(len(self.tests))):
+            if not self.is_complex(index):
+                self.leaf_counts[index] += 1
+                self.weights[index] = self.expected[index] \
+                    if self.has_estimate(index) else self.DEFAULT_EXPECTED_TIME
+
+            self.totals[index] = max(
+                int(self.weights[index] * self.UNITS_PER_SECOND), 1)
+
+            parent = self.parents[index]
+            if parent != self.NO_PARENT:
+                self.leaf_counts[parent] += self.leaf_counts[index]
+                self.weights[parent] += self.weights[index]
+
+    def index_of(self, test):
+        """Return the index of the given test, None if it's not in the run."""
+        return self._indices.get(test.identifier)
+
+    def is_complex(self, index):
+        """Return whether the node at the index has sub tests."""
+        return self.tests[index].IS_COMPLEX
+
+    def has_estimate(self, index):
+        """Return whether the expected duration of the node is known."""
+        return self.expected[index] != self.NO_ESTIMATE
+
+    def is_pending(self, index):
+        """Return whether the statistics of the node are still looked for."""
+        return not self.resolved[index]
+
+    def children(self, index, start=0, end=None):
+        """Return the indices of the direct sub tests of a node.
+
+        Args:
+            index (number): index of the node.
+            start (number): position of the first sub test to return.
+            end (number): position to stop at, None for the last one.
+        """
+        first = self.child_starts[index]
+        count = self.child_counts[index]
+        end = count if end is None else min(end, count)
+        return self.child_indices[first + start:first + end]
+
+    def ancestors(self, index):
+        """Iterate over the indices of a node's ancestors, bottom up."""
+        parent = self.parents[index]
+        while parent != self.NO_PARENT:
+            yield parent
+            parent = self.parents[parent]
+
+    def start(self, index):
+        """Mark the node as running."""
+        self.states[index] = self.RUNNING
+
+    def _add_progress(self, index, delta):
+        """Add done seconds to a node and its ancestors and move their bars.
+
+        Returns:
+            list: indices of the nodes whose bars have moved.
+        """
+        moved = []
+        node = index
+        while node != self.NO_PARENT:
+            self.progress[node] += delta
+            if self.states[node] != self.FINISHED:
+                value = self._get_value(node)
+                if value != self.values[node]:
+                    self.values[node] = value
+                    moved.append(node)
+
+            node = self.parents[node]
+
+        return moved
+
+    def advance(self, index, elapsed):
+        """Set the elapsed time of a running leaf and move the bars.
+
+        Returns:
+            list: indices of the nodes whose bars have moved.
+        """
+        self.elapsed[index] = elapsed
+        delta = min(elapsed, self.weights[index]) - self.progress[index]
+        if delta <= 0:
+            return []
+
+        return self._add_progress(index, delta)
+
+    def finish(self, index, outcome):
+        """Mark the node as finished, fill its bar and update its ancestors.
+
+        Args:
+            index (number): index of the finished node.
+            outcome (number): TestOutcome of the node, None if unknown.
+
+        Returns:
+            list: indices of the ancestors whose bars have moved.
+        """
+        if self.states[index] == self.FINISHED:
+            return []
+
+        self.states[index] = self.FINISHED
+        self.outcomes[index] = self.NO_OUTCOME if outcome is None else outcome
+        self.values[index] = self.totals[index]
+        moved = self._add_progress(index,
+                                   self.weights[index] - self.progress[index])
+
+        parent = self.parents[index]
+        if parent != self.NO_PARENT:
+            self.finished_children[parent] += 1
+
+        if not self.is_complex(index):
+            measured = self.has_estimate(index) and \
+                self.elapsed[index] > 0 and outcome != TestOutcome.SKIPPED
+
+            for node in [index] + list(self.ancestors(index)):
+                self.finished_leaves[node] += 1
+                if measured:
+                    self.actual_times[node] += self.elapsed[index]
+                    self.estimated_times[node] += self.expected[index]
+
+        return moved
+
+    def _get_value(self, index):
+        """Return the position of a node's bar according to its progress."""
+        if self.states[index] == self.FINISHED:
+            return self.totals[index]
+
+        return min(int(self.progress[index] * self.UNITS_PER_SECOND),
+                   self.totals[index] - 1)
+
+    def set_estimate(self, index, expected):
+        """Set the expected duration of a pending leaf once it's resolved.
+
+        The weights, progress and bars of the leaf and its ancestors are
+        updated to the new duration.
+
+        Args:
+            index (number): index of the leaf.
+            expected (number): expected duration in seconds, None if the leaf
+                has no statistics.
+
+        Returns:
+            list: indices of the leaf and its ancestors, whose bars changed.
+        """
+        if self.resolved[index]:
+            return []
+
+        self.resolved[index] = True
+        if not expected:
+            return [index]
+
+        self.expected[index] = expected
+        return self._resize(index, expected)
+
+    def skip(self, index):
+        """Make a leaf that's about to be skipped weigh nothing.
+
+        The leaf is resolved, so its statistics are no longer looked for.
+
+        Returns:
+            list: indices of the leaf and its ancestors, whose bars changed.
+        """
+        if self.states[index] != self.PENDING or self.is_complex(index):
+            return []
+
+        self.resolved[index] = True
+        return self._resize(index, 0.0)
+
+    def _resize(self, index, weight):
+        """Set the weight of a leaf and update its ancestors and bars.
+
+        Returns:
+            list: indices of the leaf and its ancestors.
+        """
+        weight_delta = weight - self.weights[index]
+        progress_delta = -self.progress[index] + (
+            weight if self.states[index] == self.FINISHED else
+            min(self.elapsed[index], weight))
+
+        changed = [index]
+        changed.extend(self.ancestors(index))
+        for node in changed:
+            self.weights[node] += weight_delta
+            self.progress[node] += progress_delta
+            self.totals[node] = max(
+                int(self.weights[node] * self.UNITS_PER_SECOND), 1)
+            self.values[node] = self._get_value(node)
+
+        return changed
+
+    def get_remaining_time(self, index=0):
+        """Estimate the seconds left for a node, the whole run by default.
+
+        The expected time left is corrected by the ratio between the actual
+        and the expected durations of the node's tests that finished so far
+        (or of the whole run's, if none did). The run's time left is divided
+        between the workers running tests in parallel.
+        """
+        remaining = self.weights[index] - self.progress[index]
+        measured = index if self.estimated_times[index] > 0 else 0
+        if self.estimated_times[measured] > 0:
+            remaining *= self.actual_times[measured] / \
+                self.estimated_times[measured]
+
+        return max(remaining, 0) / (self.workers if index == 0 else 1)
+
+    def get_outcome(self, index):
+        """Return the TestOutcome of the node, None if it has none."""
+        outcome = self.outcomes[index]
+        return None if outcome == self.NO_OUTCOME else outcome
@@ -0,0 +1,54 @@
+"""Wrappers of the streams the handlers draw on."""
+from __future__ import absolute_import
+
+import time
+
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+class StreamProxy(object):
+    """Stream wrapper that reports every write and flush to a hook.
+
+    It compares equal to the wrapped stream, so tqdm still treats it as the
+    same terminal when other output is written.
+
+    Attributes:
+        stream (file): the wrapped stream.
+        on_write (function): called after every write with the written
+            string and the seconds it took, and after every flush with an
+            empty string.
+    """
+    def __init__(self, stream, on_write):
+        self.stream = stream
+        self.on_write = on_write
+
+    def write(self, string):
+        """Write to the stream and report it."""
+        start = clock()
+        try:
+            return self.stream.write(string)
+
+        finally:
+            self.on_write(string, clock() - start)
+
+    def flush(self):
+        """Flush the stream and report the time it took."""
+        start = clock()
+        try:
+            return self.stream.flush()
+
+        finally:
+            self.on_write("", clock() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __eq__(self, other):
+        return other is self or self.stream == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.stream)
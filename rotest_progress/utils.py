@@ -1,16 +1,21 @@
 """Utilities for rotest-progress bar."""
-# pylint: disable=bare-except,global-statement,protected-access
+# pylint: disable=broad-except
 from __future__ import absolute_import, print_function
 
-import sys
 import time
 import threading
 
 import tqdm
 import colorama
-import requests
+from rotest.common import core_log
+from rotest.core.flow import TestFlow
 from rotest.core.models.case_data import TestOutcome
 
+from .config import get_setting
+from .backends import load_backends
+from .history import DurationHistory
+from .metrics import METRICS
+
 
 OUTCOME_TO_COLOR = {None: colorama.Fore.WHITE,
                     TestOutcome.SUCCESS: colorama.Fore.GREEN,
@@ -20,33 +25,115 @@ OUTCOME_TO_COLOR = {None: colorama.Fore.WHITE,
                     TestOutcome.SKIPPED: colorama.Fore.YELLOW,
                     TestOutcome.UNEXPECTED_SUCCESS: colorama.Fore.CYAN}
 
+# Map test result to HTML color code, of the Tk and web bars
+OUTCOME_TO_STYLE = {None: 'white',
+                    TestOutcome.SUCCESS: 'green',
+                    TestOutcome.ERROR: 'maroon',
+                    TestOutcome.EXPECTED_FAILURE: 'FUCHSIA',
+                    TestOutcome.FAILED: 'red',
+                    TestOutcome.SKIPPED: 'yellow',
+                    TestOutcome.UNEXPECTED_SUCCESS: 'AQUA'}
+RUNNING_COLOR = 'red'
+
 
 CURRENT_FORMAT = "{l_bar}{bar}| {n:.0f}/{total:.0f} seconds{postfix}"
 UNKNOWN_FORMAT = "{l_bar}%%s{bar}%s| ? %%s{postfix}" % colorama.Fore.RESET
 FULL_FORMAT = "{l_bar}%%s{bar}%s| {n:.0f}/{total:.0f} %%s{postfix}" % \
                                                             colorama.Fore.RESET
+PENDING_FORMAT = "{desc}: {elapsed} waiting for statistics{postfix}"
 
 
 class DummyFile(object):
-    """Tqdm wrapper for a file descriptor."""
+    """Tqdm wrapper for a file descriptor.
+
+    Writing through tqdm clears and redraws all the bars, so the output is
+    buffered and written in batches of complete lines: when the buffer grows
+    over MAX_BUFFER_SIZE characters, or FLUSH_INTERVAL seconds after the
+    first buffered write. The handler writes the whole buffer on every test
+    boundary using 'flush_buffer'.
+    """
+    MAX_BUFFER_SIZE = get_setting("OUTPUT_BUFFER_SIZE", 8192, int)
+    FLUSH_INTERVAL = get_setting("OUTPUT_FLUSH_INTERVAL", 0.1, float)
+
     def __init__(self, stream):
         self.stream = stream
         self.encoding = stream.encoding
+        self._buffer = []
+        self._size = 0
+        self._timer = None
+        self._lock = threading.RLock()
 
     def write(self, string):
-        """Write using tqdm instead of the file."""
-        tqdm.tqdm.write(string, file=self.stream, end="")
+        """Buffer the string, to be written using tqdm with its batch."""
+        with self._lock:
+            self._buffer.append(string)
+            self._size += len(string)
+            if self._size >= self.MAX_BUFFER_SIZE:
+                self._write_batch()
+
+            elif self._timer is None:
+                self._start_timer()
+
+    def _start_timer(self):
+        """Write the buffered lines once the flush interval passes."""
+        self._timer = threading.Timer(self.FLUSH_INTERVAL, self._write_batch)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _write_batch(self, whole=False):
+        """Write the buffered output using tqdm in a single call.
+
+        Args:
+            whole (bool): whether to write a trailing incomplete line too,
+                otherwise it's kept for the next batch, unless it's all
+                that's buffered.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            text = "".join(self._buffer)
+            end = len(text) if whole else (text.rfind("\n") + 1 or len(text))
+            self._buffer = [text[end:]] if end < len(text) else []
+            self._size = len(text) - end
+            if self._buffer:
+                self._start_timer()
+
+            if end:
+                tqdm.tqdm.write(text[:end], file=self.stream, end="")
+
+    def flush_buffer(self):
+        """Write all the buffered output right away."""
+        self._write_batch(whole=True)
 
     def flush(self):
-        """Flush the stream."""
+        """Flush the stream.
+
+        Buffered output is left for its batch, since e.g. logging flushes
+        after every record.
+        """
         self.stream.flush()
 
 
 class StatisticManager(object):
-    """Class for managing test statistics."""
+    """Class for managing test statistics.
+
+    Attributes:
+        STATISTICS_CACHE (dict): averages of the resolved tests by their
+            names, None for tests without statistics.
+        BACKENDS (list): chain of StatisticsBackend to resolve with, loaded
+            on first use.
+        HISTORY (DurationHistory): durations observed by previous runs,
+            blended with the backends' averages.
+        FAILED_BACKENDS (set): names of the backends whose failure was
+            logged, so each is logged once.
+    """
 
-    NO_CONNECTION = False
     STATISTICS_CACHE = {}
+    BACKENDS = None
+    HISTORY = DurationHistory()
+    FAILED_BACKENDS = set()
 
     @classmethod
     def get_statistics(cls, test):
@@ -58,121 +145,221 @@ class StatisticManager(object):
         Returns:
             number: average duration of the test or None if couldn't get it.
         """
-        if not test.resource_manager or cls.NO_CONNECTION:
-            return None
+        names = cls.get_uncached([test])
+        if names:
+            cls.resolve_statistics(names)
+
+        return cls.STATISTICS_CACHE.get(test.data.name)
+
+    @classmethod
+    def get_uncached(cls, tests):
+        """Find the tests that aren't in the memory cache, counting them.
+
+        Args:
+            tests (iterable): the leaves to look up.
+
+        Returns:
+            dict: map of each unique uncached name to its resource manager.
+        """
+        names = {}
+        hits = misses = 0
+        for test in tests:
+            if test.data.name in cls.STATISTICS_CACHE:
+                hits += 1
+
+            else:
+                misses += 1
+                names.setdefault(test.data.name, test.resource_manager)
+
+        METRICS.increment("statistics_cache_total", hits, cache="memory",
+                          result="hit")
+        METRICS.increment("statistics_cache_total", misses, cache="memory",
+                          result="miss")
+        return names
+
+    @classmethod
+    def get_backends(cls):
+        """Return the chain of backends, loading it on first use."""
+        if cls.BACKENDS is None:
+            cls.BACKENDS = load_backends()
+
+        return cls.BACKENDS
+
+    @classmethod
+    def resolve_statistics(cls, names):
+        """Fill the memory cache with the statistics of the given tests.
+
+        Each backend is asked for the tests that the ones before it didn't
+        find, tests that none of them found are cached as None. A backend
+        that fails is skipped, and its first failure is logged.
+
+        Args:
+            names (dict): map of test names to their resource manager, None
+                if the test has none.
+        """
+        missing = dict(names)
+        for backend in cls.get_backends():  # pylint: disable=not-an-iterable
+            if not missing:
+                break
+
+            try:
+                found = backend.get_many(missing)
 
-        if test.data.name in cls.STATISTICS_CACHE:
-            return cls.STATISTICS_CACHE[test.data.name]
+            except Exception as error:
+                if backend.NAME not in cls.FAILED_BACKENDS:
+                    cls.FAILED_BACKENDS.add(backend.NAME)
+                    core_log.warning("The %r statistics backend failed, "
+                                     "falling back to the next ones: %s",
+                                     backend.NAME, error)
 
-        try:
-            stats = test.resource_manager.get_statistics(test.data.name)
-            cls.STATISTICS_CACHE[test.data.name] = stats['avg']
-            return stats['avg']
+                continue
 
-        except requests.exceptions.ConnectionError:
-            cls.NO_CONNECTION = True
-            return None
+            for name, average in found.items():
+                if name in missing:
+                    cls.STATISTICS_CACHE[name] = average
+                    del missing[name]
 
-        except:  # noqa
-            cls.STATISTICS_CACHE[test.data.name] = None
-            return None
+        for name in missing:
+            cls.STATISTICS_CACHE[name] = None
 
     @classmethod
-    def calculate_expected_time(cls, test):
-        """Query for the expected run time of the test and its components."""
-        print("Calculating tests average time...")
-        cls.recursive_calculate_time(test)
-        print("Done calculating!")
+    def get_estimates(cls, names):
+        """Return the expected durations of the given tests.
+
+        The resolved averages of the backends are blended with the durations
+        of the tests recorded by previous runs.
+
+        Args:
+            names (list): names of the tests.
+
+        Returns:
+            dict: map of the names to their expected duration in seconds,
+                None for tests without statistics.
+        """
+        history = cls.HISTORY.get_many(names)
+        return {name: cls.HISTORY.estimate(history.get(name),
+                                           cls.STATISTICS_CACHE.get(name))
+                for name in names}
 
     @classmethod
-    def recursive_calculate_time(cls, test):
-        """Recursively set the expected time field of the test and subtests."""
-        if hasattr(test, "_expected_time"):
-            return
-
-        if test.IS_COMPLEX:
-            test._expected_time = len(list(test))
-            for sub_test in test:
-                cls.recursive_calculate_time(sub_test)
-
-        else:
-            avg_time = cls.get_statistics(test)
-            if avg_time:
-                test.logger.debug("%s avg time: %s", test.data.name, avg_time)
-                test._expected_time = int(avg_time)
+    def collect_leaf_names(cls, test):
+        """Find the uncached leaves of the tree that can be queried.
+
+        Args:
+            test (AbstractTest): test or suite to go over.
+
+        Returns:
+            dict: map of each unique leaf name to its resource manager.
+        """
+        leaves = []
+        tests = [test]
+        while tests:
+            test = tests.pop()
+            if test.IS_COMPLEX:
+                tests.extend(test)
 
             else:
-                test.logger.debug("No statistics for %s", test.data.name)
-                test._expected_time = None
+                leaves.append(test)
+
+        return cls.get_uncached(leaves)
 
+    @classmethod
+    def prefetch_statistics(cls, test):
+        """Fill the statistics cache for all the leaves of the tree.
 
-def create_tree_bar(test):
-    """Create progress bar for a test in an hierarchical form."""
-    desc = test.parents_count * '| ' + test.data.name
-    unit_scale = False
-    if test.IS_COMPLEX:
-        total = test._expected_time
+        All the names are resolved at once, so the backends can look them up
+        in bulk.
 
-    else:
-        avg_time = test._expected_time
-        if avg_time:
-            total = int(avg_time) * 10
-            unit_scale = 0.1
+        Args:
+            test (AbstractTest): test or suite to fetch the statistics for.
+        """
+        names = cls.collect_leaf_names(test)
+        if names:
+            cls.resolve_statistics(names)
 
-        else:
-            total = 1
-            desc += " (No statistics)"
 
-    test.progress_bar = tqdm.trange(total, desc=desc, unit_scale=unit_scale,
-                                    position=test.identifier, leave=True,
-                                    bar_format=get_format(test,
-                                                          colorama.Fore.WHITE))
-    test.progress_bar.finish = False
-    test.progress_bar.start = False
-    return test.progress_bar
+def get_description(state, index):
+    """Return the name of a test, noting if it has no statistics."""
+    name = state.tests[index].data.name
+    if not (state.is_complex(index) or state.has_estimate(index) or
+            state.is_pending(index) or
+            state.get_outcome(index) == TestOutcome.SKIPPED):
 
+        name += " (No statistics)"
 
-def create_current_bar(test):
-    """Create progress bar for a test in a single line."""
-    index = 0
-    total_tests = 0
-    for sibling in test.parent:
-        total_tests += 1
+    if state.overruns[index]:
+        name += " (Overrun)"
+
+    return name
 
-        if sibling is test:
-            index = total_tests
 
-    desc = "({} / {} in parent) {}".format(index,
+def get_current_description(state, index):
+    """Return the description of a test's single line bar."""
+    parent = state.parents[index]
+    total_tests = 1 if parent == state.NO_PARENT else \
+        state.child_counts[parent]
+
+    return "({} / {} in parent) {}".format(state.positions[index],
                                            total_tests,
-                                           test.data.name)
+                                           get_description(state, index))
+
 
-    avg_time = test._expected_time
-    if avg_time:
-        total = int(avg_time)
+def get_current_format(state, index):
+    """Return the formatter of a test's single line bar."""
+    if state.is_pending(index):
+        return PENDING_FORMAT
 
-    else:
-        total = 1
-        desc += " (No statistics)"
+    return CURRENT_FORMAT
 
-    test.progress_bar = tqdm.trange(total*10, desc=desc, leave=False,
-                                    position=1, unit_scale=0.1,
-                                    bar_format=CURRENT_FORMAT)
-    test.progress_bar.finish = False
-    test.progress_bar.start = False
-    return test.progress_bar
 
+def create_current_bar(state, index, position=1, stream=None):
+    """Create progress bar for a test in a single line."""
+    return tqdm.trange(state.totals[index],
+                       desc=get_current_description(state, index),
+                       leave=False, position=position, file=stream,
+                       unit_scale=1.0 / state.UNITS_PER_SECOND,
+                       bar_format=get_current_format(state, index))
 
-def get_format(test, color):
+
+def get_format(state, index, color):
     """Return a bar formatter for a test in the given color."""
-    if test._expected_time is None:
-        return UNKNOWN_FORMAT % (color, 'seconds')
+    if state.is_pending(index):
+        return PENDING_FORMAT
 
-    if test.IS_COMPLEX:
-        return FULL_FORMAT % (color, 'tests')
+    if not (state.is_complex(index) or state.has_estimate(index)):
+        return UNKNOWN_FORMAT % (color, 'seconds')
 
     return FULL_FORMAT % (color, 'seconds')
 
 
+def format_finish_time(state):
+    """Return the predicted wall clock time of the run's end."""
+    return time.strftime("%H:%M:%S", time.localtime(
+        time.time() + state.get_remaining_time()))
+
+
+def format_eta(state):
+    """Return a short text of the time left for the whole run."""
+    return "run ETA {} (at {})".format(
+        tqdm.tqdm.format_interval(state.get_remaining_time()),
+        format_finish_time(state))
+
+
+def get_flow(state, index):
+    """Return the index of the flow a test is part of, None if it isn't."""
+    for ancestor in state.ancestors(index):
+        if isinstance(state.tests[ancestor], TestFlow):
+            return ancestor
+
+    return None
+
+
+def format_flow_eta(state, index):
+    """Return a short text of the time left for a running flow."""
+    return "flow ETA {}".format(
+        tqdm.tqdm.format_interval(state.get_remaining_time(index)))
+
+
 def get_test_outcome(test):
     """Safe get the test's current result."""
     if hasattr(test.data, 'exception_type'):
@@ -185,60 +372,3 @@ def get_test_outcome(test):
         return TestOutcome.FAILED
 
     return None
-
-
-def set_color(test):
-    """Change the color of the progress bar for the given test."""
-    color = OUTCOME_TO_COLOR[get_test_outcome(test)]
-    test.progress_bar.bar_format = get_format(test, color)
-
-
-def go_over_tests(test, use_color):
-    """Iterate over test and sub-tests.
-
-    Args:
-        test (AbstractTest): Test or suite to iterate over.
-        use_color (bool): whether to use colors in the progress bar.
-    """
-    if test.IS_COMPLEX:
-        for index, sub_test in zip(test.progress_bar, test):
-            go_over_tests(sub_test, use_color)
-            if use_color and index == len(list(test)) - 1:
-                set_color(test)
-
-    else:
-        for index in test.progress_bar:
-            if not test.progress_bar.finish:
-                time.sleep(0.1)
-                if index == test.progress_bar.total - 1:
-                    while not test.progress_bar.finish:
-                        time.sleep(0.2)
-
-                while not test.progress_bar.start or TRACER_EVENT.is_set():
-                    time.sleep(0.2)
-
-            if use_color and index == test.progress_bar.total - 1:
-                set_color(test)
-
-
-TRACER_EVENT = threading.Event()
-WRAPPED_SETTRACE = False
-
-
-def wrap_settrace():
-    """Wrap sys.settrace to apply or undo pause for the bars."""
-    global WRAPPED_SETTRACE
-    if not WRAPPED_SETTRACE:
-        WRAPPED_SETTRACE = True
-        old_settrace = sys.settrace
-
-        def event_on_trace(function):
-            """Wrapped settrace, sets or clears the pause flag for bars."""
-            if function is None:
-                TRACER_EVENT.clear()
-            else:
-                TRACER_EVENT.set()
-
-            old_settrace(function)
-
-        sys.settrace = event_on_trace
@@ -0,0 +1,220 @@
+"""Windowed rendering of a test tree that may be far bigger than the screen."""
+# pylint: disable=too-many-instance-attributes
+from __future__ import absolute_import
+
+import os
+import threading
+
+import tqdm
+import colorama
+from rotest.core.flow import TestFlow
+
+from .config import get_setting
+from .utils import (FULL_FORMAT, OUTCOME_TO_COLOR, get_format, format_eta,
+                    format_flow_eta, get_description)
+
+
+CURSOR_UP = "\x1b[{}A"
+CLEAR_LINE = "\x1b[K"
+CLEAR_DOWN = "\x1b[J"
+
+COLLAPSED_FORMAT = FULL_FORMAT % (colorama.Fore.WHITE, 'tests')
+
+
+def get_terminal_size(stream, default=(80, 24)):
+    """Return the columns and lines of the terminal behind the stream.
+
+    Ptys without a size (e.g. of CI runners or ``docker exec -t``) report
+    zero columns and lines, which are treated as unknown too.
+    """
+    try:
+        size = os.get_terminal_size(stream.fileno())
+
+    except (AttributeError, ValueError, OSError):
+        return default
+
+    if size.columns <= 0 or size.lines <= 0:
+        return default
+
+    return size.columns, size.lines
+
+
+class CollapsedRow(object):
+    """A row standing for a group of siblings that aren't drawn.
+
+    Attributes:
+        desc (str): description of the group.
+        finished (number): amount of finished tests in the group.
+        count (number): amount of tests in the group.
+    """
+    def __init__(self, desc, finished, count):
+        self.desc = desc
+        self.finished = finished
+        self.count = count
+
+    def format(self, columns):
+        """Return the text of the row."""
+        return tqdm.tqdm.format_meter(self.finished, self.count, 0,
+                                      ncols=columns, prefix=self.desc,
+                                      bar_format=COLLAPSED_FORMAT)
+
+
+class TreeViewport(object):
+    """Live region on the terminal showing a window of the test tree.
+
+    Only a screenful of rows is drawn, following the focused (most recently
+    started) test: the chain of its ancestors, its nearest siblings, and a
+    collapsed row summing up the siblings before and after them. Other tests
+    running at the same time (e.g. in other worker processes) are pinned
+    at the bottom.
+    The region is redrawn in place, so the cost of a redraw depends on the
+    size of the screen and not on the size of the tree.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        stream (file): terminal to draw on.
+        height (number): maximal amount of rows to draw.
+    """
+    def __init__(self, state, stream, height=None):
+        self.state = state
+        self.stream = stream
+        columns, lines = get_terminal_size(stream)
+        self.columns = max(columns - 1, 1)
+        self.height = get_setting("VIEWPORT_HEIGHT", lines - 1, int) \
+            if height is None else height
+
+        self.height = max(self.height, 3)
+
+        self.focus = 0
+        self.running = set()
+        self.visible = set()
+        self._rows = []
+        self._drawn_rows = 0
+        self._layout_changed = True
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def set_focus(self, index):
+        """Follow the test at the given index with the viewport."""
+        self.focus = index
+        self._layout_changed = True
+        self._dirty = True
+
+    def start_bar(self, index):
+        """Follow the starting test."""
+        if not self.state.is_complex(index):
+            self.running.add(index)
+
+        self.set_focus(index)
+
+    def update_bar(self, index):
+        """Note that the bar of the test has moved."""
+        if index in self.visible or index == 0:
+            self._dirty = True
+
+    def finish_bar(self, index):
+        """Note that the test has finished."""
+        if index in self.running:
+            self.running.discard(index)
+            if self.running:
+                self._layout_changed = True
+
+        self.update_bar(index)
+
+    def finish_run(self):
+        """Draw the top of the tree at the end of the run."""
+        self.set_focus(0)
+        self.redraw()
+
+    def _layout(self):
+        """Choose the rows to draw according to the focused test."""
+        state = self.state
+        rows = [self.focus]
+        rows.extend(state.ancestors(self.focus))
+        rows.reverse()
+        if state.is_complex(self.focus) or len(rows) == 1:  # Or a leaf root
+            parent = self.focus
+            position = 0
+
+        else:
+            rows.pop()
+            parent = rows[-1]
+            position = state.positions[self.focus] - 1
+
+        pinned = sorted(self.running.difference(rows))[:self.height // 2]
+        children = state.child_counts[parent]
+        window = max(self.height - len(rows) - len(pinned) - 2, 1)
+        start = max(0, min(position - window // 2, children - window))
+        end = min(children, start + window)
+        shown = state.children(parent, start, end)
+
+        others_finished = state.finished_children[parent] - \
+            sum(1 for child in shown if state.states[child] == state.FINISHED)
+        before_finished = min(start, others_finished)
+        indent = (state.depths[parent] + 1) * '| '
+        if start > 0:
+            rows.append(CollapsedRow(indent + "({} above)".format(start),
+                                     before_finished, start))
+
+        rows.extend(shown)
+        if end < children:
+            rows.append(CollapsedRow(
+                indent + "({} below)".format(children - end),
+                others_finished - before_finished, children - end))
+
+        rows.extend(index for index in pinned if index not in shown)
+        self._rows = rows[max(len(rows) - self.height, 0):]
+        self.visible = set(row for row in self._rows
+                           if not isinstance(row, CollapsedRow))
+
+    def _format_row(self, row):
+        """Return the text of a row."""
+        if isinstance(row, CollapsedRow):
+            return row.format(self.columns)
+
+        state = self.state
+        desc = state.depths[row] * '| ' + get_description(state, row)
+        color = colorama.Fore.WHITE
+        if state.states[row] == state.FINISHED:
+            color = OUTCOME_TO_COLOR[state.get_outcome(row)]
+
+        postfix = None
+        if row == 0:
+            postfix = format_eta(state)
+
+        elif state.states[row] == state.RUNNING and \
+                isinstance(state.tests[row], TestFlow):
+
+            postfix = format_flow_eta(state, row)
+
+        return tqdm.tqdm.format_meter(
+            state.values[row], state.totals[row], state.elapsed[row],
+            ncols=self.columns,
+            prefix=desc, unit_scale=1.0 / state.UNITS_PER_SECOND,
+            bar_format=get_format(state, row, color),
+            postfix=postfix)
+
+    def redraw(self, force=False):
+        """Draw the rows in place of the previously drawn ones if needed."""
+        with self._lock:
+            if not (self._dirty or force):
+                return
+
+            if self._layout_changed:
+                self._layout()
+                self._layout_changed = False
+
+            lines = []
+            if self._drawn_rows:
+                lines.append(CURSOR_UP.format(self._drawn_rows))
+
+            for row in self._rows:
+                lines.append("\r" + self._format_row(row) + CLEAR_LINE + "\n")
+
+            if len(self._rows) < self._drawn_rows:
+                lines.append(CLEAR_DOWN)
+
+            self.stream.write("".join(lines))
+            self.stream.flush()
+            self._drawn_rows = len(self._rows)
+            self._dirty = False
@@ -0,0 +1,108 @@
+"""Watchdog for tests that run far longer than expected."""
+# pylint: disable=broad-except
+from __future__ import absolute_import
+
+import sys
+import threading
+
+from .config import get_setting, get_flag
+
+try:
+    import faulthandler
+
+except ImportError:  # Python 2
+    faulthandler = None
+
+
+OVERRUN_CALLBACKS = []
+_NOTIFIED = set()
+_NOTIFIED_LOCK = threading.Lock()
+
+
+def on_overrun(callback):
+    """Register a function to call when a test overruns.
+
+    Meant for other result handlers, e.g. to abort or report hung tests.
+    The function is called from the progress engine's thread, once for each
+    overrunning test, with the test, its elapsed seconds and the seconds
+    it was expected to take. Can be used as a decorator.
+    """
+    OVERRUN_CALLBACKS.append(callback)
+    return callback
+
+
+class Watchdog(object):
+    """Flags running tests that pass a multiple of their expected time.
+
+    Tests without statistics are never flagged. An overrunning test is
+    flagged in the progress state, so the bars can show it, and the first
+    handler to notice it also logs a warning, optionally dumps the stacks of
+    all the threads using faulthandler, and calls the OVERRUN_CALLBACKS.
+    Note that the stacks are of the process running the handlers, so they
+    show the hung test only when the tests run in the same process.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        factor (number): multiple of the expected time to allow.
+        min_time (number): seconds to allow any test, so short tests aren't
+            flagged by small delays.
+        dump_stacks (bool): whether to dump the threads' stacks.
+    """
+    def __init__(self, state, factor=None, min_time=None, dump_stacks=None):
+        self.state = state
+        self.factor = get_setting("WATCHDOG_FACTOR", 3.0, float) \
+            if factor is None else factor
+        self.min_time = get_setting("WATCHDOG_MIN_TIME", 10.0, float) \
+            if min_time is None else min_time
+        self.dump_stacks = get_flag("WATCHDOG_DUMP_STACKS") \
+            if dump_stacks is None else dump_stacks
+
+    def get_limit(self, index):
+        """Return the seconds a leaf may run, None if it has no statistics.
+        """
+        if not self.state.has_estimate(index) or self.factor <= 0:
+            return None
+
+        return max(self.state.expected[index] * self.factor, self.min_time)
+
+    def check(self, index, elapsed):
+        """Flag the running leaf if it overran its limit.
+
+        Returns:
+            bool: whether the leaf was just flagged.
+        """
+        if self.state.overruns[index]:
+            return False
+
+        limit = self.get_limit(index)
+        if limit is None or elapsed <= limit:
+            return False
+
+        self.state.overruns[index] = True
+        test = self.state.tests[index]
+        with _NOTIFIED_LOCK:
+            if test.identifier in _NOTIFIED:
+                return True
+
+            _NOTIFIED.add(test.identifier)
+
+        self.notify(test, elapsed, self.state.expected[index])
+        return True
+
+    def notify(self, test, elapsed, expected):
+        """Warn about an overrunning test and call the callbacks."""
+        test.logger.warning("%s is running for %.1f seconds, it was "
+                            "expected to take %.1f seconds",
+                            test.data.name, elapsed, expected)
+
+        if self.dump_stacks and faulthandler is not None:
+            faulthandler.dump_traceback(file=sys.__stderr__,
+                                        all_threads=True)
+
+        for callback in OVERRUN_CALLBACKS:
+            try:
+                callback(test, elapsed, expected)
+
+            except Exception:
+                test.logger.exception("Overrun callback %r failed",
+                                      callback)
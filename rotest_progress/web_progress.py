@@ -0,0 +1,478 @@
+"""Module for the WebProgressHandler, serving the progress to browsers."""
+# pylint: disable=too-many-instance-attributes,import-error,invalid-name
+from __future__ import absolute_import
+
+import json
+import threading
+from collections import deque
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse
+
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse
+
+from rotest.common import core_log
+from rotest.core.result.handlers.abstract_handler import AbstractResultHandler
+
+from .state import ProgressState
+from .engine import ProgressEngine
+from .config import get_setting
+from .ordering import plan_run
+from .metrics import METRICS
+from .resolver import StatisticsResolver
+from .utils import (format_eta, get_description, OUTCOME_TO_STYLE,
+                    RUNNING_COLOR)
+
+
+PAGE = b"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>rotest progress</title>
+<style>
+body {font-family: monospace; margin: 1em;}
+.row {white-space: nowrap; line-height: 22px;}
+progress {width: 100px; margin-right: 6px; vertical-align: middle;}
+</style>
+</head>
+<body>
+<h3 id="eta">Connecting...</h3>
+<div id="tree"></div>
+<script>
+var tree, bars = [], labels = [];
+
+function apply(node) {
+    var bar = bars[node[0]];
+    if (node[5]) {
+        bar.removeAttribute("value");
+    } else {
+        bar.max = node[2];
+        bar.value = node[1];
+    }
+    bar.style.accentColor = node[3] == tree.finished ?
+        tree.styles[node[4]] : tree.running;
+}
+
+function update(data) {
+    data.nodes.forEach(apply);
+    for (var index in data.labels) {
+        labels[index].textContent = data.labels[index];
+    }
+    if (data.eta) {
+        document.getElementById("eta").textContent = data.eta;
+    }
+}
+
+fetch("tree").then(function(response) {
+    return response.json();
+}).then(function(data) {
+    tree = data;
+    var depths = [], rows = document.createDocumentFragment();
+    tree.names.forEach(function(name, index) {
+        var parent = tree.parents[index];
+        depths[index] = parent < 0 ? 0 : depths[parent] + 1;
+        var row = document.createElement("div");
+        row.className = "row";
+        row.style.paddingLeft = depths[index] * 16 + "px";
+        bars[index] = row.appendChild(document.createElement("progress"));
+        labels[index] = row.appendChild(document.createElement("span"));
+        labels[index].textContent = name;
+        rows.appendChild(row);
+    });
+    document.getElementById("tree").appendChild(rows);
+
+    var source = new EventSource("events");
+    ["snapshot", "delta"].forEach(function(event) {
+        source.addEventListener(event, function(message) {
+            update(JSON.parse(message.data));
+        });
+    });
+    source.addEventListener("end", function(message) {
+        update(JSON.parse(message.data));
+        source.close();
+    });
+});
+</script>
+</body>
+</html>
+"""
+
+
+class DashboardHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling every viewer in its own thread.
+
+    Attributes:
+        dashboard (Dashboard): the progress being served.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    dashboard = None
+
+
+class DashboardRequestHandler(BaseHTTPRequestHandler):
+    """Serves the page, the tree and the stream of the progress' changes."""
+    def do_GET(self):
+        """Serve the requested resource."""
+        path = urlparse(self.path).path.rstrip("/")
+        dashboard = self.server.dashboard
+        if path in ("", "/index.html"):
+            self.send_body(PAGE, "text/html; charset=utf-8")
+
+        elif path == "/tree":
+            self.send_body(dashboard.get_tree(), "application/json")
+
+        elif path == "/events":
+            self.stream_events(dashboard)
+
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        """Send a whole response."""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_events(self, dashboard):
+        """Send the changes of the progress as server-sent events.
+
+        A viewer that reconnects gets the events it missed, or a snapshot of
+        the whole progress if they're no longer kept.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            sent = int(self.headers.get("Last-Event-ID"))
+
+        except (TypeError, ValueError):
+            sent = None
+
+        with dashboard.viewers_lock:
+            dashboard.viewers += 1
+            METRICS.set_gauge("web_viewers", dashboard.viewers)
+
+        try:
+            finished = False
+            while not finished:
+                events, sent, finished = dashboard.wait_for_events(sent)
+                self.wfile.write(b"".join(events))
+                self.wfile.flush()
+
+        except (IOError, OSError):
+            pass  # The viewer went away
+
+        finally:
+            with dashboard.viewers_lock:
+                dashboard.viewers -= 1
+                METRICS.set_gauge("web_viewers", dashboard.viewers)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log the requests to rotest's log instead of stderr."""
+        core_log.debug("Dashboard: " + format, *args)
+
+
+def format_event(event, identifier, data):
+    """Return a server-sent event, with its data as JSON."""
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(
+        identifier, event,
+        json.dumps(data, separators=(",", ":"))).encode("utf-8")
+
+
+class Dashboard(object):
+    """Serves the progress of the run to browsers, over HTTP.
+
+    Also serves as the renderer of the progress engine. The engine only
+    marks the tests whose bars changed, and every frame (paced by the
+    refresh budget, like the other handlers) the changed nodes are encoded
+    once into a single server-sent event that's pushed to all the viewers.
+    The tree itself is only sent when a viewer loads the page, so each
+    viewer costs a socket write per frame, no matter how big the tree is.
+    The last HISTORY_SIZE events are kept, for viewers that reconnect.
+
+    Bars are colored like the Tk ones, by OUTCOME_TO_STYLE.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        host (str): interface to serve on.
+        port (number): port to serve on, 0 for any free port.
+        linger (number): seconds to keep serving after the run ends, so the
+            viewers that connect late still get its end.
+        server (DashboardHTTPServer): the server, None until it's started or
+            if it couldn't be.
+        sequence (number): identifier of the last event.
+        events (deque): the last events, as tuples of their identifier and
+            encoded text.
+        finished (bool): whether the run ended.
+        end_event (bytes): encoded event of the run's end, replayed to the
+            viewers that connect after it, None until the run ends.
+        viewers (number): amount of connected viewers.
+        labels (list): description of each test, as last sent.
+    """
+    HOST = get_setting("WEB_HOST", "127.0.0.1")
+    PORT = get_setting("WEB_PORT", 8765, int)
+    HISTORY_SIZE = 256
+    KEEPALIVE_INTERVAL = 15  # Seconds
+    LINGER = get_setting("WEB_LINGER", 60.0, float)
+
+    def __init__(self, state, host=None, port=None, linger=None):
+        self.state = state
+        self.host = self.HOST if host is None else host
+        self.port = self.PORT if port is None else port
+        self.linger = self.LINGER if linger is None else linger
+        self.server = None
+        self.sequence = 0
+        self.events = deque(maxlen=self.HISTORY_SIZE)
+        self.finished = False
+        self.end_event = None
+        self.viewers = 0
+        self.viewers_lock = threading.Lock()
+        self.labels = [state.tests[index].data.name
+                       for index in range(len(state))]
+        self._tree = None
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def start(self):
+        """Start serving in a background thread, log where to browse."""
+        try:
+            self.server = DashboardHTTPServer((self.host, self.port),
+                                              DashboardRequestHandler)
+
+        except (IOError, OSError) as error:
+            core_log.warning("Couldn't serve the progress on %s:%s: %s",
+                             self.host, self.port, error)
+            return
+
+        self.server.dashboard = self
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        core_log.info("Serving the progress on http://%s:%d/",
+                      self.host, self.server.server_address[1])
+
+    def get_tree(self):
+        """Return the structure of the tree as JSON, encoded once."""
+        if self._tree is None:
+            self._tree = json.dumps({
+                "names": [test.data.name for test in self.state.tests],
+                "parents": list(self.state.parents),
+                "styles": OUTCOME_TO_STYLE,
+                "running": RUNNING_COLOR,
+                "finished": ProgressState.FINISHED},
+                separators=(",", ":")).encode("utf-8")
+
+        return self._tree
+
+    def get_node(self, index):
+        """Return the state of a node's bar, as sent to the viewers."""
+        state = self.state
+        return [index, state.values[index], state.totals[index],
+                state.states[index], state.get_outcome(index),
+                int(state.is_pending(index) and
+                    state.states[index] != state.FINISHED)]
+
+    def get_changes(self, indices):
+        """Return the data of an event with the given nodes' changes."""
+        labels = {}
+        for index in indices:
+            label = get_description(self.state, index)
+            if label != self.labels[index]:
+                self.labels[index] = label
+                labels[index] = label
+
+        return {"nodes": [self.get_node(index) for index in indices],
+                "labels": labels,
+                "eta": format_eta(self.state)}
+
+    def get_snapshot(self):
+        """Return the snapshot event of all the nodes, for a new viewer.
+
+        The sequence is read before the state, so the changes that come
+        after the snapshot are sent in the following events.
+        """
+        with self._lock:
+            sequence = self.sequence
+
+        data = {"nodes": [self.get_node(index)
+                          for index in range(len(self.state))],
+                "labels": {index: label
+                           for index, label in enumerate(self.labels)
+                           if label != self.state.tests[index].data.name},
+                "eta": format_eta(self.state)}
+        return sequence, format_event("snapshot", sequence, data)
+
+    def publish(self, event, data):
+        """Add an event and wake the viewers to send it.
+
+        Returns:
+            bytes: the encoded event.
+        """
+        with self._condition:
+            self.sequence += 1
+            text = format_event(event, self.sequence, data)
+            self.events.append((self.sequence, text))
+            self._condition.notify_all()
+
+        METRICS.increment("written_bytes_total", len(text),
+                          handler=WebProgressHandler.NAME)
+        return text
+
+    def wait_for_events(self, sent):
+        """Wait for the events after the last one a viewer got.
+
+        Args:
+            sent (number): identifier of the last event the viewer got, None
+                for a new viewer.
+
+        Returns:
+            tuple: the encoded events to send (a keepalive comment if there
+                were none for a while), the identifier of the last of them
+                and whether the run ended.
+        """
+        events = []
+        with self._condition:
+            if sent is None or sent > self.sequence or (
+                    self.events and sent < self.events[0][0] - 1):
+
+                sent = None
+
+            elif sent == self.sequence and not self.finished:
+                self._condition.wait(self.KEEPALIVE_INTERVAL)
+
+            if sent is not None:
+                events = [text for identifier, text in self.events
+                          if identifier > sent]
+                sent = self.sequence
+
+            finished = self.finished
+
+        if sent is None:
+            sent, snapshot = self.get_snapshot()
+            events = [snapshot]
+            if finished:  # The viewer missed the end, when it was sent
+                events.append(self.end_event)
+
+        return events or [b": keepalive\n\n"], sent, finished
+
+    def start_bar(self, index):
+        """Mark the test's bar to be sent, to animate it if pending."""
+        self.update_bar(index)
+
+    def update_bar(self, index):
+        """Mark the test's bar to be sent with the next frame."""
+        with self._lock:
+            self._changed.add(index)
+
+    def finish_bar(self, index):
+        """Mark the finished test's bar to be filled and colored."""
+        self.update_bar(index)
+
+    def redraw(self):
+        """Push the nodes that changed since the previous frame."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+
+        if changed:
+            self.publish("delta", self.get_changes(sorted(changed)))
+
+    def stop(self):
+        """Stop serving."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def finish_run(self):
+        """Push the last changes and the end of the run.
+
+        The server keeps serving for 'linger' seconds, on a daemon thread,
+        so it stops sooner if the process exits.
+        """
+        with self._lock:
+            changed, self._changed = self._changed, set()
+
+        end_event = self.publish("end", self.get_changes(sorted(changed)))
+        with self._condition:
+            self.end_event = end_event
+            self.finished = True
+            self._condition.notify_all()
+
+        if self.server is not None:
+            timer = threading.Timer(self.linger, self.stop)
+            timer.setDaemon(True)
+            timer.start()
+
+
+class WebProgressHandler(AbstractResultHandler):
+    """WebProgressHandler interface.
+
+    Serves the progress on ``ROTEST_PROGRESS_WEB_HOST`` (default is
+    127.0.0.1) and ``ROTEST_PROGRESS_WEB_PORT`` (default is 8765), until
+    ``ROTEST_PROGRESS_WEB_LINGER`` seconds (default is 60) after the run
+    ends, or the process exits.
+
+    Attributes:
+        state (ProgressState): progress state of the run.
+        dashboard (Dashboard): serves the progress to browsers.
+        resolver (StatisticsResolver): resolver of the tests' statistics.
+    """
+    NAME = 'web_progress'
+    engine = None
+    state = None
+    resolver = None
+    dashboard = None
+
+    def start_test_run(self):
+        """Called once before any tests are executed."""
+        plan = plan_run(self.main_test)
+        self.state = ProgressState(self.main_test)
+        if plan is not None:
+            self.state.workers = plan.workers
+
+        self.dashboard = Dashboard(self.state)
+        self.dashboard.start()
+
+        self.engine = ProgressEngine(self.state, self.dashboard, self.NAME)
+        self.engine.start()
+        self.resolver = StatisticsResolver(self.engine)
+        self.resolver.start()
+
+    def start_test(self, test):
+        """Called when the given test is about to be run."""
+        self.engine.start_test(test)
+
+    def stop_test(self, test):
+        """Called when the given test has been run.
+
+        Args:
+            test (rotest.core.abstract_test.AbstractTest): test item instance.
+        """
+        self.engine.stop_test(test)
+
+    def stop_composite(self, test):
+        """Called when the given TestSuite has been run.
+
+        Args:
+            test (rotest.core.suite.TestSuite): test item instance.
+        """
+        return self.stop_test(test)
+
+    def stop_test_run(self):
+        """Called once after all tests are executed."""
+        if self.resolver:
+            self.resolver.stop()
+
+        if self.engine:
+            self.engine.stop()
+
+        METRICS.export()
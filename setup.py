@@ -16,7 +16,6 @@ setup(
     install_requires=[
         'rotest',
         'tqdm',
-        'tkscrolledframe',
     ],
     extras_require={
         "dev": [
@@ -28,11 +27,24 @@ setup(
     entry_points={
         "rotest.result_handlers": [
             "progress = "
-            "rotest_progress:CurrentProgressHandler",
+            "rotest_progress.lazy:LazyCurrentProgressHandler",
             "full_progress = "
-            "rotest_progress:FullProgressHandler",
+            "rotest_progress.lazy:LazyFullProgressHandler",
             "tk_progress = "
-            "rotest_progress:TkinterProgressHandler",
+            "rotest_progress.lazy:LazyTkinterProgressHandler",
+            "web_progress = "
+            "rotest_progress.lazy:LazyWebProgressHandler",
+        ],
+        "console_scripts": [
+            "rotest-progress-snapshot = rotest_progress.snapshot:main",
+        ],
+        "rotest_progress.backends": [
+            "server = "
+            "rotest_progress.backends:ResourceManagerBackend",
+            "file = rotest_progress.backends:FileBackend",
+            "snapshot = rotest_progress.backends:SnapshotBackend",
+            "sqlite = rotest_progress.backends:SqliteBackend",
+            "junit = rotest_progress.backends:JUnitBackend",
         ],
     },
     packages=['rotest_progress'],
@@ -0,0 +1,104 @@
+"""Tests of the engine that drives the bars of the running tests."""
+from __future__ import absolute_import
+
+import os
+import threading
+import unittest
+
+from benchmarks.fakes import build_tree
+from rotest_progress.state import ProgressState
+from rotest_progress.engine import ProgressEngine
+
+
+class SlowRenderer(object):
+    """Renderer whose redraws block until released, like a stuck console.
+
+    Attributes:
+        calls (list): the notifications, as pairs of the method's name and
+            the test's index.
+        drawing (threading.Event): set once a redraw started.
+        release (threading.Event): set to let the redraws end.
+        threads (set): the threads the renderer was called by.
+    """
+    def __init__(self):
+        self.calls = []
+        self.drawing = threading.Event()
+        self.release = threading.Event()
+        self.threads = set()
+
+    def _notify(self, name, index):
+        """Record a notification and the thread it was called by."""
+        self.threads.add(threading.current_thread())
+        self.calls.append((name, index))
+
+    def start_bar(self, index):
+        """Record the start of the test."""
+        self._notify("start", index)
+
+    def update_bar(self, index):
+        """Record the move of the test's bar."""
+        self._notify("update", index)
+
+    def finish_bar(self, index):
+        """Record the end of the test."""
+        self._notify("finish", index)
+
+    def redraw(self):
+        """Block until released."""
+        self.threads.add(threading.current_thread())
+        self.drawing.set()
+        self.release.wait()
+
+    def finish_run(self):
+        """Nothing to draw."""
+
+
+class TestRedraw(unittest.TestCase):
+    """Drawing the bars outside the hooks' lock."""
+    def setUp(self):
+        self.event_log = os.environ.get("ROTEST_PROGRESS_EVENT_LOG")
+        os.environ["ROTEST_PROGRESS_EVENT_LOG"] = "0"
+        self.main_test = build_tree(None, 2, 2)
+        self.state = ProgressState(self.main_test)
+        self.renderer = SlowRenderer()
+        self.engine = ProgressEngine(self.state, self.renderer)
+
+    def tearDown(self):
+        self.renderer.release.set()
+        self.engine.stop()
+        if self.event_log is None:
+            del os.environ["ROTEST_PROGRESS_EVENT_LOG"]
+
+        else:
+            os.environ["ROTEST_PROGRESS_EVENT_LOG"] = self.event_log
+
+    def test_slow_console(self):
+        """The hooks don't wait for a redraw to end."""
+        first, second = self.main_test.components
+        self.engine.start()
+        self.engine.start_test(first)
+        self.assertTrue(self.renderer.drawing.wait(5))
+
+        hooks = threading.Thread(target=lambda: (
+            self.engine.stop_test(first), self.engine.start_test(second)))
+        hooks.start()
+        hooks.join(5)
+        self.assertFalse(hooks.is_alive())
+
+        self.renderer.release.set()
+        self.engine.stop()
+        self.assertEqual(self.renderer.threads, {self.engine})
+        self.assertEqual([call for call in self.renderer.calls
+                          if call[0] != "update"],
+                         [("start", 1), ("finish", 1), ("start", 2)])
+
+    def test_not_started(self):
+        """The queued notifications are passed on when the engine stops."""
+        first = self.main_test.components[0]
+        self.engine.start_test(first)
+        self.engine.stop_test(first)
+        self.assertEqual(self.renderer.calls, [])
+        self.engine.stop()
+        self.assertEqual([call for call in self.renderer.calls
+                          if call[0] != "update"],
+                         [("start", 1), ("finish", 1)])
@@ -0,0 +1,166 @@
+"""Tests of the event logs of runs and their replay."""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rotest.core.models.case_data import TestOutcome
+
+from benchmarks.fakes import build_tree
+from rotest_progress.state import ProgressState
+from rotest_progress.replay import Replayer, get_divergences
+from rotest_progress.eventlog import (RECORD, RUN_START, RUN_STOP, START,
+                                      STOP, ESTIMATE, NO_OUTCOME, NO_VALUE,
+                                      FILE_SUFFIX, EventLog, open_event_log,
+                                      prune_logs, read_event_log)
+
+
+class NullRenderer(object):
+    """Renderer that draws nothing."""
+    def __init__(self, state, stream):
+        self.state = state
+        self.stream = stream
+
+    def start_bar(self, index):
+        """Nothing to draw."""
+
+    update_bar = finish_bar = start_bar
+
+    def redraw(self):
+        """Nothing to draw."""
+
+    finish_run = redraw
+
+
+class LogTestCase(unittest.TestCase):
+    """Test case with a directory for the logs."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = ProgressState(build_tree(None, 4, 2))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_log(self, name="run"):
+        """Write a log of a run whose first case passed after estimated.
+
+        Returns:
+            str: path of the log.
+        """
+        path = os.path.join(self.directory, name + FILE_SUFFIX)
+        event_log = EventLog(path, self.state)
+        event_log.write(ESTIMATE, 2, value=1.5)
+        event_log.write(ESTIMATE, 3, value=None)
+        event_log.write(START, 2)
+        event_log.write(STOP, 2, TestOutcome.SUCCESS, 2.5)
+        event_log.write(STOP, 3, None)
+        event_log.close()
+        return path
+
+
+class TestRoundTrip(LogTestCase):
+    """Reading the records back as they were written."""
+    def test_record_size(self):
+        """Each record takes 22 bytes."""
+        self.assertEqual(RECORD.size, 22)
+
+    def test_header(self):
+        """The header holds the flattened tree."""
+        header, _ = read_event_log(self.write_log())
+        self.assertEqual(header["tree"],
+                         [[self.state.parents[index],
+                           self.state.tests[index].data.name,
+                           self.state.is_complex(index)]
+                          for index in range(len(self.state))])
+
+    def test_records(self):
+        """Every type of record is read back with its fields."""
+        _, records = read_event_log(self.write_log())
+        self.assertEqual(
+            [record[1:] for record in records],
+            [(RUN_START, NO_OUTCOME, 0, NO_VALUE),
+             (ESTIMATE, NO_OUTCOME, 2, 1.5),
+             (ESTIMATE, NO_OUTCOME, 3, NO_VALUE),
+             (START, NO_OUTCOME, 2, NO_VALUE),
+             (STOP, TestOutcome.SUCCESS, 2, 2.5),
+             (STOP, NO_OUTCOME, 3, NO_VALUE),
+             (RUN_STOP, NO_OUTCOME, 0, NO_VALUE)])
+        times = [record[0] for record in records]
+        self.assertEqual(times, sorted(times))
+
+    def test_cut_short(self):
+        """A log cut in the middle of a record is read up to it."""
+        path = self.write_log()
+        with open(path, "rb+") as log_file:
+            log_file.truncate(os.path.getsize(path) - RECORD.size // 2)
+
+        _, records = read_event_log(path)
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[-1][1], STOP)
+
+    def test_not_a_log(self):
+        """Files that aren't event logs are rejected."""
+        path = os.path.join(self.directory, "other" + FILE_SUFFIX)
+        with open(path, "wb") as log_file:
+            log_file.write(b"RPSS" + b"\0" * 40)
+
+        self.assertRaises(ValueError, read_event_log, path)
+
+    def test_replay(self):
+        """Replaying the log rebuilds the run's state."""
+        header, records = read_event_log(self.write_log())
+        replayer = Replayer(header, NullRenderer, None)
+        replayer.replay(records)
+        self.assertEqual(replayer.state.get_outcome(2), TestOutcome.SUCCESS)
+        self.assertEqual(replayer.state.elapsed[2], 2.5)
+        self.assertEqual(replayer.state.expected[2], 1.5)
+        self.assertFalse(replayer.state.has_estimate(3))
+        self.assertEqual(get_divergences(header, records),
+                         [(self.state.tests[2].data.name, 1.5, 2.5)])
+
+
+class TestRetention(LogTestCase):
+    """Keeping only the newest logs."""
+    def setUp(self):
+        super(TestRetention, self).setUp()
+        self.environment = dict(os.environ)
+        os.environ["ROTEST_PROGRESS_EVENT_LOG_DIR"] = self.directory
+        os.environ["ROTEST_PROGRESS_EVENT_LOG_KEEP"] = "3"
+        os.environ.pop("ROTEST_PROGRESS_EVENT_LOG", None)
+
+        self.paths = []
+        for age in range(4, 0, -1):  # Oldest first
+            path = os.path.join(self.directory,
+                                "old{}{}".format(age, FILE_SUFFIX))
+            open(path, "wb").close()
+            os.utime(path, (1000000000 - age, 1000000000 - age))
+            self.paths.append(path)
+
+        self.other = os.path.join(self.directory, "notes.txt")
+        open(self.other, "wb").close()
+        os.utime(self.other, (0, 0))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environment)
+        super(TestRetention, self).tearDown()
+
+    def test_prune(self):
+        """The oldest logs are deleted, other files are kept."""
+        prune_logs(self.directory, 2)
+        self.assertEqual([os.path.exists(path) for path in self.paths],
+                         [False, False, True, True])
+        self.assertTrue(os.path.exists(self.other))
+
+    def test_open(self):
+        """Opening a run's log keeps it and the newest of the rest."""
+        event_log = open_event_log(self.state, "test")
+        self.assertIsNotNone(event_log)
+        event_log.close()
+
+        self.assertEqual([os.path.exists(path) for path in self.paths],
+                         [False, False, True, True])
+        self.assertTrue(os.path.exists(event_log.path))
+        self.assertIsNone(open_event_log(self.state, "other"))
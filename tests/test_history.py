@@ -0,0 +1,68 @@
+"""Tests of the local history of the tests' durations."""
+from __future__ import absolute_import
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from rotest_progress import history
+from rotest_progress.history import DurationHistory
+
+
+class TestDurationHistory(unittest.TestCase):
+    """Recording and flushing the observed durations."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = DurationHistory(
+            os.path.join(self.directory, DurationHistory.FILE_NAME))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_record_waits_for_flush(self):
+        """Recording never writes to the database by itself."""
+        for index in range(500):
+            self.history.record("test", 1.0, index)
+
+        self.assertFalse(os.path.exists(self.history.path))
+        self.history.flush()
+        self.assertEqual(len(self.history.get_many(["test"])["test"]),
+                         self.history.max_samples)
+
+    def test_repeated_names(self):
+        """Each run of a repeated test counts, once for all the handlers."""
+        for _ in range(2):  # Two handlers record the same tests
+            self.history.record("test", 1.0, 3)
+            self.history.record("test", 2.0, 7)
+
+        self.history.flush()
+        self.assertEqual(sorted(self.history.get_many(["test"])["test"]),
+                         [1.0, 2.0])
+
+    def test_order(self):
+        """Samples are kept and returned in the order they were recorded."""
+        self.history.max_samples = 3
+        for index in range(5):
+            self.history.record("test", float(index), index)
+
+        self.history.flush()
+        self.assertEqual(self.history.get_many(["test"])["test"],
+                         [2.0, 3.0, 4.0])
+
+    def test_order_same_time(self):
+        """Samples recorded at the same time keep their order."""
+        self.history.max_samples = 3
+        recorded = time.time
+        history.time.time = lambda: 1000.0
+        try:
+            for index in range(5):
+                self.history.record("test", float(index), index)
+
+        finally:
+            history.time.time = recorded
+
+        self.history.flush()
+        self.assertEqual(self.history.get_many(["test"])["test"],
+                         [2.0, 3.0, 4.0])
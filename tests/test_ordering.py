@@ -0,0 +1,77 @@
+"""Tests of the ordering of the run's tests."""
+from __future__ import absolute_import
+
+import time
+import threading
+import unittest
+
+from benchmarks.fakes import FakeTest, build_tree
+from rotest_progress.utils import StatisticManager
+from rotest_progress.ordering import (ORDER_LONGEST, ORDER_SHORTEST,
+                                      TestOrderer, order_components,
+                                      plan_run)
+
+
+class HungBackend(object):
+    """Backend whose server doesn't answer until it's released."""
+    NAME = "hung"
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def get_many(self, names):
+        """Wait for the release, then find every test."""
+        self.released.wait()
+        return {name: 1.0 for name in names}
+
+
+class TestPlanDeadline(unittest.TestCase):
+    """Planning a run whose statistics server hangs."""
+    def setUp(self):
+        self.backends = StatisticManager.BACKENDS
+        self.backend = HungBackend()
+        StatisticManager.BACKENDS = [self.backend]
+        StatisticManager.STATISTICS_CACHE.clear()
+
+    def tearDown(self):
+        self.backend.released.set()
+        StatisticManager.BACKENDS = self.backends
+        StatisticManager.STATISTICS_CACHE.clear()
+
+    def test_deadline(self):
+        """The plan waits for the statistics only up to the deadline."""
+        start = time.time()
+        plan = plan_run(build_tree(None, 6, 3), ORDER_LONGEST, 1,
+                        deadline=0.2)
+        self.assertLess(time.time() - start, 5)
+        self.assertIsNotNone(plan)
+
+
+def order(strategy, estimates, unresolved):
+    """Order leaves named by the estimates' keys, return their names."""
+    orderer = TestOrderer(strategy, estimates, unresolved)
+    components = [FakeTest(name, None) for name in sorted(estimates)]
+    sizes = {}
+    for test in components:
+        orderer.measure(test, sizes)
+
+    return [test.data.name for test in order_components(
+        components, {id(test): orderer.get_key(sizes[id(test)], position)
+                     for position, test in enumerate(components)})]
+
+
+class TestUnresolvedOrder(unittest.TestCase):
+    """Components without resolved statistics keep their order."""
+    def test_longest(self):
+        """Resolved tests are ordered longest first, the rest after them."""
+        self.assertEqual(
+            order(ORDER_LONGEST, {"a": None, "b": 1.0, "c": None,
+                                  "d": 5.0, "e": 3.0}, {"c", "a"}),
+            ["d", "e", "b", "a", "c"])
+
+    def test_shortest(self):
+        """Resolved tests are ordered shortest first, the rest after them."""
+        self.assertEqual(
+            order(ORDER_SHORTEST, {"a": None, "b": 4.0, "c": None,
+                                   "d": 5.0, "e": 3.0}, {"c", "a"}),
+            ["e", "b", "d", "a", "c"])
@@ -0,0 +1,65 @@
+"""Tests of the background resolution of the statistics."""
+# pylint: disable=protected-access
+from __future__ import absolute_import
+
+import unittest
+
+from benchmarks.fakes import build_tree
+from rotest_progress.state import ProgressState
+from rotest_progress.utils import StatisticManager
+from rotest_progress.resolver import StatisticsResolver
+
+from tests.test_ordering import HungBackend
+
+
+class RecordingEngine(object):
+    """Engine that keeps the estimates it gets."""
+    def __init__(self, state):
+        self.state = state
+        self.estimates = []
+
+    def set_estimates(self, estimates):
+        """Keep the estimates."""
+        self.estimates.append(estimates)
+
+
+class TestStop(unittest.TestCase):
+    """Stopping the resolver with the run."""
+    TIMEOUT = 10  # Seconds
+
+    def setUp(self):
+        self.backends = StatisticManager.BACKENDS
+        self.backend = HungBackend()
+        StatisticManager.BACKENDS = [self.backend]
+        StatisticManager.STATISTICS_CACHE.clear()
+        self.engine = RecordingEngine(ProgressState(build_tree(None, 4, 2)))
+
+    def tearDown(self):
+        self.backend.released.set()
+        StatisticManager.BACKENDS = self.backends
+        StatisticManager.STATISTICS_CACHE.clear()
+
+    def test_hung(self):
+        """Late results of a hung server are ignored once stopped."""
+        resolver = StatisticsResolver(self.engine, deadline=0.1)
+        resolver.start()
+        resolver.stop()
+        self.backend.released.set()
+        resolver.join(self.TIMEOUT)
+        self.assertFalse(resolver.is_alive())
+        self.assertEqual(self.engine.estimates, [])
+
+        self.assertTrue(resolver._timer.finished.is_set())
+        resolver.expire()
+        self.assertEqual(self.engine.estimates, [])
+
+    def test_resolved(self):
+        """Stopping after the statistics were resolved changes nothing."""
+        self.backend.released.set()
+        resolver = StatisticsResolver(self.engine, deadline=self.TIMEOUT)
+        resolver.start()
+        resolver.join(self.TIMEOUT)
+        resolver.stop()
+        self.assertEqual([set(estimates)
+                          for estimates in self.engine.estimates],
+                         [{2, 3, 5, 6}])
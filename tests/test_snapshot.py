@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Tests of the snapshots of the tests' statistics."""
+from __future__ import absolute_import
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from rotest_progress import snapshot
+from rotest_progress.cache import StatisticsCache
+from rotest_progress.snapshot import (HEADER, SLOT, StatisticsSnapshot,
+                                      import_snapshot, open_snapshot,
+                                      write_snapshot)
+
+
+AVERAGES = {u"Suite.Case{}".format(index): index + 0.5
+            for index in range(50)}
+AVERAGES[u"Suite.בדיקה"] = 7.25
+
+
+class SnapshotTestCase(unittest.TestCase):
+    """Test case with a directory for the snapshots."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "statistics.rpss")
+        self.snapshots = []
+
+    def tearDown(self):
+        for opened in self.snapshots:
+            opened.close()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open(self, **kwargs):
+        """Open the snapshot, to be closed by the end of the test."""
+        opened = open_snapshot(self.path, **kwargs)
+        self.snapshots.append(opened)
+        return opened
+
+
+class TestRoundTrip(SnapshotTestCase):
+    """Looking the written averages up."""
+    def test_lookup(self):
+        """Every average is found by its test's name."""
+        write_snapshot(self.path, AVERAGES, "server", created=1000.0)
+        opened = self.open(max_age=0)
+        self.assertEqual(len(opened), len(AVERAGES))
+        self.assertEqual(opened.source, "server")
+        self.assertEqual(opened.created, 1000.0)
+        for name, average in AVERAGES.items():
+            self.assertEqual(opened.get(name), average)
+
+        self.assertEqual(dict(opened.items()), AVERAGES)
+        self.assertEqual(opened.get_many([u"Suite.Case3", u"Missing"]),
+                         {u"Suite.Case3": 3.5})
+
+    def test_missing(self):
+        """Names that aren't in the snapshot aren't found."""
+        write_snapshot(self.path, AVERAGES, "server")
+        opened = self.open()
+        self.assertIsNone(opened.get(u"Suite.Case50"))
+        self.assertIsNone(opened.get(u""))
+
+    def test_skipped(self):
+        """Tests without averages aren't written."""
+        write_snapshot(self.path, {u"Case": None, u"": 1.0, u"Other": 2.0},
+                       "server")
+        self.assertEqual(dict(self.open().items()), {u"Other": 2.0})
+
+    def test_empty(self):
+        """A snapshot of no tests finds nothing."""
+        write_snapshot(self.path, {}, "server")
+        opened = self.open()
+        self.assertEqual(len(opened), 0)
+        self.assertIsNone(opened.get(u"Case"))
+
+    def test_import(self):
+        """Importing copies the averages into the cache, as of the export."""
+        created = time.time() - 60
+        write_snapshot(self.path, AVERAGES, "server", created=created)
+        cache = StatisticsCache(os.path.join(self.directory, "cache.sqlite"))
+        self.assertEqual(import_snapshot(self.path, cache), len(AVERAGES))
+        entries = cache.get_many(sorted(AVERAGES))
+        self.assertEqual({name: entry.average
+                          for name, entry in entries.items()}, AVERAGES)
+        self.assertAlmostEqual(entries[u"Suite.Case1"].timestamp, created)
+
+
+class TestCollisions(SnapshotTestCase):
+    """Names whose hashes fall on the same slot."""
+    def setUp(self):
+        super(TestCollisions, self).setUp()
+        self.hash_name = snapshot.hash_name
+        snapshot.hash_name = lambda name: 7
+
+    def tearDown(self):
+        snapshot.hash_name = self.hash_name
+        super(TestCollisions, self).tearDown()
+
+    def test_probing(self):
+        """Colliding names are probed for, past the end of the table."""
+        write_snapshot(self.path, AVERAGES, "server")
+        opened = self.open()
+        for name, average in AVERAGES.items():
+            self.assertEqual(opened.get(name), average)
+
+        self.assertIsNone(opened.get(u"Missing"))
+
+
+class TestCorruption(SnapshotTestCase):
+    """Files that aren't whole snapshots."""
+    def setUp(self):
+        super(TestCorruption, self).setUp()
+        write_snapshot(self.path, AVERAGES, "server")
+
+    def truncate(self, size):
+        """Cut the snapshot at the given size."""
+        with open(self.path, "rb+") as snapshot_file:
+            snapshot_file.truncate(size)
+
+    def test_cut_in_slots(self):
+        """A snapshot cut before its slots end is rejected."""
+        with open(self.path, "rb") as snapshot_file:
+            _, _, length, _ = HEADER.unpack(snapshot_file.read(HEADER.size))
+
+        self.truncate(HEADER.size + length + SLOT.size)
+        self.assertRaises(ValueError, StatisticsSnapshot, self.path)
+
+    def test_cut_in_header(self):
+        """A snapshot shorter than its header is rejected."""
+        self.truncate(HEADER.size - 1)
+        self.assertRaises(ValueError, StatisticsSnapshot, self.path)
+
+    def test_empty(self):
+        """An empty file is rejected."""
+        self.truncate(0)
+        self.assertRaises(ValueError, StatisticsSnapshot, self.path)
+
+    def test_other_format(self):
+        """Files of another format or version are rejected."""
+        with open(self.path, "rb+") as snapshot_file:
+            snapshot_file.write(b"RPEL")
+
+        self.assertRaises(ValueError, StatisticsSnapshot, self.path)
+
+    def test_bad_metadata(self):
+        """A snapshot whose metadata isn't JSON is rejected."""
+        with open(self.path, "rb+") as snapshot_file:
+            snapshot_file.seek(HEADER.size)
+            snapshot_file.write(b"}")
+
+        self.assertRaises(ValueError, StatisticsSnapshot, self.path)
+
+    def test_stale(self):
+        """Old snapshots, or of other sources, are rejected."""
+        write_snapshot(self.path, AVERAGES, "server",
+                       created=time.time() - 100)
+        self.assertRaises(ValueError, open_snapshot, self.path, max_age=10)
+        self.assertRaises(ValueError, open_snapshot, self.path, max_age=0,
+                          source="other")
+        self.assertEqual(len(self.open(max_age=1000, source="server")),
+                         len(AVERAGES))
@@ -0,0 +1,247 @@
+"""Tests of the flattened progress state of a run."""
+# pylint: disable=protected-access
+from __future__ import absolute_import
+
+import os
+import unittest
+
+from rotest.core.models.case_data import TestOutcome
+from rotest.core.flow_component import MODE_CRITICAL, MODE_FINALLY
+
+from benchmarks.fakes import FakeSuite, FakeTest
+from rotest_progress.state import ProgressState
+from rotest_progress.engine import ProgressEngine
+
+
+class NullRenderer(object):
+    """Renderer that draws nothing."""
+    def start_bar(self, index):
+        """Nothing to draw."""
+
+    update_bar = finish_bar = start_bar
+
+    def redraw(self):
+        """Nothing to draw."""
+
+    finish_run = redraw
+
+
+def build_run():
+    """Build a suite of a suite, a flow and a case.
+
+    Returns:
+        FakeSuite: the main test, whose nodes in pre-order are the main
+            suite (0), a suite (1) with two cases (2, 3), a flow (4) with two
+            critical blocks (5, 6) and a finally block (7), and a case (8).
+    """
+    # Test flows are unittest cases, so they're kept out of the module, where
+    # the tests loader would find them
+    from rotest.core.flow import TestFlow
+
+    class FakeFlow(FakeSuite, TestFlow):
+        """Minimal stand-in for a rotest test flow."""
+
+    main_test = FakeSuite("Main", None)
+    suite = FakeSuite("Suite", None, main_test)
+    suite.components = [FakeTest("Suite.Case1", None, suite),
+                        FakeTest("Suite.Case2", None, suite)]
+
+    flow = FakeFlow("Flow", None, main_test)
+    flow.components = [FakeTest("Flow.Block1", None, flow),
+                       FakeTest("Flow.Block2", None, flow),
+                       FakeTest("Flow.Cleanup", None, flow)]
+    for block, mode in zip(flow.components,
+                           (MODE_CRITICAL, MODE_CRITICAL, MODE_FINALLY)):
+        block.mode = mode
+
+    main_test.components = [suite, flow, FakeTest("Case", None, main_test)]
+    return main_test
+
+
+class TestStructure(unittest.TestCase):
+    """Flattening a nested tree in pre-order."""
+    def setUp(self):
+        self.main_test = build_run()
+        self.state = ProgressState(self.main_test)
+
+    def test_indices(self):
+        """The nodes are indexed in pre-order, with their parents."""
+        self.assertEqual(len(self.state), 9)
+        self.assertEqual([test.data.name for test in self.state.tests],
+                         ["Main", "Suite", "Suite.Case1", "Suite.Case2",
+                          "Flow", "Flow.Block1", "Flow.Block2",
+                          "Flow.Cleanup", "Case"])
+        self.assertEqual(list(self.state.parents),
+                         [-1, 0, 1, 1, 0, 4, 4, 4, 0])
+        self.assertEqual(list(self.state.depths), [0, 1, 2, 2, 1, 2, 2, 2, 1])
+        self.assertEqual(list(self.state.positions),
+                         [1, 1, 1, 2, 2, 1, 2, 3, 3])
+        self.assertEqual(self.state.index_of(self.main_test.components[1]),
+                         4)
+
+    def test_ends(self):
+        """Each node's subtree ends where its next sibling starts."""
+        self.assertEqual(list(self.state.ends), [9, 4, 3, 4, 8, 6, 7, 8, 9])
+        self.assertEqual(list(self.state.leaf_counts),
+                         [6, 2, 1, 1, 3, 1, 1, 1, 1])
+
+    def test_children(self):
+        """The direct sub tests of each node are grouped together."""
+        self.assertEqual(list(self.state.children(0)), [1, 4, 8])
+        self.assertEqual(list(self.state.children(4)), [5, 6, 7])
+        self.assertEqual(list(self.state.children(4, start=1)), [6, 7])
+        self.assertEqual(list(self.state.children(4, 0, 2)), [5, 6])
+        self.assertEqual(list(self.state.children(2)), [])
+        self.assertEqual(list(self.state.ancestors(6)), [4, 0])
+
+    def test_weights(self):
+        """Pending leaves weigh the default time, suites their sum."""
+        default = ProgressState.DEFAULT_EXPECTED_TIME
+        self.assertEqual(self.state.weights[0], 6 * default)
+        self.assertEqual(self.state.weights[4], 3 * default)
+        self.assertTrue(self.state.is_pending(2))
+        self.assertFalse(self.state.is_pending(1))
+
+
+class TestEstimates(unittest.TestCase):
+    """Resizing the bars of leaves once their statistics are resolved."""
+    def setUp(self):
+        self.state = ProgressState(build_run())
+        self.default = ProgressState.DEFAULT_EXPECTED_TIME
+
+    def test_pending(self):
+        """A pending leaf and its ancestors take the new duration."""
+        self.assertEqual(self.state.set_estimate(2, 3.0), [2, 1, 0])
+        self.assertEqual(self.state.weights[2], 3.0)
+        self.assertEqual(self.state.weights[1], 3.0 + self.default)
+        self.assertEqual(self.state.weights[0], 3.0 + 5 * self.default)
+        self.assertEqual(self.state.totals[2], 30)
+        self.assertFalse(self.state.is_pending(2))
+        self.assertEqual(self.state.set_estimate(2, 5.0), [])
+
+    def test_no_statistics(self):
+        """A leaf without statistics keeps the default weight."""
+        self.assertEqual(self.state.set_estimate(2, None), [2])
+        self.assertFalse(self.state.has_estimate(2))
+        self.assertEqual(self.state.weights[2], self.default)
+
+    def test_running(self):
+        """A running leaf keeps the time it ran, up to the new duration."""
+        self.state.start(2)
+        self.state.advance(2, 0.5)
+        self.state.set_estimate(2, 2.0)
+        self.assertEqual(self.state.progress[2], 0.5)
+        self.assertEqual(self.state.progress[0], 0.5)
+        self.assertEqual(self.state.values[2], 5)
+        self.assertEqual(self.state.totals[2], 20)
+
+    def test_running_over(self):
+        """A leaf that ran longer than its new duration isn't full yet."""
+        self.state.start(2)
+        self.state.advance(2, 0.8)
+        self.state.set_estimate(2, 0.5)
+        self.assertEqual(self.state.progress[2], 0.5)
+        self.assertEqual(self.state.values[2], self.state.totals[2] - 1)
+
+    def test_finished(self):
+        """A finished leaf stays full, with its ancestors' progress."""
+        self.state.start(2)
+        self.state.advance(2, 0.5)
+        self.state.finish(2, TestOutcome.SUCCESS)
+        self.state.set_estimate(2, 3.0)
+        self.assertEqual(self.state.progress[2], 3.0)
+        self.assertEqual(self.state.values[2], self.state.totals[2])
+        self.assertEqual(self.state.progress[1], 3.0)
+        self.assertEqual(self.state.weights[1], 3.0 + self.default)
+        self.assertEqual(self.state.values[1], 30)
+
+
+class TestSkip(unittest.TestCase):
+    """Skipping the blocks after a failing one."""
+    def setUp(self):
+        self.event_log = os.environ.get("ROTEST_PROGRESS_EVENT_LOG")
+        os.environ["ROTEST_PROGRESS_EVENT_LOG"] = "0"
+        self.state = ProgressState(build_run())
+        self.engine = ProgressEngine(self.state, NullRenderer())
+
+    def tearDown(self):
+        if self.event_log is None:
+            del os.environ["ROTEST_PROGRESS_EVENT_LOG"]
+
+        else:
+            os.environ["ROTEST_PROGRESS_EVENT_LOG"] = self.event_log
+
+    def test_skip_following(self):
+        """The critical blocks stop weighing, the finally block is kept."""
+        default = ProgressState.DEFAULT_EXPECTED_TIME
+        self.state.start(5)
+        self.state.finish(5, TestOutcome.FAILED)
+        changed = self.engine._skip_following(5)
+        self.assertEqual(changed, {6, 4, 0})
+        self.assertEqual(self.state.weights[6], 0)
+        self.assertEqual(self.state.weights[7], default)
+        self.assertEqual(self.state.weights[4], 2 * default)
+        self.assertEqual(self.state.weights[0], 5 * default)
+        self.assertFalse(self.state.is_pending(6))
+        self.assertTrue(self.state.is_pending(7))
+
+    def test_skip_started(self):
+        """Only pending leaves are skipped."""
+        self.state.start(2)
+        self.assertEqual(self.state.skip(2), [])
+        self.assertEqual(self.state.skip(1), [])
+
+    def test_suite(self):
+        """The components of suites aren't skipped."""
+        self.state.start(2)
+        self.state.finish(2, TestOutcome.FAILED)
+        self.assertEqual(self.engine._skip_following(2), set())
+
+
+class TestRemainingTime(unittest.TestCase):
+    """Estimating the time left, by the durations of the finished tests."""
+    def setUp(self):
+        self.state = ProgressState(build_run())
+        for index in range(len(self.state)):
+            if not self.state.is_complex(index):
+                self.state.set_estimate(index, 2.0)
+
+    def run_leaf(self, index, elapsed, outcome=TestOutcome.SUCCESS):
+        """Run a leaf for the given seconds."""
+        self.state.start(index)
+        self.state.advance(index, elapsed)
+        self.state.finish(index, outcome)
+
+    def test_expected(self):
+        """Before any test finishes, the expected time is left."""
+        self.assertEqual(self.state.get_remaining_time(), 12.0)
+        self.assertEqual(self.state.get_remaining_time(4), 6.0)
+
+    def test_ratio(self):
+        """The time left is scaled by the finished tests' ratio."""
+        self.run_leaf(2, 4.0)
+        self.assertEqual(self.state.actual_times[0], 4.0)
+        self.assertEqual(self.state.estimated_times[0], 2.0)
+        self.assertEqual(self.state.get_remaining_time(), 20.0)
+        self.assertEqual(self.state.get_remaining_time(1), 4.0)
+
+    def test_node_ratio(self):
+        """A node's own finished tests decide its ratio, else the run's."""
+        self.run_leaf(2, 4.0)
+        self.run_leaf(5, 1.0)
+        self.assertEqual(self.state.get_remaining_time(4), 2.0)
+        self.assertEqual(self.state.get_remaining_time(8),
+                         2.0 * 5.0 / 4.0)
+
+    def test_skipped(self):
+        """Skipped tests don't count in the ratio."""
+        self.run_leaf(2, 0.1, TestOutcome.SKIPPED)
+        self.assertEqual(self.state.estimated_times[0], 0)
+        self.assertEqual(self.state.get_remaining_time(), 10.0)
+
+    def test_workers(self):
+        """Only the run's time left is divided between the workers."""
+        self.run_leaf(2, 4.0)
+        self.state.workers = 2
+        self.assertEqual(self.state.get_remaining_time(), 10.0)
+        self.assertEqual(self.state.get_remaining_time(1), 4.0)
@@ -0,0 +1,195 @@
+"""Tests of the output batching and the statistics resolution."""
+from __future__ import absolute_import
+
+import time
+import logging
+import unittest
+
+import tqdm
+from rotest.common import core_log
+
+from benchmarks.fakes import build_tree
+from rotest_progress.metrics import METRICS
+from rotest_progress.utils import DummyFile, StatisticManager
+
+
+class FakeStream(object):
+    """Stream that keeps what's written to it."""
+    encoding = "utf-8"
+
+    def __init__(self):
+        self.written = []
+        self.flushes = 0
+
+    def write(self, text):
+        """Keep the written text."""
+        self.written.append(text)
+
+    def flush(self):
+        """Count the flushes."""
+        self.flushes += 1
+
+
+class TestDummyFile(unittest.TestCase):
+    """Batching the output written between the bars."""
+    TIMEOUT = 5  # Seconds
+
+    def setUp(self):
+        self.writes = []
+        self.write = tqdm.tqdm.write
+        tqdm.tqdm.write = self.tqdm_write
+        self.stream = FakeStream()
+        self.output = DummyFile(self.stream)
+        self.output.MAX_BUFFER_SIZE = 20
+        self.output.FLUSH_INTERVAL = 60
+
+    def tearDown(self):
+        self.output.flush_buffer()
+        tqdm.tqdm.write = self.write
+
+    def tqdm_write(self, text, file=None, end="\n"):
+        """Keep the text written through tqdm."""
+        self.assertIs(file, self.stream)
+        self.writes.append(text + end)
+
+    def wait_for_writes(self, count):
+        """Wait for the given amount of writes through tqdm."""
+        deadline = time.time() + self.TIMEOUT
+        while len(self.writes) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_buffered(self):
+        """Output under the size is kept until the flush interval."""
+        self.output.write("first\n")
+        self.output.write("second\n")
+        self.assertEqual(self.writes, [])
+
+    def test_size(self):
+        """Output over the size is written in a batch of whole lines."""
+        self.output.write("first line\n")
+        self.output.write("second line\nthird")
+        self.assertEqual(self.writes, ["first line\nsecond line\n"])
+
+        self.output.write(" line\n")
+        self.output.flush_buffer()
+        self.assertEqual(self.writes[1:], ["third line\n"])
+
+    def test_timer(self):
+        """Buffered output is written once the flush interval passes."""
+        self.output.FLUSH_INTERVAL = 0.01
+        self.output.write("first\nsecond")
+        self.wait_for_writes(2)
+        self.assertEqual(self.writes, ["first\n", "second"])
+
+    def test_partial_line(self):
+        """A trailing incomplete line waits for the next batch."""
+        self.output.write("a whole line\nand a ")
+        self.output.write("partial one")
+        self.assertEqual(self.writes, ["a whole line\n"])
+
+        self.output.write(" completed\n")
+        self.output.flush_buffer()
+        self.assertEqual(self.writes[1:], ["and a partial one completed\n"])
+
+    def test_flush_buffer(self):
+        """Flushing the buffer writes it all, even an incomplete line."""
+        self.output.write("line\nincomplete")
+        self.output.flush_buffer()
+        self.assertEqual(self.writes, ["line\nincomplete"])
+        self.output.flush_buffer()
+        self.assertEqual(len(self.writes), 1)
+
+    def test_flush(self):
+        """Flushing only flushes the stream, the buffer waits."""
+        self.output.write("line\n")
+        self.output.flush()
+        self.assertEqual(self.writes, [])
+        self.assertEqual(self.stream.flushes, 1)
+
+
+class FailingBackend(object):
+    """Backend whose server is down."""
+    NAME = "failing"
+    ERROR = IOError("connection refused")
+
+    def get_many(self, names):
+        """Fail to get the averages."""
+        raise self.ERROR
+
+
+class FoundBackend(object):
+    """Backend that finds every test."""
+    NAME = "found"
+    AVERAGE = 1.0
+
+    def get_many(self, names):
+        """Return an average for every test."""
+        return {name: self.AVERAGE for name in names}
+
+
+class RecordingHandler(logging.Handler):
+    """Logging handler that keeps the records."""
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)  # Classic on py2
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestResolveStatistics(unittest.TestCase):
+    """Falling back from failing backends."""
+    def setUp(self):
+        self.backends = StatisticManager.BACKENDS
+        StatisticManager.BACKENDS = [FailingBackend(), FoundBackend()]
+        StatisticManager.FAILED_BACKENDS.clear()
+        StatisticManager.STATISTICS_CACHE.clear()
+        self.logs = RecordingHandler()
+        core_log.addHandler(self.logs)
+
+    def tearDown(self):
+        core_log.removeHandler(self.logs)
+        StatisticManager.BACKENDS = self.backends
+        StatisticManager.FAILED_BACKENDS.clear()
+        StatisticManager.STATISTICS_CACHE.clear()
+
+    def test_failure_logged_once(self):
+        """The failure is logged once, and the next backend is used."""
+        StatisticManager.resolve_statistics({"first": None})
+        StatisticManager.resolve_statistics({"second": None})
+
+        self.assertEqual(len(self.logs.records), 1)
+        self.assertIn("'failing'", self.logs.records[0].getMessage())
+        self.assertEqual(StatisticManager.STATISTICS_CACHE,
+                         {"first": 1.0, "second": 1.0})
+
+
+class TestMemoryCacheMetrics(unittest.TestCase):
+    """Counting the lookups of the memory cache."""
+    HIT = ("statistics_cache_total", (("cache", "memory"), ("result", "hit")))
+    MISS = ("statistics_cache_total", (("cache", "memory"),
+                                       ("result", "miss")))
+
+    def setUp(self):
+        self.backends = StatisticManager.BACKENDS
+        StatisticManager.BACKENDS = [FoundBackend()]
+        StatisticManager.STATISTICS_CACHE.clear()
+        self.directory, self.counters = METRICS.directory, METRICS.counters
+        METRICS.directory, METRICS.counters = "metrics", {}
+
+    def tearDown(self):
+        METRICS.directory, METRICS.counters = self.directory, self.counters
+        StatisticManager.BACKENDS = self.backends
+        StatisticManager.STATISTICS_CACHE.clear()
+
+    def test_collect(self):
+        """Collecting a tree's leaves counts the cached ones as hits."""
+        tree = build_tree(None, 4, 2)
+        names = StatisticManager.collect_leaf_names(tree)
+        self.assertEqual(len(names), 4)
+        self.assertEqual(METRICS.counters[self.MISS], 4)
+
+        StatisticManager.resolve_statistics(names)
+        self.assertEqual(StatisticManager.collect_leaf_names(tree), {})
+        self.assertEqual(METRICS.counters[self.HIT], 4)
+        self.assertEqual(METRICS.counters[self.MISS], 4)
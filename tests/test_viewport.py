@@ -0,0 +1,95 @@
+"""Tests of the tree viewport's terminal handling."""
+from __future__ import absolute_import
+
+import threading
+import unittest
+from collections import namedtuple
+
+from rotest_progress import viewport
+from rotest_progress.state import ProgressState
+from rotest_progress.viewport import TreeViewport, get_terminal_size
+
+from benchmarks.fakes import FakeTest, build_tree
+
+
+TerminalSize = namedtuple("TerminalSize", ("columns", "lines"))
+
+
+class SizelessOs(object):
+    """Stand-in for the os module, on a terminal whose size is 0x0."""
+    @staticmethod
+    def get_terminal_size(_):
+        """Return the size of a pty without one, like on CI runners."""
+        return TerminalSize(0, 0)
+
+
+class Terminal(object):
+    """Stream that keeps what's written to it."""
+    def __init__(self, descriptor=1):
+        self.descriptor = descriptor
+        self.written = []
+
+    def fileno(self):
+        """Return the descriptor of the terminal."""
+        return self.descriptor
+
+    def write(self, text):
+        """Keep the written text."""
+        self.written.append(text)
+
+    def flush(self):
+        """Nothing to flush."""
+        pass
+
+    def getvalue(self):
+        """Return all the written text."""
+        return "".join(self.written)
+
+
+class TestSizelessTerminal(unittest.TestCase):
+    """A terminal without a size is drawn with the default size."""
+    REDRAW_TIMEOUT = 10  # Seconds
+
+    def setUp(self):
+        self.stream = Terminal()
+        self.os = viewport.os
+        viewport.os = SizelessOs()
+
+    def tearDown(self):
+        viewport.os = self.os
+
+    def test_default_size(self):
+        """The 0x0 size of the terminal is treated as unknown."""
+        self.assertEqual(get_terminal_size(self.stream), (80, 24))
+
+    def test_redraw(self):
+        """Redrawing the viewport on the terminal doesn't hang."""
+        state = ProgressState(build_tree(None, 20, 5))
+        tree_viewport = TreeViewport(state, self.stream)
+        self.assertGreater(tree_viewport.columns, 0)
+
+        tree_viewport.start_bar(1)
+        thread = threading.Thread(target=tree_viewport.redraw)
+        thread.daemon = True
+        thread.start()
+        thread.join(self.REDRAW_TIMEOUT)
+        self.assertFalse(thread.is_alive(), "Redrawing the viewport hung")
+        self.assertTrue(self.stream.getvalue())
+
+
+class TestSingleCase(unittest.TestCase):
+    """A run of a single case, whose main test is a leaf."""
+    def test_redraw(self):
+        """The case is drawn alone."""
+        stream = Terminal()
+        tree_viewport = TreeViewport(ProgressState(FakeTest("Case", None)),
+                                     stream)
+        tree_viewport.start_bar(0)
+        tree_viewport.redraw()
+        tree_viewport.finish_bar(0)
+        tree_viewport.finish_run()
+        self.assertIn("Case", stream.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""Tests of the web dashboard's events."""
+from __future__ import absolute_import
+
+import unittest
+
+try:
+    from http.client import HTTPConnection
+
+except ImportError:  # Python 2
+    from httplib import HTTPConnection
+
+from benchmarks.fakes import build_tree
+from rotest_progress.state import ProgressState
+from rotest_progress.web_progress import Dashboard
+
+
+class TestFinishedDashboard(unittest.TestCase):
+    """Viewers that connect once the run ended."""
+    def setUp(self):
+        self.dashboard = Dashboard(ProgressState(build_tree(None, 20, 5)),
+                                   host="127.0.0.1", port=0)
+        self.dashboard.start()
+        self.dashboard.finish_run()
+
+    def tearDown(self):
+        self.dashboard.stop()
+
+    def test_end_replayed(self):
+        """A new viewer gets the snapshot and the end, then stops."""
+        events, sent, finished = self.dashboard.wait_for_events(None)
+        self.assertTrue(finished)
+        self.assertEqual(sent, self.dashboard.sequence)
+        self.assertEqual(len(events), 2)
+        self.assertIn(b"\nevent: snapshot\n", events[0])
+        self.assertIn(b"\nevent: end\n", events[1])
+
+    def test_late_viewer(self):
+        """The server still serves the end to a viewer after the run."""
+        connection = HTTPConnection(
+            "127.0.0.1", self.dashboard.server.server_address[1], timeout=10)
+        try:
+            connection.request("GET", "/events")
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            body = response.read()
+
+        finally:
+            connection.close()
+
+        self.assertIn(b"\nevent: snapshot\n", body)
+        self.assertTrue(body.split(b"\n\n")[-2].startswith(b"id: "))
+        self.assertIn(b"\nevent: end\n", body.split(b"\n\n")[-2])